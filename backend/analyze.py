@@ -0,0 +1,269 @@
+# analyze.py
+'''
+Batch re-analysis of stored games.
+
+Games are streamed from binary game logs (see gamelog.py) or old text history
+directories and replayed. Every position is searched by alphaBetaAI to a fixed
+depth in a process pool, and one JSON line per move is written with the score of
+every column, the score of the move that was played and a blunder flag.
+
+Positions are deduplicated across games (transpositions are searched once),
+and progress is checkpointed after each batch of games, so an interrupted run
+picks up where it stopped when started again with the same arguments.
+
+Example:
+    python analyze.py -inputs history/games.c4log -out analysis.jsonl -depth 6 -workers 8
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from connect4 import connect4, parse_moves, format_moves, board_from_moves
+from shapes import DEFAULT_CONNECT
+from players import connect4Player, alphaBetaAI
+import gamelog
+
+def build_env(moves, board_shape=(6,7), connect=DEFAULT_CONNECT):
+    '''
+    Create a headless connect4 instance with the given moves (player 1 first) already played
+    '''
+    env = connect4(connect4Player(1), connect4Player(2), board_shape=board_shape, connect=connect)
+    for move in moves:
+        if not env.play_move(move):
+            raise ValueError(f"Illegal move {move} in sequence {list(moves)}")
+    return env
+
+def position_key(moves, board_shape=(6,7), connect=DEFAULT_CONNECT):
+    '''
+    Key identifying a position regardless of the move order that reached it.
+    The side to move follows from the piece count, so the board alone is enough
+    '''
+    board, _ = board_from_moves(moves, board_shape)
+    return board_shape, connect, board.tobytes()
+
+def analyze_position(job):
+    '''
+    Pool worker: search one position and return (key, {column: score}).
+    Scores are from the point of view of the player to move
+    '''
+    key, moves, board_shape, connect, depth = job
+    env = build_env(moves, board_shape, connect)
+    agent = alphaBetaAI(env.turnPlayer.position)
+    return key, agent.score_moves(env, depth)
+
+def build_env_from_board(board):
+    '''
+    Create a headless connect4 instance from a board array (rows of 0/1/2, top row first).
+    The side to move follows from the piece count. The order the pieces were played in
+    is unknown, so history only holds the right columns per player.
+    Raises ValueError for boards that cannot come from a legal game
+    '''
+    board = np.array(board).astype('int32')
+    if board.ndim != 2 or board.shape[0] < 1 or board.shape[1] < 1:
+        raise ValueError("Board must be a 2D list of rows")
+    if not np.isin(board, (0, 1, 2)).all():
+        raise ValueError("Board cells must be 0, 1 or 2")
+
+    p1 = int((board == 1).sum())
+    p2 = int((board == 2).sum())
+    if p1 - p2 not in (0, 1):
+        raise ValueError("Player 1 moves first, so it must have as many pieces as player 2 or one more")
+
+    env = connect4(connect4Player(1), connect4Player(2), board_shape=board.shape)
+    for col in range(board.shape[1]):
+        filled = board[:, col] != 0
+        height = int(filled.sum())
+        if height and not filled[board.shape[0]-height:].all():
+            raise ValueError(f"Column {col} has a piece floating above an empty cell")
+        env.topPosition[col] = board.shape[0] - 1 - height
+        for row in range(board.shape[0]-1, board.shape[0]-1-height, -1):
+            env.history[board[row][col]-1].append(col)
+    env.board = board
+    if p1 != p2:
+        env.turnPlayer = env.player2
+    return env
+
+def search_position(job):
+    '''
+    Pool worker for interactive analysis: iteratively deepen on one board until the
+    depth or the time limit is reached. Returns (key, {column: score}, depth reached),
+    with scores from the point of view of the player to move
+    '''
+    key, board, depth, time_limit = job
+    env = build_env_from_board(board)
+    agent = alphaBetaAI(env.turnPlayer.position)
+    start = time.time()
+    scores, reached = {}, 0
+    for d in range(1, depth + 1):
+        try:
+            scores = agent.score_moves(env, d, time_limit - (time.time() - start))
+            reached = d
+        except TimeoutError:
+            break
+    if not scores:
+        # Not even depth 1 finished, it is cheap enough to always complete
+        scores, reached = agent.score_moves(env, 1), 1
+    return key, scores, reached
+
+def iter_sources(inputs, board_shape=(6,7)):
+    '''
+    Stream GameRecords from a mix of game logs and old text history directories
+    '''
+    for source in inputs:
+        if os.path.isdir(source):
+            yield from gamelog.iter_text_history(source, board_shape)
+        else:
+            yield from gamelog.iter_games(source)
+
+def check_record(record):
+    '''
+    The reason a stored game can't be analyzed (a move off the board or into a full
+    column), or None when every move is legal
+    '''
+    try:
+        board_from_moves(record.moves, record.board_shape)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def move_records(index, record, cache, blunder_threshold):
+    '''
+    Build the per-move output lines for one game from the cached scores
+    '''
+    lines = []
+    for ply, move in enumerate(record.moves):
+        scores = cache.get(position_key(record.moves[:ply], record.board_shape, record.connect))
+        if not scores:
+            continue
+        best_move = max(scores, key=scores.get)
+        played_score = scores.get(move)
+        loss = scores[best_move] - played_score if played_score is not None else None
+        lines.append({
+            'index': index,
+            'game': record.game,
+            'ply': ply,
+            'player': ply % 2 + 1,
+            'position': format_moves(record.moves[:ply]),
+            'board_shape': list(record.board_shape),
+            'connect': record.connect,
+            'move': move,
+            'played_score': played_score,
+            'best_move': best_move,
+            'best_score': scores[best_move],
+            'scores': {str(col): score for col, score in scores.items()},
+            'loss': loss,
+            'blunder': loss is not None and loss >= blunder_threshold,
+        })
+    return lines
+
+def load_checkpoint(checkpoint_path, out_path):
+    '''
+    Read the checkpoint and restore the position cache from the output written so far.
+    Output lines past the checkpoint (a batch that was being written when the run
+    stopped) are dropped so they are not duplicated when the batch is redone
+    '''
+    cache = {}
+    games_done = 0
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            games_done = json.load(f)['games_done']
+
+    if os.path.exists(out_path):
+        kept = []
+        with open(out_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry['index'] >= games_done:
+                    continue
+                kept.append(line if line.endswith('\n') else line + '\n')
+                cache[position_key(parse_moves(entry['position']), tuple(entry['board_shape']), entry.get('connect', DEFAULT_CONNECT))] = {int(col): score for col, score in entry['scores'].items()}
+        with open(out_path, 'w') as f:
+            f.writelines(kept)
+    return games_done, cache
+
+def save_checkpoint(checkpoint_path, games_done):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'games_done': games_done, 'time': time.time()}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def run(inputs, out_path, depth=6, workers=None, batch_size=64, blunder_threshold=50, board_shape=(6,7), verbose=True):
+    '''
+    Analyze every game in inputs and append the results to out_path.
+    Returns (games analyzed, positions searched)
+    '''
+    checkpoint_path = out_path + '.checkpoint'
+    games_done, cache = load_checkpoint(checkpoint_path, out_path)
+    if verbose and games_done:
+        print(f"Resuming after {games_done} games with {len(cache)} cached positions")
+
+    start = time.time()
+    searched = 0
+    analyzed = 0
+
+    def flush(batch, pool):
+        nonlocal searched, analyzed, games_done
+        # Collect the positions of the whole batch that have not been seen before
+        jobs = {}
+        for _, record in batch:
+            for ply in range(len(record.moves)):
+                prefix = record.moves[:ply]
+                key = position_key(prefix, record.board_shape, record.connect)
+                if key not in cache and key not in jobs:
+                    jobs[key] = (key, prefix, record.board_shape, record.connect, depth)
+
+        for key, scores in pool.imap_unordered(analyze_position, jobs.values(), chunksize=4):
+            cache[key] = scores
+        searched += len(jobs)
+
+        with open(out_path, 'a') as f:
+            for index, record in batch:
+                for line in move_records(index, record, cache, blunder_threshold):
+                    f.write(json.dumps(line) + '\n')
+
+        analyzed += len(batch)
+        games_done = batch[-1][0] + 1
+        save_checkpoint(checkpoint_path, games_done)
+        if verbose:
+            elapsed = time.time() - start
+            print(f"{games_done} games done | {searched} positions searched, {len(cache)} cached | {round(elapsed, 1)}s ({analyzed / max(elapsed, 1e-9):.2f} games/s)")
+
+    with multiprocessing.Pool(workers) as pool:
+        batch = []
+        for index, record in enumerate(iter_sources(inputs, board_shape)):
+            if index < games_done:
+                continue
+            # A bad game would fail its whole batch, and the same batch again on every resume
+            problem = check_record(record)
+            if problem is not None:
+                if verbose:
+                    print(f"Skipping game {index} (game {record.game}): {problem}")
+                continue
+            batch.append((index, record))
+            if len(batch) >= batch_size:
+                flush(batch, pool)
+                batch = []
+        if batch:
+            flush(batch, pool)
+
+    return analyzed, searched
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-analyze stored games with alphaBetaAI')
+    parser.add_argument('-inputs', nargs='+', default=[os.path.join('history', 'games.c4log')], help='Game logs and/or old text history directories')
+    parser.add_argument('-out', default='analysis.jsonl', type=str, help='JSON lines output, one line per move')
+    parser.add_argument('-depth', default=6, type=int, help='Search depth for every position')
+    parser.add_argument('-workers', default=0, type=int, help='Worker processes (0 uses every core)')
+    parser.add_argument('-batch', default=64, type=int, help='Games per batch (and per checkpoint)')
+    parser.add_argument('-blunder', default=50, type=float, help='Score loss against the best move that counts as a blunder')
+    parser.add_argument('-w', default=6, type=int, help='Rows of games read from text histories')
+    parser.add_argument('-l', default=7, type=int, help='Columns of games read from text histories')
+    args = parser.parse_args()
+
+    start = time.time()
+    games, positions = run(args.inputs, args.out, args.depth, args.workers or None, args.batch, args.blunder, (args.w, args.l))
+    print(f"Analyzed {games} games ({positions} new positions) in {round(time.time() - start, 2)}s")
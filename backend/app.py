@@ -1,100 +1,319 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from connect4 import connect4
-from players import humanGUI, alphaBetaAI, randomAI, stupidAI, minimaxAI
-from montecarlo import monteCarloAI
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from connect4 import connect4, parse_moves, format_moves, board_from_moves
+from players import connect4Player, alphaBetaAI, randomAI, stupidAI, minimaxAI
+from montecarlo import monteCarloAI, mctsAI
+from analyze import search_position
+from gamestore import GameStore
+from warmup import Warmup
+from shapes import DEFAULT_CONNECT, tables
+import ntuple
+import tablebase
+from budgets import budget_for, cost_units, ClientQuota, QuotaExceeded, LoadGovernor, DIFFICULTIES, DEFAULT_DIFFICULTY
 
 app = Flask(__name__)
 CORS(app)
 
-# Global game instance
-game = None
-current_ai_type = "alphaBetaAI"
+# Games are keyed by an id sent by the client (game_id in the JSON body or query string).
+# Clients that don't send one all share the default game, like the original single global game
+DEFAULT_GAME_ID = "default"
+GAME_STORE_PATH = os.environ.get('C4_GAME_STORE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'active_games.db'))
+
+games = OrderedDict() # game_id -> connect4 instance of the games in memory, least recently used first
+games_lock = threading.RLock()
+# Per-game locks serializing request threads and background AI turns. Kept outside the
+# connect4 instance so agents can still deepcopy it, and shared across resets of the same id
+game_locks = {}
+# Games unused for C4_GAME_IDLE_TTL seconds, or beyond the C4_MAX_GAMES most recently used,
+# are dropped from memory. Every change is already queued in the store, so they reload from there
+GAME_IDLE_TTL = float(os.environ.get('C4_GAME_IDLE_TTL', '600'))
+MAX_GAMES = int(os.environ.get('C4_MAX_GAMES', '10000'))
+
+# Set C4_REQUEST_LOG to record every request as a JSON line (loadtest.py can replay the log)
+REQUEST_LOG_PATH = os.environ.get('C4_REQUEST_LOG')
+request_log = open(REQUEST_LOG_PATH, 'a', buffering=1) if REQUEST_LOG_PATH else None
+request_log_lock = threading.Lock()
+
+# Every game is written behind to disk so a restarted process can pick it back up
+store = GameStore(GAME_STORE_PATH)
+atexit.register(store.close)
 
 # Available AI types
 AI_TYPES = {
     "alphaBetaAI": alphaBetaAI,
     "minimaxAI": minimaxAI,
     "monteCarloAI": monteCarloAI,
+    "mctsAI": mctsAI,
     "randomAI": randomAI,
     "stupidAI": stupidAI,
-    "humanGUI": humanGUI
+    "humanGUI": connect4Player # human seats are driven through /move, so they need no GUI
 }
 
-def initialize_game(ai_type="alphaBetaAI"):
+class EventBroker():
+    '''
+    Fan-out of game events to the /events streams watching each game.
+    Each subscriber gets its own bounded queue; a client that stops reading
+    is dropped instead of letting its queue grow without bound
+    '''
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self.subscribers = {} # game_id -> set of queues
+        self.lock = threading.Lock()
+
+    def subscribe(self, game_id):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            self.subscribers.setdefault(game_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, game_id, q):
+        with self.lock:
+            self.subscribers.get(game_id, set()).discard(q)
+
+    def publish(self, game_id, event):
+        with self.lock:
+            for q in list(self.subscribers.get(game_id, ())):
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    self.subscribers[game_id].discard(q)
+
+# Work every client may spend on AI moves, shared by all of its games
+quota = ClientQuota()
+# Shrinks AI budgets while moves pile up and restores them when the load drops
+governor = LoadGovernor()
+
+events = EventBroker()
+EVENT_KEEPALIVE = 15 # seconds between keepalive comments on idle streams
+
+def request_game_id():
+    """Game id for the current request"""
+    body = request.get_json(silent=True) or {}
+    return str(body.get('game_id') or request.args.get('game_id') or DEFAULT_GAME_ID)
+
+def request_client_id():
+    """Who is charged for the compute of this request"""
+    return request.headers.get('X-Client-Id') or request.remote_addr or 'unknown'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+
+@app.after_request
+def record_request(response):
+    """Append the request to the request log, if one is configured"""
+    if request_log is None or request.path in ('/events', '/ready'):
+        return response
+    game_id = request_game_id()
+    game = games.get(game_id)
+    entry = {
+        'time': g.request_start,
+        'method': request.method,
+        'path': request.path,
+        'args': request.args.to_dict(),
+        'body': request.get_json(silent=True),
+        'client': request_client_id(),
+        'game_id': game_id,
+        'ai_type': game.ai_type if game is not None else None,
+        'status': response.status_code,
+        'latency': time.time() - g.request_start,
+    }
+    with request_log_lock:
+        request_log.write(json.dumps(entry) + '\n')
+    return response
+
+def initialize_game(ai_type="alphaBetaAI", game_id=DEFAULT_GAME_ID, created=None, difficulty=DEFAULT_DIFFICULTY):
     """Initialize a new game instance with specified AI"""
-    global game, current_ai_type
-    current_ai_type = ai_type
-    player1_app = humanGUI(1) 
+    player1_app = connect4Player(1)
     
     if ai_type == "humanGUI":
         # For local 2-player, both players are human
-        player2_app = humanGUI(2)
+        player2_app = connect4Player(2)
     else:
         player2_class = AI_TYPES.get(ai_type, alphaBetaAI)
         player2_app = player2_class(2)
     
     game = connect4(player1=player1_app, player2=player2_app, visualize=False)
+    game.game_id = game_id
+    game.ai_type = ai_type
+    game.difficulty = difficulty if difficulty in DIFFICULTIES else DEFAULT_DIFFICULTY
+    game.created = created if created is not None else time.time()
+    game.last_used = time.time()
+    with games_lock:
+        games[game_id] = game
+        games.move_to_end(game_id)
+        game_locks.setdefault(game_id, threading.RLock())
+        evict_games(game.last_used)
     return game
 
-# Initialize the first game
-initialize_game()
+def persist(game):
+    """Queue the game's current state for the write-behind store (no disk I/O here)"""
+    store.save(game.game_id, format_moves(game.move_list()), game.ai_type, game.difficulty, game.created)
 
-def find_winning_line(board, shape):
-    """Find the winning line of 4 pieces and return their coordinates"""
-    rows, cols = shape
-    
-    # Check horizontal
-    for r in range(rows):
-        for c in range(cols - 3):
-            if board[r][c] != 0 and all(board[r][c + i] == board[r][c] for i in range(4)):
-                return [(r, c + i) for i in range(4)]
-    
-    # Check vertical
-    for r in range(rows - 3):
-        for c in range(cols):
-            if board[r][c] != 0 and all(board[r + i][c] == board[r][c] for i in range(4)):
-                return [(r + i, c) for i in range(4)]
-    
-    # Check diagonal (positive slope)
-    for r in range(rows - 3):
-        for c in range(cols - 3):
-            if board[r][c] != 0 and all(board[r + i][c + i] == board[r][c] for i in range(4)):
-                return [(r + i, c + i) for i in range(4)]
-    
-    # Check diagonal (negative slope)
-    for r in range(3, rows):
-        for c in range(cols - 3):
-            if board[r][c] != 0 and all(board[r - i][c + i] == board[r][c] for i in range(4)):
-                return [(r - i, c + i) for i in range(4)]
-    
+def restore_game(game_id, saved):
+    """Rebuild a game from its stored state by replaying its moves"""
+    game = initialize_game(saved['opponent'], game_id, saved['created'], saved['difficulty'])
+    for col in parse_moves(saved['moves']):
+        player = game.turnPlayer.position
+        game.play_move(col)
+        if game.gameOver(col, player): # sets is_winner if this move won
+            # Like /move and AI turns, leave the turn with the player who ended the game
+            game.turnPlayer = game.turnPlayer.opponent
+            break
+    return game
+
+def evict_games(now):
+    """Drop idle games and the least recently used ones past MAX_GAMES. Call with games_lock held"""
+    while games:
+        game_id, game = next(iter(games.items()))
+        if len(games) <= MAX_GAMES and now - game.last_used <= GAME_IDLE_TTL:
+            break
+        lock = game_locks.get(game_id)
+        if lock is not None and not lock.acquire(blocking=False):
+            break # a request or AI turn is still working on it
+        del games[game_id]
+        game_locks.pop(game_id, None)
+        if lock is not None:
+            lock.release()
+
+def new_game(ai_type, game_id, difficulty=DEFAULT_DIFFICULTY):
+    """Start a fresh game under game_id and tell its watchers"""
+    game = initialize_game(ai_type, game_id, difficulty=difficulty)
+    persist(game)
+    events.publish(game_id, {'type': 'reset', 'current_opponent': ai_type, 'difficulty': game.difficulty, 'current_player': 1})
+    return game
+
+def get_game(game_id=None):
+    """
+    The game for this request. After a restart a game is restored from the store
+    the first time it is asked for, by replaying its moves
+    """
+    game_id = game_id or request_game_id()
+    now = time.time()
+    with games_lock:
+        evict_games(now)
+        game = games.get(game_id)
+        if game is not None:
+            game.last_used = now
+            games.move_to_end(game_id)
+            return game
+    # Only a game that isn't in memory costs a store read, made without holding up other games
+    saved = store.load(game_id)
+    with games_lock:
+        game = games.get(game_id)
+        if game is not None: # another request restored it meanwhile
+            return game
+        if saved is None:
+            return new_game("alphaBetaAI", game_id)
+        return restore_game(game_id, saved)
+
+class LRUCache():
+    '''
+    Small thread-safe least-recently-used cache for /analyze results and AI moves
+    '''
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+# Limits for /analyze so one request can't tie up the pool
+ANALYZE_MAX_POSITIONS = 256
+ANALYZE_MAX_DEPTH = 10
+ANALYZE_MAX_TIME = 10.0
+
+analysis_cache = LRUCache()
+analysis_pool = None
+
+# Full-strength AI replies, keyed by (ai type, budget, board). Filled by real games and by the warm-up
+move_cache = LRUCache()
+
+def get_analysis_pool():
+    '''Create the worker pool on first use so importing app stays cheap'''
+    global analysis_pool
+    if analysis_pool is None:
+        analysis_pool = ProcessPoolExecutor()
+    return analysis_pool
+
+def reset_analysis_pool(broken):
+    '''Drop a pool whose workers died (killed, out of memory) so the next request starts a fresh one'''
+    global analysis_pool
+    if analysis_pool is broken:
+        analysis_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def analysis_result(scores, reached):
+    """The /analyze result of one position from search_position's column scores"""
+    if not scores:
+        return {'best_move': None, 'score': None, 'scores': {}, 'depth': 0}
+    best_move = max(scores, key=scores.get)
+    return {'best_move': int(best_move), 'score': scores[best_move],
+        'scores': {str(col): score for col, score in scores.items()}, 'depth': reached}
+
+def find_winning_line(board, shape, connect=DEFAULT_CONNECT):
+    """Find the winning line of connect pieces and return their coordinates"""
+    for line in tables(shape, connect).line_cells:
+        r, c = line[0]
+        if board[r][c] != 0 and all(board[rr][cc] == board[r][c] for rr, cc in line):
+            return [(rr, cc) for rr, cc in line]
     return None
 
-def is_human_vs_human():
-    """Check if the current game mode is human vs human"""
-    return current_ai_type == "humanGUI"
+def is_human_vs_human(game):
+    """Check if the game mode is human vs human"""
+    return game.ai_type == "humanGUI"
 
 @app.route('/set-opponent', methods=['POST'])
 def set_opponent():
     """Set the AI opponent type"""
-    global game
     try:
+        game = get_game()
         data = request.json
         ai_type = data.get('ai_type', 'alphaBetaAI')
+        difficulty = data.get('difficulty', game.difficulty)
         
         if ai_type not in AI_TYPES:
             return jsonify({'error': f'Invalid AI type. Available: {list(AI_TYPES.keys())}'}), 400
+        if difficulty not in DIFFICULTIES:
+            return jsonify({'error': f'Invalid difficulty. Available: {list(DIFFICULTIES.keys())}'}), 400
         
         # Only allow changing opponent before any moves are made
         if game and (len(game.history[0]) > 0 or len(game.history[1]) > 0):
             return jsonify({'error': 'Cannot change opponent after game has started'}), 400
         
-        initialize_game(ai_type)
+        game = new_game(ai_type, game.game_id, difficulty)
         return jsonify({
-            'message': f'Opponent set to {ai_type}',
+            'message': f'Opponent set to {ai_type} ({difficulty})',
             'current_opponent': ai_type,
+            'difficulty': difficulty,
             'board': game.board.tolist(),
-            'is_human_vs_human': is_human_vs_human()
+            'game_id': game.game_id,
+            'is_human_vs_human': is_human_vs_human(game)
         })
     except Exception as e:
         return jsonify({'error': f'Failed to set opponent: {str(e)}'}), 500
@@ -106,29 +325,35 @@ def get_opponents():
         "alphaBetaAI": "Alpha-Beta AI (Smart)",
         "minimaxAI": "Minimax AI (Medium)",
         "monteCarloAI": "Monte Carlo AI (Random Simulation)",
+        "mctsAI": "MCTS AI (Tree Search + Tactics)",
         "randomAI": "Random AI (Easy)",
         "stupidAI": "Predictable AI (Very Easy)",
         "humanGUI": "Human Player (Local 2-Player)"
     }
+    game = get_game()
     return jsonify({
         'opponents': opponent_info,
-        'current': current_ai_type,
-        'is_human_vs_human': is_human_vs_human()
+        'current': game.ai_type,
+        'difficulties': DIFFICULTIES,
+        'difficulty': game.difficulty,
+        'is_human_vs_human': is_human_vs_human(game)
     })
 
 @app.route('/reset', methods=['POST'])
 def reset_game():
     """Reset the game to initial state"""
-    global game
     try:
         # Keep the same AI type when resetting
-        initialize_game(current_ai_type)
+        game = get_game()
+        game = new_game(game.ai_type, game.game_id, game.difficulty)
         return jsonify({
             'board': game.board.tolist(), 
             'message': 'Game reset successfully',
             'current_player': game.turnPlayer.position,
-            'current_opponent': current_ai_type,
-            'is_human_vs_human': is_human_vs_human()
+            'current_opponent': game.ai_type,
+            'difficulty': game.difficulty,
+            'game_id': game.game_id,
+            'is_human_vs_human': is_human_vs_human(game)
         })
     except Exception as e:
         return jsonify({'error': f'Failed to reset game: {str(e)}'}), 500
@@ -136,67 +361,232 @@ def reset_game():
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get current game status"""
-    global game
-    if game is None:
-        initialize_game()
+    game = get_game()
     
     return jsonify({
         'board': game.board.tolist(),
         'current_player': game.turnPlayer.position,
         'game_over': len(game.history[0]) + len(game.history[1]) == game.shape[0] * game.shape[1],
         'valid_moves': game.get_valid_moves(),
-        'is_human_vs_human': is_human_vs_human()
+        'game_id': game.game_id,
+        'is_human_vs_human': is_human_vs_human(game),
+        'load': governor.stats()
     })
 
+def wants_compact():
+    """Clients on the push channel can skip the full board in responses"""
+    body = request.get_json(silent=True) or {}
+    return bool(body.get('compact') or request.args.get('compact') in ('1', 'true', 'True'))
+
+def reserve_ai_turn(game, client, nodes=None, scale=1.0):
+    """
+    Work out the AI's budget for its next move, scaled down by load, and take it
+    from the client's quota up front. Returns (budget, units reserved); raises QuotaExceeded
+    """
+    budget = budget_for(game.ai_type, game.difficulty, nodes, scale)
+    units = cost_units(game.ai_type, budget)
+    reserved = quota.reserve(client, units)
+    if budget is not None and reserved < units:
+        # The move asked for more than a full bucket, it gets what the bucket holds
+        budget = budget_for(game.ai_type, nodes=reserved)
+    return budget, reserved
+
+def choose_ai_move(game, budget=None, time_cap=None, depth_cap=None):
+    """
+    The AI's (player 2's) column for the current position and whether it came
+    from move_cache. Only moves searched at full strength (no time or depth cap)
+    with a budget are cached: randomAI and stupidAI keep their randomness, and
+    a move weakened by load isn't served to later games. A cached move costs no nodes
+    """
+    key = None
+    if budget is not None and time_cap is None and depth_cap is None:
+        key = (game.ai_type, budget, game.board.tobytes())
+        cached = move_cache.get(key)
+        if cached is not None:
+            game.player2.nodes = 0
+            return cached, True
+
+    move_dict = {"move": -1}
+    game.player2.budget = budget
+    game.player2.time_cap = time_cap
+    game.player2.depth_cap = depth_cap
+    game.player2.play(game.getEnv(), move_dict)
+    ai_col = int(move_dict["move"])
+    if key is not None and 0 <= ai_col < game.shape[1] and game.topPosition[ai_col] >= 0:
+        move_cache.put(key, ai_col)
+    return ai_col, False
+
+def move_count(game):
+    '''Moves played so far. Move deltas and responses carry it so clients can tell which of two arrived late'''
+    return len(game.history[0]) + len(game.history[1])
+
+def play_ai_turn(game, budget=None, client=None, reserved=0, scale=1.0):
+    """
+    Let the AI (player 2) choose and play its move within budget (nodes, or
+    playouts for monteCarloAI) and the time and depth caps for the load scale.
+    Whatever part of the reservation it didn't use goes back to the client's quota.
+    Must be called with the game's lock held. Returns (move delta, error message)
+    """
+    # Get AI move
+    time_cap, depth_cap = governor.limits(scale)
+    try:
+        ai_col, cached = choose_ai_move(game, budget, time_cap, depth_cap)
+    finally:
+        if client is not None:
+            quota.refund(client, reserved - cost_units(game.ai_type, game.player2.nodes))
+
+    # Validate AI move
+    if not (0 <= ai_col < game.shape[1]) or game.topPosition[ai_col] < 0:
+        # Fallback to random valid move if AI chose invalid move
+        valid_moves = game.get_valid_moves()
+        if valid_moves:
+            ai_col = valid_moves[0]
+        else:
+            return None, 'No valid moves available'
+
+    row_to_play = int(game.topPosition[ai_col])
+    game.board[row_to_play][ai_col] = game.turnPlayer.position
+    game.topPosition[ai_col] -= 1
+    game.history[game.turnPlayer.position-1].append(ai_col)
+
+    delta = {'type': 'move', 'source': 'ai', 'column': int(ai_col), 'row': row_to_play, 'player': 2, 'ply': move_count(game),
+        'budget': budget, 'nodes': game.player2.nodes, 'cached': cached, 'time_limit': time_cap, 'depth_cap': depth_cap, 'load_scale': round(scale, 3)}
+    # Check for win/tie after AI move
+    if game.gameOver(ai_col, 2):  # Check if player 2 (AI) won
+        delta['game_over'] = True
+        delta['winner'] = 2 if game.is_winner else 0
+        delta['winning_line'] = find_winning_line(game.board, game.shape, game.connect) if game.is_winner else None
+    else:
+        # Switch back to human's turn
+        game.turnPlayer = game.turnPlayer.opponent
+        delta['game_over'] = False
+        delta['current_player'] = game.turnPlayer.position
+    persist(game)
+    return delta, None
+
+def push_ai_reply(game, budget, client, reserved, scale, arrived):
+    """Background AI turn requested with ai_reply, delivered on /events"""
+    played = False
+    try:
+        with game_locks[game.game_id]:
+            try:
+                if game.turnPlayer.position != 2 or is_human_vs_human(game):
+                    quota.refund(client, reserved)
+                    return
+                played = True
+                delta, error = play_ai_turn(game, budget, client, reserved, scale)
+                events.publish(game.game_id, delta if delta else {'type': 'error', 'error': error})
+            except Exception as e:
+                events.publish(game.game_id, {'type': 'error', 'error': f'AI move error: {str(e)}'})
+    finally:
+        governor.end(time.time() - arrived if played else None)
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """
+    Server-sent events channel. Streams a 'state' snapshot on connect, then
+    compact deltas: 'move' (column, row, player, source, game_over, ...), 'reset' and 'error'
+    """
+    def stream(game, q):
+        try:
+            yield 'retry: 2000\n\n'
+            with game_locks[game.game_id]:
+                snapshot = {'type': 'state', 'history': [list(map(int, h)) for h in game.history],
+                    'current_player': game.turnPlayer.position, 'current_opponent': game.ai_type}
+            yield f"event: state\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=EVENT_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n' # stops proxies from closing an idle stream
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.unsubscribe(game.game_id, q)
+
+    game = get_game()
+    return Response(stream(game, events.subscribe(game.game_id)), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/move', methods=['POST'])
 def move():
-    global game
-    
-    if game is None:
-        initialize_game()
+    """
+    Play a human move. With "ai_reply": true the AI answers in the background
+    and its move arrives on /events instead of needing a separate /ai-move request.
+    With "compact": true the board is left out of the response.
+    The reply is charged to the client's compute quota; when it is used up
+    ai_reply is 'rejected' with retry_after (seconds) and the AI move can be asked for later
+    """
+    game = get_game()
     
     try:
         col = request.json['column']
-        
-        # Validate column
-        if not (0 <= col < game.shape[1]):
-            return jsonify({'error': 'Invalid column number'}), 400
-        
-        if game.topPosition[col] < 0:
-            return jsonify({'error': 'Column is full'}), 400
-        
-        # For human vs human, allow both players to make moves through this endpoint
-        current_player = game.turnPlayer.position
-        
-        # Apply the move
-        row_to_play = game.topPosition[col]
-        game.board[row_to_play][col] = current_player
-        game.topPosition[col] -= 1
-        game.history[current_player-1].append(col)
-        
-        # Check for win/tie after the move
-        if game.gameOver(col, current_player):
-            winner = current_player if game.is_winner else 0
-            winning_line = find_winning_line(game.board, game.shape) if game.is_winner else None
-            return jsonify({
-                'board': game.board.tolist(), 
-                'winner': winner, 
-                'game_over': True,
-                'winning_line': winning_line,
-                'current_player': current_player,
-                'is_human_vs_human': is_human_vs_human()
-            })
-        
-        # Switch to the other player
-        game.turnPlayer = game.turnPlayer.opponent
-        
-        return jsonify({
-            'board': game.board.tolist(), 
-            'game_over': False,
-            'current_player': game.turnPlayer.position,
-            'is_human_vs_human': is_human_vs_human(),
-            'move_made_by': current_player
-        })
+        compact = wants_compact()
+        ai_reply = bool(request.json.get('ai_reply'))
+
+        with game_locks[game.game_id]:
+            # Validate column
+            if not (0 <= col < game.shape[1]):
+                return jsonify({'error': 'Invalid column number'}), 400
+            
+            if game.topPosition[col] < 0:
+                return jsonify({'error': 'Column is full'}), 400
+            
+            # For human vs human, allow both players to make moves through this endpoint
+            current_player = game.turnPlayer.position
+            
+            # Apply the move
+            row_to_play = int(game.topPosition[col])
+            game.board[row_to_play][col] = current_player
+            game.topPosition[col] -= 1
+            game.history[current_player-1].append(col)
+            delta = {'type': 'move', 'source': 'human', 'column': col, 'row': row_to_play, 'player': current_player, 'ply': move_count(game)}
+            
+            # Check for win/tie after the move
+            if game.gameOver(col, current_player):
+                winner = current_player if game.is_winner else 0
+                winning_line = find_winning_line(game.board, game.shape, game.connect) if game.is_winner else None
+                delta.update(game_over=True, winner=winner, winning_line=winning_line)
+                persist(game)
+                events.publish(game.game_id, delta)
+                response = {
+                    'ply': delta['ply'],
+                    'winner': winner, 
+                    'game_over': True,
+                    'winning_line': winning_line,
+                    'current_player': current_player,
+                    'is_human_vs_human': is_human_vs_human(game)
+                }
+            else:
+                # Switch to the other player
+                game.turnPlayer = game.turnPlayer.opponent
+                delta.update(game_over=False, current_player=game.turnPlayer.position)
+                persist(game)
+                events.publish(game.game_id, delta)
+                response = {
+                    'ply': delta['ply'],
+                    'game_over': False,
+                    'current_player': game.turnPlayer.position,
+                    'is_human_vs_human': is_human_vs_human(game),
+                    'move_made_by': current_player
+                }
+                if ai_reply and not is_human_vs_human(game):
+                    client = request_client_id()
+                    arrived = time.time()
+                    scale = governor.begin()
+                    try:
+                        budget, reserved = reserve_ai_turn(game, client, scale=scale)
+                        threading.Thread(target=push_ai_reply, args=(game, budget, client, reserved, scale, arrived), daemon=True).start()
+                        response['ai_reply'] = 'pending'
+                    except QuotaExceeded as e:
+                        governor.end(None)
+                        response.update(ai_reply='rejected', retry_after=round(e.retry_after, 2))
+
+            if compact:
+                response.update(column=col, row=row_to_play)
+            else:
+                response['board'] = game.board.tolist()
+            return jsonify(response)
         
     except KeyError:
         return jsonify({'error': 'Missing column parameter'}), 400
@@ -205,66 +595,228 @@ def move():
 
 @app.route('/ai-move', methods=['GET'])
 def ai_move():
-    global game
-    
-    if game is None:
-        initialize_game()
+    """
+    Play the AI's move. The search is capped by the game's difficulty, or by
+    ?nodes=N (at most the hardest difficulty), and charged to the client's
+    quota; 429 with retry_after when the quota is used up.
+    While the server is overloaded the budget, time and depth are scaled down
+    (load_scale < 1) so replies stay fast; the response reports what the move was given
+    """
+    game = get_game()
     
     # If it's human vs human mode, don't allow AI moves
-    if is_human_vs_human():
+    if is_human_vs_human(game):
         return jsonify({'error': 'AI moves not allowed in human vs human mode'}), 400
     
+    arrived = time.time()
+    scale = governor.begin()
+    played = False
     try:
-        # Ensure it's the AI's turn (Player 2)
-        if game.turnPlayer.position != 2:
-            return jsonify({'error': 'Not AI\'s turn'}), 400
-
-        # Get AI move
-        move_dict = {"move": -1}
-        game.player2.play(game.getEnv(), move_dict)
-        ai_col = move_dict["move"]
-
-        # Validate AI move
-        if not (0 <= ai_col < game.shape[1]) or game.topPosition[ai_col] < 0:
-            # Fallback to random valid move if AI chose invalid move
-            valid_moves = game.get_valid_moves()
-            if valid_moves:
-                ai_col = valid_moves[0]
-            else:
-                return jsonify({'error': 'No valid moves available'}), 500
-
-        # Apply AI's move
-        row_to_play = game.topPosition[ai_col]
-        game.board[row_to_play][ai_col] = game.turnPlayer.position
-        game.topPosition[ai_col] -= 1
-        game.history[game.turnPlayer.position-1].append(ai_col)
-
-        # Check for win/tie after AI move
-        if game.gameOver(ai_col, 2):  # Check if player 2 (AI) won
-            winner = 2 if game.is_winner else 0
-            winning_line = find_winning_line(game.board, game.shape) if game.is_winner else None
-            return jsonify({
-                'move': int(ai_col), 
-                'board': game.board.tolist(), 
-                'winner': winner, 
-                'game_over': True,
-                'winning_line': winning_line,
-                'is_human_vs_human': False
-            })
+        with game_locks[game.game_id]:
+            # Ensure it's the AI's turn (Player 2)
+            if game.turnPlayer.position != 2:
+                return jsonify({'error': 'Not AI\'s turn'}), 400
 
-        # Switch back to human's turn
-        game.turnPlayer = game.turnPlayer.opponent
-        
-        return jsonify({
-            'move': int(ai_col), 
-            'board': game.board.tolist(), 
-            'game_over': False,
-            'current_player': game.turnPlayer.position,
-            'is_human_vs_human': False
-        })
+            nodes = request.args.get('nodes')
+            try:
+                nodes = None if nodes is None else min(int(nodes), max(DIFFICULTIES.values()))
+            except ValueError:
+                return jsonify({'error': 'nodes must be an integer'}), 400
+            if nodes is not None and nodes < 1:
+                return jsonify({'error': 'nodes must be positive'}), 400
+
+            client = request_client_id()
+            try:
+                budget, reserved = reserve_ai_turn(game, client, nodes, scale)
+            except QuotaExceeded as e:
+                return jsonify({'error': str(e), 'retry_after': round(e.retry_after, 2)}), 429
+
+            played = True
+            delta, error = play_ai_turn(game, budget, client, reserved, scale)
+            if delta is None:
+                return jsonify({'error': error}), 500
+            events.publish(game.game_id, delta)
+
+            response = {'move': delta['column'], 'ply': delta['ply'], 'game_over': delta['game_over'], 'is_human_vs_human': False,
+                'budget': delta['budget'], 'nodes': delta['nodes'], 'cached': delta['cached'], 'time_limit': delta['time_limit'],
+                'depth_cap': delta['depth_cap'], 'load_scale': delta['load_scale'], 'quota_remaining': quota.remaining(client)}
+            if delta['game_over']:
+                response.update(winner=delta['winner'], winning_line=delta['winning_line'])
+            else:
+                response['current_player'] = delta['current_player']
+            if wants_compact():
+                response['row'] = delta['row']
+            else:
+                response['board'] = game.board.tolist()
+            return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': f'AI move error: {str(e)}'}), 500
+    finally:
+        governor.end(time.time() - arrived if played else None)
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    '''
+    Stateless bulk analysis. Body:
+        {"positions": ["3342", {"moves": "33"}, {"board": [[0, ...], ...]}],
+         "depth": 6, "time_limit": 1.0}
+    Moves are 0-indexed columns, player 1 first. Boards are lists of rows, top row first.
+    Each position is searched to the given depth, or as deep as the time limit
+    (seconds per position) allows. Returns the score of every column for the player to move
+    '''
+    data = request.json or {}
+    positions = data.get('positions')
+    if not isinstance(positions, list) or not positions:
+        return jsonify({'error': 'positions must be a non-empty list'}), 400
+    if len(positions) > ANALYZE_MAX_POSITIONS:
+        return jsonify({'error': f'At most {ANALYZE_MAX_POSITIONS} positions per request'}), 400
+
+    try:
+        depth = int(data.get('depth', 6))
+        time_limit = float(data.get('time_limit', ANALYZE_MAX_TIME))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'depth must be an integer and time_limit a number'}), 400
+    if not (1 <= depth <= ANALYZE_MAX_DEPTH) or not (0 < time_limit <= ANALYZE_MAX_TIME):
+        return jsonify({'error': f'depth must be 1-{ANALYZE_MAX_DEPTH} and time_limit in (0, {ANALYZE_MAX_TIME}]'}), 400
+
+    results = [None] * len(positions)
+    pending = {} # cache key -> (job, indices of positions that need it)
+    for i, position in enumerate(positions):
+        try:
+            if isinstance(position, str):
+                board = board_from_moves(parse_moves(position))[0].tolist()
+            elif isinstance(position, dict) and 'moves' in position:
+                moves = position['moves']
+                moves = parse_moves(moves) if isinstance(moves, str) else [int(m) for m in moves]
+                board = board_from_moves(moves)[0].tolist()
+            elif isinstance(position, dict) and 'board' in position:
+                board = position['board']
+            else:
+                raise ValueError('Each position must be a move string, {"moves": ...} or {"board": ...}')
+            key = (str(board), depth, time_limit)
+        except (TypeError, ValueError) as e:
+            results[i] = {'error': str(e)}
+            continue
+
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            results[i] = dict(cached, cached=True)
+        elif key in pending:
+            pending[key][1].append(i)
+        else:
+            pending[key] = ((key, board, depth, time_limit), [i])
+
+    pool = get_analysis_pool() if pending else None
+    futures = {}
+    for key, (job, _) in pending.items():
+        try:
+            futures[key] = pool.submit(search_position, job)
+        except Exception as e: # the pool broke before this position was handed out
+            futures[key] = e
+    broken = False
+    # Every position gets its own result: one that fails doesn't take the others down with it
+    for key, future in futures.items():
+        try:
+            if isinstance(future, Exception):
+                raise future
+            result = analysis_result(*future.result()[1:])
+            analysis_cache.put(key, result)
+            result = dict(result, cached=False)
+        except ValueError as e:
+            result = {'error': str(e)}
+        except Exception as e:
+            broken = broken or isinstance(e, BrokenProcessPool)
+            result = {'error': f'Analysis failed: {type(e).__name__}: {e}'}
+        for i in pending[key][1]:
+            results[i] = result
+    if broken:
+        reset_analysis_pool(pool)
+
+    return jsonify({
+        'results': results,
+        'computed': len(pending),
+        'cache': {'size': len(analysis_cache.entries), 'hits': analysis_cache.hits, 'misses': analysis_cache.misses}
+    })
+
+# Warm-up on startup (C4_WARMUP=1): page in the endgame and evaluation tables, start the
+# analysis workers and search the first C4_WARMUP_PLIES AI replies of every opening for each
+# opponent and difficulty in C4_WARMUP_OPPONENTS / C4_WARMUP_DIFFICULTIES into move_cache.
+# /ready answers 503 until it is done
+WARMUP_ENABLED = os.environ.get('C4_WARMUP', '0') in ('1', 'true', 'True')
+WARMUP_PLIES = int(os.environ.get('C4_WARMUP_PLIES', '1'))
+WARMUP_OPPONENTS = [a for a in os.environ.get('C4_WARMUP_OPPONENTS', 'alphaBetaAI').split(',') if a]
+WARMUP_DIFFICULTIES = [d for d in os.environ.get('C4_WARMUP_DIFFICULTIES', ','.join(DIFFICULTIES)).split(',') if d]
+WARMUP_BOARD_SHAPE = (6, 7)
+
+def warm_tables(advance):
+    """Open the tablebase and read it into memory, and load the n-tuple weights (search.py loads its weights at import)"""
+    table = tablebase.load()
+    if table is not None:
+        table.warm()
+    advance()
+    ntuple.load()
+    advance()
+
+def warm_analysis(advance):
+    """Start the /analyze workers and cache the analysis of the empty board at the default settings"""
+    board = board_from_moves([], WARMUP_BOARD_SHAPE)[0].tolist()
+    key = (str(board), 6, ANALYZE_MAX_TIME)
+    _, scores, reached = get_analysis_pool().submit(search_position, (key, board, 6, ANALYZE_MAX_TIME)).result()
+    analysis_cache.put(key, analysis_result(scores, reached))
+    advance()
+
+def warm_openings(ai_type, difficulty, plies):
+    """
+    Warm-up step: the AI's reply to every human move for the first plies AI moves,
+    following the AI's own replies, searched into move_cache
+    """
+    def step(advance):
+        budget = budget_for(ai_type, difficulty)
+        lines = [[]]
+        for _ in range(plies):
+            next_lines = []
+            for line in lines:
+                for col in range(WARMUP_BOARD_SHAPE[1]):
+                    game = connect4(connect4Player(1), AI_TYPES[ai_type](2), board_shape=WARMUP_BOARD_SHAPE)
+                    game.ai_type = ai_type
+                    over = False
+                    for move in line + [col]:
+                        player = game.turnPlayer.position
+                        game.play_move(move)
+                        over = over or game.gameOver(move, player)
+                    if not over:
+                        ai_col, _ = choose_ai_move(game, budget)
+                        next_lines.append(line + [col, ai_col])
+                    advance()
+            lines = next_lines
+    return step
+
+def warmup_steps():
+    steps = [('tables', 2, warm_tables), ('analysis', 1, warm_analysis)]
+    positions = sum(WARMUP_BOARD_SHAPE[1] ** i for i in range(1, WARMUP_PLIES + 1))
+    for ai_type in WARMUP_OPPONENTS:
+        for difficulty in WARMUP_DIFFICULTIES:
+            if ai_type in AI_TYPES and difficulty in DIFFICULTIES and budget_for(ai_type, difficulty) is not None:
+                steps.append((f'openings {ai_type} {difficulty}', positions, warm_openings(ai_type, difficulty, WARMUP_PLIES)))
+    return steps
+
+warmup = Warmup(warmup_steps())
+if WARMUP_ENABLED:
+    warmup.start()
+else:
+    warmup.skip()
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once the startup warm-up has finished (or straight away
+    when it is off), 503 before that. Both report the warm-up's progress
+    """
+    status = warmup.status()
+    status['move_cache'] = {'size': len(move_cache.entries), 'hits': move_cache.hits, 'misses': move_cache.misses}
+    return jsonify(status), 200 if status['ready'] else 503
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # threaded so long-lived /events streams don't block the JSON routes
+    app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
\ No newline at end of file
@@ -0,0 +1,180 @@
+# budgets.py
+'''
+Compute budgets for AI moves served by app.py.
+
+Difficulty is a budget, not an algorithm: every agent is given a cap on the
+work it may do for one move (search nodes, or playouts for monteCarloAI) and
+stops exactly there (see connect4Player.count_node). Each client also has a
+quota of work units that refills over time, so one heavy opponent can't
+starve everybody else on the server.
+
+Under load the LoadGovernor shrinks every budget (and the time and depth
+limits of the searches) so moves keep coming back quickly, a little weaker,
+and lets them grow back once the load is gone.
+'''
+import math
+import os
+import threading
+import time
+
+# A monteCarloAI playout walks a whole game, so it costs about as much as this many search nodes
+SIMULATION_COST = 20
+
+# Work per move for each difficulty, in search nodes (simulations are derived from it)
+DIFFICULTIES = {
+    'easy': 300,
+    'medium': 3000,
+    'hard': 30000,
+    'expert': 150000,
+}
+DEFAULT_DIFFICULTY = 'hard'
+
+# Full-strength limits the governor scales down from (alphaBetaAI's own defaults)
+MAX_MOVE_TIME = 2.8
+MAX_SEARCH_DEPTH = 12
+MIN_MOVE_TIME = 0.05
+# Roughly how many times more nodes alpha-beta needs for each extra ply
+EFFECTIVE_BRANCHING = 4
+
+# Agents whose budget is counted in playouts rather than search nodes
+SIMULATION_AGENTS = ('monteCarloAI', 'mctsAI')
+# Agents that do a fixed, tiny amount of work and ignore budgets
+FIXED_COST_AGENTS = ('randomAI', 'stupidAI', 'humanGUI')
+
+class QuotaExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Compute quota exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+def budget_for(ai_type, difficulty=DEFAULT_DIFFICULTY, nodes=None, scale=1.0):
+    '''
+    Budget to give an agent, in its own units (nodes or simulations).
+    nodes overrides the difficulty preset, scale shrinks it under load.
+    Returns None for agents without budgets
+    '''
+    if ai_type in FIXED_COST_AGENTS:
+        return None
+    if nodes is None:
+        nodes = DIFFICULTIES[difficulty]
+    nodes = int(nodes * scale)
+    if ai_type in SIMULATION_AGENTS:
+        return max(1, nodes // SIMULATION_COST)
+    return max(1, nodes)
+
+def cost_units(ai_type, amount):
+    '''
+    Convert a budget or work done (in the agent's own units) to quota units (nodes)
+    '''
+    if ai_type in FIXED_COST_AGENTS or amount is None:
+        return 1
+    if ai_type in SIMULATION_AGENTS:
+        return amount * SIMULATION_COST
+    return amount
+
+class ClientQuota():
+    '''
+    Token bucket per client. A move reserves its whole budget up front and the
+    part it didn't use is refunded afterwards, so a client can never have more
+    work in flight than its bucket holds
+    '''
+    def __init__(self, capacity=600000, refill_per_second=10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.buckets = {} # client -> [tokens, last refill time]
+        self.lock = threading.Lock()
+
+    def _refill(self, client, now):
+        bucket = self.buckets.setdefault(client, [self.capacity, now])
+        bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+        bucket[1] = now
+        return bucket
+
+    def reserve(self, client, units):
+        '''
+        Take units from the client's bucket or raise QuotaExceeded
+        '''
+        units = min(units, self.capacity) # a single move never needs more than a full bucket
+        with self.lock:
+            bucket = self._refill(client, time.time())
+            if bucket[0] < units:
+                raise QuotaExceeded((units - bucket[0]) / self.refill_per_second)
+            bucket[0] -= units
+        return units
+
+    def refund(self, client, units):
+        if units <= 0:
+            return
+        with self.lock:
+            bucket = self._refill(client, time.time())
+            bucket[0] = min(self.capacity, bucket[0] + units)
+
+    def remaining(self, client):
+        with self.lock:
+            return int(self._refill(client, time.time())[0])
+
+class LoadGovernor():
+    '''
+    Adapts search budgets to how loaded the server is.
+
+    Watches the number of AI moves in flight (running or waiting for the CPU)
+    and a moving average of how long they take from arrival to reply. The
+    scale every budget is multiplied by is halved when the average is over
+    target_latency or more moves are in flight than max_in_flight, at most once
+    per target_latency so one burst doesn't collapse it, and grows back by
+    increase per move while both are under (AIMD). A move that arrives behind a
+    queue is also scaled by max_in_flight / in flight right away, before the
+    average has caught up
+    '''
+    def __init__(self, target_latency=0.2, max_in_flight=None, min_scale=0.01, decrease=0.5, increase=0.05, smoothing=0.3):
+        self.target_latency = target_latency
+        self.max_in_flight = max_in_flight or os.cpu_count() or 1
+        self.min_scale = min_scale
+        self.decrease = decrease
+        self.increase = increase
+        self.smoothing = smoothing
+        self.scale = 1.0
+        self.latency = 0.0 # moving average, seconds
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        '''
+        Register a move that has arrived. Returns the scale to give it
+        '''
+        with self.lock:
+            self.in_flight += 1
+            return max(self.min_scale, self.scale * min(1.0, self.max_in_flight / self.in_flight))
+
+    def end(self, latency):
+        '''
+        Register a finished move and how long it took since begin(), and adapt the scale.
+        latency None withdraws a move that was never played
+        '''
+        with self.lock:
+            self.in_flight -= 1
+            if latency is None:
+                return
+            self.latency += self.smoothing * (latency - self.latency)
+            now = time.time()
+            if self.latency > self.target_latency or self.in_flight > self.max_in_flight:
+                if now - self.last_decrease >= self.target_latency:
+                    self.scale = max(self.min_scale, self.scale * self.decrease)
+                    self.last_decrease = now
+            else:
+                self.scale = min(1.0, self.scale + self.increase)
+
+    def limits(self, scale):
+        '''
+        Time and depth caps for a move given scale. None means no cap (full strength)
+        '''
+        if scale >= 1.0:
+            return None, None
+        time_cap = max(MIN_MOVE_TIME, MAX_MOVE_TIME * scale)
+        # Search cost grows about EFFECTIVE_BRANCHING times per ply, so a smaller budget costs plies
+        depth_cap = max(1, MAX_SEARCH_DEPTH + math.floor(math.log(scale, EFFECTIVE_BRANCHING)))
+        return time_cap, depth_cap
+
+    def stats(self):
+        with self.lock:
+            return {'scale': round(self.scale, 3), 'latency': round(self.latency, 3), 'in_flight': self.in_flight}
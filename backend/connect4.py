@@ -1,32 +1,14 @@
 # connect4.py (Threading Fix Version)
 import numpy as np
-import os, sys
-import pygame
-import random
+import os
 import time
 import signal
 from copy import deepcopy
-import multiprocessing
+from streams import RandomStream
+from shapes import DEFAULT_CONNECT, tables
 
-# Defining globals (moved to top for clarity and accessibility)
-SQUARESIZE = 100
-BLUE = (0,0,255)
-BLACK = (0,0,0)
-P1COLOR = (255,0,0)
-P2COLOR = (255,255,0)
-WHITE = (255,255,255)
-
-ROW_COUNT = 6
-COLUMN_COUNT = 7
-
-width = COLUMN_COUNT * SQUARESIZE
-height = (ROW_COUNT+1) * SQUARESIZE
-
-size = (width, height)
-
-RADIUS = int(SQUARESIZE/2 - 5)
-
-screen = None # Initialize screen to None
+# The rules and the agents stay free of pygame so servers and worker processes can run
+# headless. Everything that draws lives in gui.py, which is only imported when visualize=True
 
 def timeout_handler(signum, frame):
     raise TimeoutError("Function call exceeded time limit")
@@ -48,18 +30,58 @@ def time_limit_with_signal(func, args, timeout):
     finally:
         signal.signal(signal.SIGALRM, old_handler)  # Restore old handler
 
+def parse_moves(text):
+    '''
+    Parse a move string into a list of column indices.
+    Columns are 0-indexed and may be written as a string of digits ("3342")
+    or as a comma separated list ("3,3,4,10") for boards wider than 10 columns
+    '''
+    text = text.strip()
+    if not text:
+        return []
+    if ',' in text:
+        return [int(c) for c in text.split(',') if c.strip()]
+    return [int(c) for c in text]
+
+def format_moves(moves):
+    '''
+    Inverse of parse_moves. Uses the comma form (with a trailing comma, so a
+    single wide column still parses back) only when a column needs two digits
+    '''
+    if any(m > 9 for m in moves):
+        return ','.join(str(m) for m in moves) + ','
+    return ''.join(str(m) for m in moves)
+
+def board_from_moves(moves, board_shape=(6,7)):
+    '''
+    Replay a sequence of columns (player 1 moves first) onto an empty board.
+    Returns the board and topPosition arrays in the same layout connect4 uses.
+    Raises ValueError if a move is out of bounds or targets a full column
+    '''
+    board = np.zeros(board_shape).astype('int32')
+    topPosition = (np.ones(board_shape[1]) * (board_shape[0]-1)).astype('int32')
+    player = 1
+    for move in moves:
+        if not (0 <= move < board_shape[1]) or topPosition[move] < 0:
+            raise ValueError(f"Illegal move {move} in sequence {list(moves)}")
+        board[topPosition[move]][move] = player
+        topPosition[move] -= 1
+        player = 3 - player
+    return board, topPosition
+
 class connect4():
     def __init__(self, player1, player2, board_shape=(6,7), visualize=False, game=0, save=False,
-        limit_players=[-1,-1], time_limit=[-1,-1], verbose=False, CVDMode=False, print_time_logs = False):
-
-        global screen # Declare screen as global here as well
+        limit_players=[-1,-1], time_limit=[-1,-1], verbose=False, CVDMode=False, print_time_logs = False, connect=DEFAULT_CONNECT):
 
         self.shape = board_shape
+        self.connect = connect # pieces in a line that win
+        self.tables = tables(board_shape, connect) # lines, move order and hash keys of this shape (shapes.py)
         self.visualize = visualize # show the GUI be displayed
+        self.cvd_mode = CVDMode # use the colorblind-friendly palette when drawing
 
         if self.visualize:
-            pygame.init()
-            screen = pygame.display.set_mode(size)
+            import gui
+            gui.init_display(self.shape)
 
         # An array that is the same shape as the board.
         # 0 represents an available position,
@@ -76,6 +98,7 @@ class connect4():
         self.topPosition = (np.ones(board_shape[1]) * (board_shape[0]-1)).astype('int32')
         self.player1 = player1
         self.player2 = player2
+        self.rng = RandomStream(getattr(player1, 'seed', 0), 0) # for random moves, apart from the agents' streams
         # Ensure player objects have an opponent attribute
         self.player1.opponent = self.player2
         self.player2.opponent = self.player1
@@ -86,6 +109,7 @@ class connect4():
 
         self.turnPlayer = self.player1 # which player's turn is it?
         self.history = [[], []] # track history of moves played for each player
+        self.think_times = [] # seconds each move took, in the order the moves were played
         self.game = game # just an integer to track which number game this is for logging purposes
         self.save = save # should the results of this game be saved?
         self.limit = limit_players # are players are subject to a time limit for each move (-1 indicates no limit)
@@ -101,13 +125,6 @@ class connect4():
         if self.time_limits[1] <= 0:
             self.time_limits[1] = 0.5
 
-        # Just changes the color of the pieces if true
-        if CVDMode:
-            global P1COLOR
-            global P2COLOR
-            P1COLOR = (227, 60, 239)
-            P2COLOR = (0, 255, 0)
-
     def is_gui_player(self, player):
         """Check if player is a GUI player that shouldn't be threaded"""
         return player.__class__.__name__ == 'humanGUI'
@@ -139,6 +156,7 @@ class connect4():
                 print(f"Player {self.turnPlayer.position} move exceeded {self.time_limits[self.turnPlayer.position-1]}s time limit and was terminated. A random move will be chosen")
 
         move = move_dict["move"]
+        self.think_times.append(time.time() - start)
 
         # Correct illegal move (assign random)
         if not (0 <= move < self.shape[1] and self.topPosition[move] >= 0): # Check if move is within bounds and column is not full
@@ -178,24 +196,22 @@ class connect4():
         # Play until the game is over
         while not self.gameOver(move, player):
             if self.visualize:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        sys.exit()
+                import gui
+                gui.pump_events()
 
             player = self.turnPlayer.position
             move = self.playTurn()
 
-        # Record the moves that were made
-        if self.save:
-            self.saveGame()
-
         # Print out result of game
         winner = 0 # 0 represents a tie
 
         if self.is_winner:
             winner = self.turnPlayer.opponent.position
 
+        # Record the moves that were made
+        if self.save:
+            self.saveGame(winner)
+
         if self.verbose:
             if self.is_winner:
                 print('Player ', winner, ' has won')
@@ -203,14 +219,9 @@ class connect4():
                 print('The game has tied')
 
         # Continue visualizing the board after game is over until GUI is closed
-        spectating = True
-        while spectating and self.visualize:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                    spectating = False
-                    break
+        if self.visualize:
+            import gui
+            gui.wait_for_close()
 
         return winner
 
@@ -227,32 +238,37 @@ class connect4():
         return False
 
     def check_win(self, board, row, col, player):
+        '''
+        Straightforward check of every line of self.connect through (row, col).
+        gameOver uses the precomputed tables instead; perft.py checks one against the other
+        '''
+        n = self.connect
         # Check horizontal
-        for c in range(max(0, col - 3), min(col + 4, self.shape[1])):
-            if c + 3 < self.shape[1]:
-                if all(board[row][c + i] == player for i in range(4)):
+        for c in range(max(0, col - n + 1), min(col + n, self.shape[1])):
+            if c + n - 1 < self.shape[1]:
+                if all(board[row][c + i] == player for i in range(n)):
                     return True
 
         # Check vertical
-        for r in range(max(0, row - 3), min(row + 4, self.shape[0])):
-            if r + 3 < self.shape[0]:
-                if all(board[r + i][col] == player for i in range(4)):
+        for r in range(max(0, row - n + 1), min(row + n, self.shape[0])):
+            if r + n - 1 < self.shape[0]:
+                if all(board[r + i][col] == player for i in range(n)):
                     return True
 
         # Check diagonal (positive slope: bottom-left to top-right)
-        for i in range(-3, 4):
+        for i in range(-n + 1, n):
             r, c = row + i, col + i
-            # Fixed bounds check: ensure we can fit 4 pieces in the diagonal
-            if (0 <= r <= self.shape[0] - 4 and 0 <= c <= self.shape[1] - 4):
-                if all(board[r + j][c + j] == player for j in range(4)):
+            # Fixed bounds check: ensure we can fit n pieces in the diagonal
+            if (0 <= r <= self.shape[0] - n and 0 <= c <= self.shape[1] - n):
+                if all(board[r + j][c + j] == player for j in range(n)):
                     return True
 
         # Check diagonal (negative slope: top-left to bottom-right)  
-        for i in range(-3, 4):
+        for i in range(-n + 1, n):
             r, c = row + i, col - i
-            # Fixed bounds check: ensure we can fit 4 pieces in the diagonal
-            if (0 <= r <= self.shape[0] - 4 and 3 <= c < self.shape[1]):
-                if all(board[r + j][c - j] == player for j in range(4)):
+            # Fixed bounds check: ensure we can fit n pieces in the diagonal
+            if (0 <= r <= self.shape[0] - n and n - 1 <= c < self.shape[1]):
+                if all(board[r + j][c - j] == player for j in range(n)):
                     return True
         return False
 
@@ -260,29 +276,41 @@ class connect4():
         '''
         Determine if the game is over or not.
         The game is over if:
-        - There are 4 connected pieces of the same color in a row, column, or diagonal
+        - There are self.connect connected pieces of the same color in a row, column, or diagonal
         - All positions are filled and no one has won
         '''
         i = self.topPosition[j] + 1 # The row where the piece was just dropped
 
-        if self.check_win(self.board, i, j, player):
+        if self.tables.wins_at(self.board, i, j, player):
             self.is_winner = True
             return True
 
-        # If there are no 4 connected pieces, have all positions been filled?
+        # If there are no connected pieces, have all positions been filled?
         return len(self.history[0]) + len(self.history[1]) == self.shape[0]*self.shape[1]
 
-    def saveGame(self):
+    def saveGame(self, winner):
+        '''
+        Append the game to the binary game log in the history directory
+        (see gamelog.py for the format and for converting old text histories)
+        '''
+        from gamelog import GameRecord, append_game
+
+        record = GameRecord(self.game, self.shape, self.move_list(), winner,
+            (self.player1.__class__.__name__, self.player2.__class__.__name__),
+            self.player1.seed, self.think_times, time.time(), self.connect)
+        append_game(os.path.join('history', 'games.c4log'), record)
+
+    def move_list(self):
         '''
-        Save each players moves out to a text file
+        All moves played so far, in order.
+        Player 1 always moves first, so the per-player histories interleave exactly
         '''
-        os.makedirs('history', exist_ok=True) # Ensure history directory exists
-        with open(os.path.join('history', 'game_'+str(self.game)+'_P1.txt'), 'w') as filehandle:
-            for item in self.history[0]:
-                filehandle.write('%s\n' % item)
-        with open(os.path.join('history', 'game_'+str(self.game)+'_P2.txt'), 'w') as filehandle:
-            for item in self.history[1]:
-                filehandle.write('%s\n' % item)
+        moves = []
+        for i in range(len(self.history[0])):
+            moves.append(int(self.history[0][i]))
+            if i < len(self.history[1]):
+                moves.append(int(self.history[1][i]))
+        return moves
 
     def randMove(self):
         '''
@@ -294,7 +322,7 @@ class connect4():
             if p: indices.append(i)
         if not indices: # If no possible moves, this can happen if the board is full
             return -1 # Indicate no valid move
-        return random.choice(indices) # pick a random column as the random move
+        return self.rng.choice(indices) # pick a random column as the random move
 
     def getBoard(self):
         '''
@@ -310,20 +338,10 @@ class connect4():
 
     def draw_board(self):
         '''
-        Create the GUI representation of the current board state
+        Create the GUI representation of the current board state (see gui.py)
         '''
-        for c in range(self.shape[1]):
-            for r in range(self.shape[0]):
-                pygame.draw.rect(screen, BLUE, (c*SQUARESIZE, r*SQUARESIZE+SQUARESIZE, SQUARESIZE, SQUARESIZE))
-                pygame.draw.circle(screen, BLACK, (int(c*SQUARESIZE+SQUARESIZE/2), int(r*SQUARESIZE+SQUARESIZE+SQUARESIZE/2)), RADIUS)
-
-        for c in range(self.shape[1]):
-            for r in range(self.shape[0]):
-                if self.board[r][c] == 1:
-                    pygame.draw.circle(screen, P1COLOR, (int((c)*SQUARESIZE+SQUARESIZE/2), height-int((self.shape[0]-1-r)*SQUARESIZE+SQUARESIZE/2)), RADIUS)
-                elif self.board[r][c] == 2:
-                    pygame.draw.circle(screen, P2COLOR, (int((c)*SQUARESIZE+SQUARESIZE/2), height-int((self.shape[0]-1-r)*SQUARESIZE+SQUARESIZE/2)), RADIUS)
-        pygame.display.update()
+        import gui
+        gui.draw_board(self)
 
     def play_move(self, col):
         if self.topPosition[col] >= 0:
@@ -0,0 +1,343 @@
+# gamelog.py
+'''
+Append-only binary log of finished games.
+
+All games go into a single file instead of two small text files per game.
+The file starts with a short header, followed by one record per game:
+
+    marker    2s   b'G4'
+    length    u32  size of the rest of the record in bytes
+    game      u32  game number
+    rows      u8
+    cols      u8
+    result    u8   0 tie, 1 or 2 the winner, 255 unknown
+    n_moves   u16
+    seed      i64
+    timestamp f64  when the game was recorded (unix time)
+    agents    2 x (u8 length + utf-8 name)
+    moves     n_moves columns, two per byte (4 bits each, first move in the low nibble)
+    times     n_moves x f16 think time in seconds (NaN if unknown)
+    connect   u8   pieces in a line that win (records written before it existed end
+                   at times and are connect four)
+
+Columns take 4 bits, so boards are at most 16 columns wide.
+
+Moves are stored in the order they were played, so the interleaving of the two
+players, the result and the timing survive. A sidecar index file (<log>.idx)
+holds (n, offset) pairs, n being a game's position in the log (0 the first, the
+game field is only a label and need not be unique), so single games can be
+fetched without a scan.
+
+A crash mid-write leaves a truncated record at the end of the log. Readers skip
+it, and the next append cuts it off before writing, so it never ends up in the
+middle of the file.
+
+Example:
+    python gamelog.py -convert history -log history/games.c4log
+    python gamelog.py -log history/games.c4log -summary True
+'''
+import argparse
+import glob
+import os
+import re
+import struct
+import time
+from collections import namedtuple
+from shapes import DEFAULT_CONNECT
+
+MAGIC = b'C4LOG\x01'
+MARKER = b'G4'
+RESULT_UNKNOWN = 255
+
+RECORD_HEAD = struct.Struct('<2sI')
+RECORD_FIELDS = struct.Struct('<IBBBHqd')
+INDEX_ENTRY = struct.Struct('<IQ')
+
+MAX_COLS = 16
+
+GameRecord = namedtuple('GameRecord', ['game', 'board_shape', 'moves', 'result', 'agents', 'seed', 'think_times', 'timestamp', 'connect'],
+    defaults=[DEFAULT_CONNECT])
+
+def pack_moves(moves):
+    '''
+    Pack a list of columns into bytes, 4 bits per move
+    '''
+    packed = bytearray((len(moves) + 1) // 2)
+    for i, move in enumerate(moves):
+        if not (0 <= move < 16):
+            raise ValueError(f"Column {move} does not fit in 4 bits")
+        packed[i // 2] |= move << (4 * (i % 2))
+    return bytes(packed)
+
+def unpack_moves(packed, n_moves):
+    '''
+    Inverse of pack_moves
+    '''
+    return [(packed[i // 2] >> (4 * (i % 2))) & 0xF for i in range(n_moves)]
+
+def encode_record(record):
+    '''
+    Serialize a GameRecord into the on-disk record format
+    '''
+    if record.board_shape[1] > MAX_COLS:
+        raise ValueError(f"Game logs hold boards of at most {MAX_COLS} columns, not {record.board_shape[1]}")
+    n_moves = len(record.moves)
+    think_times = list(record.think_times) if record.think_times else []
+    think_times = (think_times + [float('nan')] * n_moves)[:n_moves]
+    # f16 tops out at 65504, clamp long thinks rather than overflow to inf
+    think_times = [min(t, 65504.0) for t in think_times]
+
+    body = RECORD_FIELDS.pack(record.game, record.board_shape[0], record.board_shape[1],
+        record.result, n_moves, record.seed, record.timestamp)
+    for agent in record.agents:
+        name = agent.encode('utf-8')[:255]
+        body += struct.pack('<B', len(name)) + name
+    body += pack_moves(record.moves)
+    body += struct.pack(f'<{n_moves}e', *think_times)
+    body += struct.pack('<B', record.connect)
+    return RECORD_HEAD.pack(MARKER, len(body)) + body
+
+def decode_record(body):
+    '''
+    Parse the bytes following a record head back into a GameRecord
+    '''
+    game, rows, cols, result, n_moves, seed, timestamp = RECORD_FIELDS.unpack_from(body, 0)
+    offset = RECORD_FIELDS.size
+    agents = []
+    for _ in range(2):
+        length = body[offset]
+        agents.append(body[offset+1:offset+1+length].decode('utf-8'))
+        offset += 1 + length
+    n_bytes = (n_moves + 1) // 2
+    moves = unpack_moves(body[offset:offset+n_bytes], n_moves)
+    offset += n_bytes
+    think_times = list(struct.unpack_from(f'<{n_moves}e', body, offset))
+    offset += 2 * n_moves
+    connect = body[offset] if offset < len(body) else DEFAULT_CONNECT
+    return GameRecord(game, (rows, cols), moves, result, tuple(agents), seed, think_times, timestamp, connect)
+
+def scan_records(f, offset):
+    '''
+    Offsets of the complete records of an open log from offset on, and the
+    offset where the last of them ends (where the next record belongs)
+    '''
+    offsets = []
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    while offset + RECORD_HEAD.size <= size:
+        f.seek(offset)
+        marker, length = RECORD_HEAD.unpack(f.read(RECORD_HEAD.size))
+        end = offset + RECORD_HEAD.size + length
+        if marker != MARKER or end > size:
+            break
+        offsets.append(offset)
+        offset = end
+    return offsets, offset
+
+# path -> (log size, index size, games) after this process's last append. While both files
+# still have those sizes nobody else wrote to them, and the next append needs no checks
+_tails = {}
+
+def append_game(path, record):
+    '''
+    Append one game to the log (creating it if needed) and to its index,
+    dropping a truncated record left at the end by a crash first.
+    Returns the byte offset of the new record
+    '''
+    data = encode_record(record)
+    tail = _tails.get(path)
+    if tail is not None and os.path.exists(path) and os.path.exists(path + '.idx') \
+            and (os.path.getsize(path), os.path.getsize(path + '.idx')) == tail[:2]:
+        end, games = tail[0], tail[2]
+        with open(path, 'ab') as f:
+            f.write(data)
+        with open(path + '.idx', 'ab') as f:
+            f.write(INDEX_ENTRY.pack(games, end))
+        _tails[path] = (end + len(data), tail[1] + INDEX_ENTRY.size, games + 1)
+        return end
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    index = read_index(path) if os.path.exists(path) and os.path.getsize(path) > 0 else {}
+    with open(path, 'ab+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            f.write(MAGIC)
+            missing, end = [], len(MAGIC)
+        else:
+            # Only the records after the last indexed one need checking
+            start = index[len(index) - 1] if index else len(MAGIC)
+            found, end = scan_records(f, start)
+            if index and found[:1] != [start]:
+                # The index points past what is in the log: index the whole log again
+                index = {}
+                found, end = scan_records(f, len(MAGIC))
+            missing = found[1:] if index else found
+            f.truncate(end)
+        f.write(data)
+    with open(path + '.idx', 'ab') as f:
+        # Cut off a half-written entry too, and index records whose entry never got written
+        f.truncate(len(index) * INDEX_ENTRY.size)
+        for n, offset in enumerate(missing + [end], len(index)):
+            f.write(INDEX_ENTRY.pack(n, offset))
+    games = len(index) + len(missing) + 1
+    _tails[path] = (end + len(data), games * INDEX_ENTRY.size, games)
+    return end
+
+def iter_games(path, with_offsets=False):
+    '''
+    Stream every game in the log without loading the file into memory.
+    Yields GameRecords, or (offset, GameRecord) pairs if with_offsets is set.
+    A truncated final record (eg from a crash mid-write) is silently skipped
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game log")
+        while True:
+            offset = f.tell()
+            head = f.read(RECORD_HEAD.size)
+            if len(head) < RECORD_HEAD.size:
+                return
+            marker, length = RECORD_HEAD.unpack(head)
+            if marker != MARKER:
+                raise ValueError(f"Corrupt record at offset {offset} in {path}")
+            body = f.read(length)
+            if len(body) < length:
+                return
+            record = decode_record(body)
+            yield (offset, record) if with_offsets else record
+
+def read_index(path):
+    '''
+    Load the sidecar index as a dict of position in the log -> offset.
+    The index is rebuilt from the log if it is missing or isn't numbered in order
+    (indexes of older versions were keyed by the game field)
+    '''
+    index_path = path + '.idx'
+    if not os.path.exists(index_path):
+        return rebuild_index(path)
+    index = {}
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    for n, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+        if n != len(index):
+            return rebuild_index(path)
+        index[n] = offset
+    return index
+
+def rebuild_index(path):
+    '''
+    Scan the log and rewrite its index file
+    '''
+    index = {}
+    with open(path + '.idx', 'wb') as f:
+        for n, (offset, record) in enumerate(iter_games(path, with_offsets=True)):
+            index[n] = offset
+            f.write(INDEX_ENTRY.pack(n, offset))
+    return index
+
+def read_game(path, n, index=None):
+    '''
+    Fetch the n-th game of the log (0 the first) using the index
+    '''
+    if index is None:
+        index = read_index(path)
+    if n not in index:
+        raise KeyError(f"{path} has no game {n}")
+    with open(path, 'rb') as f:
+        f.seek(index[n])
+        marker, length = RECORD_HEAD.unpack(f.read(RECORD_HEAD.size))
+        if marker != MARKER:
+            raise ValueError(f"Index entry {n} does not point at a record, try rebuild_index")
+        return decode_record(f.read(length))
+
+def replay_result(moves, board_shape=(6,7), connect=DEFAULT_CONNECT):
+    '''
+    Replay a move list and return the winner, 0 for a tie or
+    RESULT_UNKNOWN if the game was never finished
+    '''
+    from connect4 import connect4
+    from players import connect4Player
+
+    env = connect4(connect4Player(1), connect4Player(2), board_shape=board_shape, connect=connect)
+    for move in moves:
+        player = env.turnPlayer.position
+        env.play_move(move)
+        if env.gameOver(move, player):
+            return player if env.is_winner else 0
+    return RESULT_UNKNOWN
+
+def iter_text_history(directory, board_shape=(6,7)):
+    '''
+    Stream the old game_N_P1.txt / game_N_P2.txt files written by
+    connect4.saveGame as GameRecords, in game number order.
+    The text format has no result, agents, seed or timing, so the result is
+    recovered by replaying the game and the rest is left empty
+    '''
+    pattern = re.compile(r'game_(\d+)_P1\.txt$')
+    files = sorted(glob.glob(os.path.join(directory, 'game_*_P1.txt')),
+        key=lambda name: int(pattern.search(name).group(1)) if pattern.search(name) else -1)
+    for p1_file in files:
+        match = pattern.search(p1_file)
+        if not match:
+            continue
+        p2_file = p1_file[:-len('P1.txt')] + 'P2.txt'
+        with open(p1_file) as f:
+            p1_moves = [int(line) for line in f if line.strip()]
+        p2_moves = []
+        if os.path.exists(p2_file):
+            with open(p2_file) as f:
+                p2_moves = [int(line) for line in f if line.strip()]
+
+        # Player 1 always moves first, so the two lists interleave exactly
+        moves = []
+        for i in range(len(p1_moves)):
+            moves.append(p1_moves[i])
+            if i < len(p2_moves):
+                moves.append(p2_moves[i])
+
+        yield GameRecord(int(match.group(1)), board_shape, moves, replay_result(moves, board_shape),
+            ('', ''), 0, [], os.path.getmtime(p1_file))
+
+def convert_text_history(directory, path, board_shape=(6,7)):
+    '''
+    Append every game from an old text history directory to the binary log.
+    Returns the number of games converted
+    '''
+    converted = 0
+    for record in iter_text_history(directory, board_shape):
+        append_game(path, record)
+        converted += 1
+    return converted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or build binary game logs')
+    parser.add_argument('-log', default=os.path.join('history', 'games.c4log'), type=str, help='Path of the game log')
+    parser.add_argument('-convert', default='', type=str, help='Directory of old game_N_P1.txt/game_N_P2.txt files to append to the log')
+    parser.add_argument('-w', default=6, type=int, help='Rows of the converted games')
+    parser.add_argument('-l', default=7, type=int, help='Columns of the converted games')
+    parser.add_argument('-summary', default='True', type=str, help='Print a summary of the log')
+    parser.add_argument('-reindex', default='False', type=str, help='Rebuild the index file from the log')
+    args = parser.parse_args()
+
+    bool_dict = {'True': True, 'False': False}
+
+    if args.convert:
+        start = time.time()
+        n = convert_text_history(args.convert, args.log, (args.w, args.l))
+        print(f"Converted {n} games from {args.convert} in {round(time.time() - start, 2)}s")
+
+    if bool_dict[args.reindex]:
+        print(f"Indexed {len(rebuild_index(args.log))} games")
+
+    if bool_dict[args.summary] and os.path.exists(args.log):
+        games = 0
+        moves = 0
+        results = {0: 0, 1: 0, 2: 0, RESULT_UNKNOWN: 0}
+        for record in iter_games(args.log):
+            games += 1
+            moves += len(record.moves)
+            results[record.result] = results.get(record.result, 0) + 1
+        size = os.path.getsize(args.log)
+        print(f"{args.log}: {games} games, {moves} moves, {size} bytes ({size / max(games, 1):.1f} bytes/game)")
+        print(f"Player 1 wins: {results[1]} | Player 2 wins: {results[2]} | Ties: {results[0]} | Unknown: {results[RESULT_UNKNOWN]}")
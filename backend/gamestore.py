@@ -0,0 +1,144 @@
+# gamestore.py
+'''
+Durable store for the games app.py is serving, so a restart or a rolling
+deploy doesn't drop games in progress.
+
+Each game is one row in an embedded SQLite database keyed by game id, holding
+the move list, the opponent type and difficulty, and timestamps. Writes never touch the disk on
+the request path: save() only records the latest state in memory, and a
+background write-behind thread commits everything pending in one transaction
+every flush_interval seconds. Several moves in the same game between two
+flushes collapse into a single row write. Until that commit finishes, load()
+answers from the rows in memory, so a reader never sees the older row on disk.
+'''
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    moves TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    difficulty TEXT NOT NULL DEFAULT 'hard',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+'''
+
+FIELDS = ('moves', 'opponent', 'difficulty', 'created', 'updated')
+
+class GameStore():
+    def __init__(self, path, flush_interval=0.05):
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # One connection for reads on request threads, the writer thread opens its own
+        self.read_conn = sqlite3.connect(path, check_same_thread=False)
+        self.read_conn.execute('PRAGMA journal_mode=WAL')
+        self.read_conn.execute(SCHEMA)
+        # Stores written before difficulties existed lack the column
+        columns = [row[1] for row in self.read_conn.execute('PRAGMA table_info(games)')]
+        if 'difficulty' not in columns:
+            self.read_conn.execute("ALTER TABLE games ADD COLUMN difficulty TEXT NOT NULL DEFAULT 'hard'")
+        self.read_conn.commit()
+        self.read_lock = threading.Lock()
+
+        self.pending = {} # game_id -> row waiting to be written (None means delete)
+        self.inflight = {} # the batch being committed, still what load() sees until it is on disk
+        self.pending_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.writes = 0 # rows committed, for monitoring
+        self.flushes = 0
+
+        self.writer = threading.Thread(target=self._write_loop, name='gamestore-writer', daemon=True)
+        self.writer.start()
+
+    def save(self, game_id, moves, opponent, difficulty, created, updated=None):
+        '''
+        Queue the current state of a game. Returns immediately
+        '''
+        row = (game_id, moves, opponent, difficulty, created, updated if updated is not None else time.time())
+        with self.pending_lock:
+            self.pending[game_id] = row
+        self.wake.set()
+
+    def delete(self, game_id):
+        with self.pending_lock:
+            self.pending[game_id] = None
+        self.wake.set()
+
+    def load(self, game_id):
+        '''
+        Return {'moves', 'opponent', 'difficulty', 'created', 'updated'} for a game, or None.
+        State that is still waiting to be written wins over what is on disk
+        '''
+        with self.pending_lock:
+            for rows in (self.pending, self.inflight):
+                if game_id in rows:
+                    row = rows[game_id]
+                    return None if row is None else dict(zip(FIELDS, row[1:]))
+        with self.read_lock:
+            row = self.read_conn.execute(f'SELECT {", ".join(FIELDS)} FROM games WHERE game_id = ?', (game_id,)).fetchone()
+        return None if row is None else dict(zip(FIELDS, row))
+
+    def flush(self, conn=None):
+        '''
+        Write everything pending in one transaction. Called by the writer thread,
+        and at shutdown so the last moves aren't lost
+        '''
+        with self.pending_lock:
+            batch, self.pending = self.pending, {}
+            self.inflight = batch
+        if not batch:
+            return 0
+
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                upserts = [row for row in batch.values() if row is not None]
+                deletes = [(game_id,) for game_id, row in batch.items() if row is None]
+                conn.executemany(f'INSERT OR REPLACE INTO games (game_id, {", ".join(FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)', upserts)
+                conn.executemany('DELETE FROM games WHERE game_id = ?', deletes)
+        except sqlite3.Error:
+            # Put the batch back (newer saves win) so it is retried on the next flush
+            with self.pending_lock:
+                for game_id, row in batch.items():
+                    self.pending.setdefault(game_id, row)
+            raise
+        finally:
+            with self.pending_lock:
+                self.inflight = {}
+            if own_conn:
+                conn.close()
+        self.writes += len(batch)
+        self.flushes += 1
+        return len(batch)
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            while not self.stopped:
+                self.wake.wait()
+                # Give other moves a moment to pile up so they share one transaction
+                time.sleep(self.flush_interval)
+                self.wake.clear()
+                try:
+                    self.flush(conn)
+                except sqlite3.Error as e:
+                    print(f"Game store flush failed, will retry: {e}")
+        finally:
+            conn.close()
+
+    def close(self):
+        self.stopped = True
+        self.wake.set()
+        self.writer.join(timeout=5)
+        self.flush()
+        with self.read_lock:
+            self.read_conn.close()
@@ -0,0 +1,136 @@
+# gui.py
+'''
+Optional pygame front end for connect4.
+
+Nothing in the game rules or the AI agents imports this module; connect4 loads it
+lazily when a game is created with visualize=True, and humanGUI lives here so that
+servers, tournaments and worker processes never pay for importing pygame.
+'''
+import math
+import sys
+import pygame
+from players import connect4Player
+
+SQUARESIZE = 100
+BLUE = (0,0,255)
+BLACK = (0,0,0)
+WHITE = (255,255,255)
+RADIUS = int(SQUARESIZE/2 - 5)
+FPS = 60 # cap on redraws per second while the mouse is moving
+
+COLORS = {1: (255,0,0), 2: (255,255,0)}
+CVD_COLORS = {1: (227, 60, 239), 2: (0, 255, 0)} # colorblind-friendly palette
+
+screen = None # created by init_display
+width = 0
+height = 0
+clock = None
+drawn = None # copy of the board as it is currently on screen, for incremental redraws
+hover_rect = None # area of the hover piece currently on screen
+
+def piece_color(player, cvd_mode=False):
+	return (CVD_COLORS if cvd_mode else COLORS)[player]
+
+def init_display(board_shape):
+	'''
+	Open the window, sized for the board plus one row for the hover piece
+	'''
+	global screen, width, height, clock, drawn, hover_rect
+	width = board_shape[1] * SQUARESIZE
+	height = (board_shape[0]+1) * SQUARESIZE
+	pygame.init()
+	screen = pygame.display.set_mode((width, height))
+	clock = pygame.time.Clock()
+	drawn = None
+	hover_rect = None
+
+def handle_quit(event):
+	if event.type == pygame.QUIT:
+		pygame.quit()
+		sys.exit()
+
+def pump_events():
+	'''
+	Keep the window responsive between AI turns
+	'''
+	for event in pygame.event.get():
+		handle_quit(event)
+
+def wait_for_close():
+	'''
+	Keep showing the final board until the window is closed.
+	Blocks on the event queue instead of polling, so an idle window uses no CPU
+	'''
+	while True:
+		handle_quit(pygame.event.wait())
+
+def cell_rect(r, c):
+	return pygame.Rect(c*SQUARESIZE, r*SQUARESIZE+SQUARESIZE, SQUARESIZE, SQUARESIZE)
+
+def draw_cell(env, r, c):
+	pygame.draw.rect(screen, BLUE, cell_rect(r, c))
+	color = piece_color(env.board[r][c], env.cvd_mode) if env.board[r][c] in (1, 2) else BLACK
+	pygame.draw.circle(screen, color, (int(c*SQUARESIZE+SQUARESIZE/2), int(r*SQUARESIZE+SQUARESIZE+SQUARESIZE/2)), RADIUS)
+
+def draw_board(env):
+	'''
+	Create the GUI representation of the current board state.
+	The whole board is drawn once, after that only the cells that changed since the
+	last call (normally just the dropped piece) are redrawn and pushed to the display
+	'''
+	global drawn
+	if drawn is None or drawn.shape != env.board.shape:
+		for c in range(env.shape[1]):
+			for r in range(env.shape[0]):
+				draw_cell(env, r, c)
+		pygame.display.update()
+	else:
+		dirty = []
+		for r, c in zip(*(env.board != drawn).nonzero()):
+			draw_cell(env, r, c)
+			dirty.append(cell_rect(r, c))
+		if dirty:
+			pygame.display.update(dirty)
+	drawn = env.board.copy()
+
+def draw_hover(posx, color):
+	'''
+	Move the hover piece above the board, redrawing only its old and new position
+	'''
+	global hover_rect
+	dirty = []
+	if hover_rect is not None:
+		pygame.draw.rect(screen, BLACK, hover_rect)
+		dirty.append(hover_rect)
+	hover_rect = pygame.draw.circle(screen, color, (posx, int(SQUARESIZE/2)), RADIUS)
+	dirty.append(hover_rect)
+	pygame.display.update(dirty)
+
+class humanGUI(connect4Player):
+	'''
+	Human player where input is collected from the GUI.
+	Sleeps on the event queue between inputs rather than spinning
+	'''
+	def play(self, env, move_dict: dict) -> None:
+		done = False
+		while(not done):
+			event = pygame.event.wait()
+			handle_quit(event)
+
+			if event.type == pygame.MOUSEMOTION:
+				# Only the latest position matters, drop the motion events queued behind it
+				pending = pygame.event.get(pygame.MOUSEMOTION)
+				if pending:
+					event = pending[-1]
+				if screen: # Ensure screen is initialized
+					draw_hover(event.pos[0], piece_color(self.position, self.cvd_mode))
+				clock.tick(FPS)
+
+			if event.type == pygame.MOUSEBUTTONDOWN:
+				posx = event.pos[0]
+				col = int(math.floor(posx/SQUARESIZE))
+				if 0 <= col < env.shape[1] and env.topPosition[col] >= 0: # Validate move for GUI too
+					move_dict['move'] = col
+					done = True
+				else:
+					print("Invalid GUI move. Column is full or out of bounds.")
@@ -0,0 +1,307 @@
+# loadtest.py
+'''
+Load generator for the Flask backend (app.py).
+
+Simulates concurrent players against a server, each in its own game: reset,
+pick an opponent, then alternate /move and /ai-move with a think time before
+every human move until the game ends. It can also replay a request log, either
+one it recorded itself (-record) or one recorded by a real server started with
+C4_REQUEST_LOG=<path>; requests of each game are replayed in order, with the
+original spacing divided by -speed. The AI may not answer as it did when the
+log was recorded (its budget depends on load), so a replayed human move can hit
+a full column or the wrong turn; those show up as errors.
+
+Reports throughput and p50/p95/p99 latency per route and, for AI moves, per AI type.
+By default a private server is started on -port with its own game store.
+
+Examples:
+    python loadtest.py -users 16 -games 2 -opponents alphaBetaAI,monteCarloAI
+    python loadtest.py -users 8 -record loadtest.jsonl -server_log server.jsonl
+    python loadtest.py -replay server.jsonl -speed 2
+    python loadtest.py -start False -url http://localhost:5001 -users 4
+'''
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+def percentile(sorted_values, q):
+    '''
+    Nearest-rank percentile of an already sorted list
+    '''
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class Stats():
+    '''
+    Latency samples of every request, shared by all simulated users.
+    Optionally writes each request as a request log line that -replay accepts
+    '''
+    def __init__(self, record_path=None):
+        self.samples = [] # (route, ai type, status, latency)
+        self.lock = threading.Lock()
+        self.games_finished = 0
+        self.elapsed = 0.0
+        self.record = open(record_path, 'w', buffering=1) if record_path else None
+
+    def add(self, entry):
+        with self.lock:
+            self.samples.append((entry['path'], entry['ai_type'], entry['status'], entry['latency']))
+            if self.record is not None:
+                self.record.write(json.dumps(entry) + '\n')
+
+    def game_finished(self):
+        with self.lock:
+            self.games_finished += 1
+
+    def close(self):
+        if self.record is not None:
+            self.record.close()
+
+    def table(self, title, groups, elapsed):
+        lines = [f"{title:<16}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name in sorted(groups):
+            samples = groups[name]
+            latencies = sorted(latency * 1000 for _, latency in samples)
+            errors = sum(1 for status, _ in samples if status >= 400)
+            lines.append(f"{name:<16}{len(samples):>10}{errors:>8}{len(samples) / elapsed:>9.2f}"
+                f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}{latencies[-1]:>10.1f}")
+        return '\n'.join(lines)
+
+    def report(self, elapsed):
+        by_route = defaultdict(list)
+        by_ai = defaultdict(list)
+        for route, ai_type, status, latency in self.samples:
+            by_route[route].append((status, latency))
+            if route == '/ai-move':
+                by_ai[ai_type or 'unknown'].append((status, latency))
+        by_route['all'] = [(status, latency) for _, _, status, latency in self.samples]
+
+        lines = [f"{len(self.samples)} requests, {self.games_finished} games finished in {elapsed:.1f}s "
+            f"({len(self.samples) / elapsed:.1f} req/s, {self.games_finished / elapsed:.2f} games/s)", '',
+            self.table('route', by_route, elapsed)]
+        if by_ai:
+            lines += ['', self.table('/ai-move by AI', by_ai, elapsed)]
+        return '\n'.join(lines)
+
+class Client():
+    '''
+    One simulated user: a keep-alive HTTP connection that times and records every request
+    '''
+    def __init__(self, url, stats, client_id, timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.stats = stats
+        self.client_id = client_id
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, args=None, game_id=None, ai_type=None):
+        '''
+        Send one request and return (status, decoded JSON body or None).
+        Status 0 means the request failed without a response
+        '''
+        url = path + ('?' + urlencode(args) if args else '')
+        headers = {'X-Client-Id': self.client_id}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        start = time.time()
+        status, data = 0, None
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self.conn.request(method, url, payload, headers)
+                response = self.conn.getresponse()
+                status, raw = response.status, response.read()
+                if response.will_close:
+                    self.close()
+                data = json.loads(raw) if raw else None
+                break
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # The server dropped the idle keep-alive connection, retry once on a fresh one
+                self.close()
+                if attempt:
+                    status = 0
+            except ValueError:
+                break
+
+        self.stats.add({'time': start, 'method': method, 'path': path, 'args': args or {}, 'body': body,
+            'client': self.client_id, 'game_id': game_id, 'ai_type': ai_type, 'status': status, 'latency': time.time() - start})
+        return status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def simulate_user(url, stats, user, games, opponents, difficulty, think_time, seed, stop_at):
+    '''
+    Play games one after the other as a human picking random legal columns
+    '''
+    rng = random.Random(seed + user)
+    client = Client(url, stats, f'loadtest-{user}')
+    try:
+        for n in range(games):
+            if time.time() >= stop_at:
+                break
+            game_id = f'loadtest-{seed}-{user}-{n}'
+            ai_type = opponents[(user + n) % len(opponents)]
+            client.request('POST', '/reset', {'game_id': game_id}, game_id=game_id, ai_type=ai_type)
+            status, data = client.request('POST', '/set-opponent', {'game_id': game_id, 'ai_type': ai_type, 'difficulty': difficulty},
+                game_id=game_id, ai_type=ai_type)
+            if status != 200:
+                continue
+            board = data['board']
+
+            while time.time() < stop_at:
+                time.sleep(rng.uniform(*think_time))
+                valid = [col for col, cell in enumerate(board[0]) if cell == 0]
+                if not valid:
+                    break
+                status, data = client.request('POST', '/move', {'game_id': game_id, 'column': rng.choice(valid)},
+                    game_id=game_id, ai_type=ai_type)
+                if status != 200:
+                    break
+                if data['game_over']:
+                    stats.game_finished()
+                    break
+                status, data = client.request('GET', '/ai-move', args={'game_id': game_id}, game_id=game_id, ai_type=ai_type)
+                if status == 429:
+                    time.sleep(data.get('retry_after', 1))
+                    status, data = client.request('GET', '/ai-move', args={'game_id': game_id}, game_id=game_id, ai_type=ai_type)
+                if status != 200:
+                    break
+                if data['game_over']:
+                    stats.game_finished()
+                    break
+                board = data['board']
+    finally:
+        client.close()
+
+def load_request_log(path):
+    '''
+    Read a request log and group it per (client, game), keeping each group in order
+    '''
+    sessions = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                sessions[(entry.get('client'), entry.get('game_id'))].append(entry)
+    return [sorted(entries, key=lambda e: e['time']) for entries in sessions.values()]
+
+def replay_session(url, stats, entries, log_start, run_start, speed, index):
+    '''
+    Send one game's requests at their recorded offsets (divided by speed), never out of order
+    '''
+    client = Client(url, stats, entries[0].get('client') or f'replay-{index}')
+    try:
+        for entry in entries:
+            delay = run_start + (entry['time'] - log_start) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            client.request(entry['method'], entry['path'], entry.get('body'), entry.get('args'),
+                game_id=entry.get('game_id'), ai_type=entry.get('ai_type'))
+    finally:
+        client.close()
+
+def start_server(port, server_log=None):
+    '''
+    Start app.py in a subprocess on port with a throwaway game store and wait until it answers
+    '''
+    store_dir = tempfile.mkdtemp(prefix='c4-loadtest-')
+    env = dict(os.environ, C4_GAME_STORE=os.path.join(store_dir, 'games.db'))
+    if server_log:
+        env['C4_REQUEST_LOG'] = os.path.abspath(server_log)
+    backend = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, '-c', f'import app; app.app.run(host="127.0.0.1", port={port}, threaded=True)'],
+        cwd=backend, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/status?game_id=loadtest-ready')
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not start within 30s")
+
+def run(url, users=8, games=1, opponents=('alphaBetaAI',), difficulty='hard', think_time=(0.5, 2.0), duration=float('inf'),
+        replay=None, speed=1.0, record=None, seed=0):
+    '''
+    Run a simulation (or a replay when replay is a request log path) and return the Stats
+    '''
+    stats = Stats(record)
+    start = time.time()
+    if replay:
+        sessions = load_request_log(replay)
+        log_start = min(entries[0]['time'] for entries in sessions)
+        threads = [threading.Thread(target=replay_session, args=(url, stats, entries, log_start, start, speed, i))
+            for i, entries in enumerate(sessions)]
+    else:
+        threads = [threading.Thread(target=simulate_user, args=(url, stats, user, games, list(opponents), difficulty, think_time, seed, start + duration))
+            for user in range(users)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.elapsed = time.time() - start
+    stats.close()
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the Connect 4 backend')
+    parser.add_argument('-users', default=8, type=int, help='Concurrent simulated players')
+    parser.add_argument('-games', default=1, type=int, help='Games each player plays')
+    parser.add_argument('-opponents', default='alphaBetaAI', type=str, help='Comma-separated AI types, assigned round-robin to games')
+    parser.add_argument('-difficulty', default='hard', type=str, help='Difficulty of every game')
+    parser.add_argument('-think', default='0.5,2.0', type=str, help='Min,max seconds a player thinks before each move')
+    parser.add_argument('-duration', default=0, type=float, help='Stop starting new moves after this many seconds (0 runs every game to the end)')
+    parser.add_argument('-seed', default=0, type=int, help='Seed for the simulated players')
+    parser.add_argument('-replay', default='', type=str, help='Request log to replay instead of simulating players')
+    parser.add_argument('-speed', default=1.0, type=float, help='Replay speed-up factor')
+    parser.add_argument('-record', default='', type=str, help='Write every request sent to this request log')
+    parser.add_argument('-start', default='True', type=str, help='Start a private server instead of using -url')
+    parser.add_argument('-port', default=5051, type=int, help='Port of the private server')
+    parser.add_argument('-server_log', default='', type=str, help='Have the private server record its own request log here')
+    parser.add_argument('-url', default='http://127.0.0.1:5001', type=str, help='Server to test when -start is False')
+    args = parser.parse_args()
+
+    bool_dict = {'True': True, 'False': False}
+    server = None
+    url = args.url
+    if bool_dict[args.start]:
+        server = start_server(args.port, args.server_log or None)
+        url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        think_time = tuple(float(t) for t in args.think.split(','))
+        stats = run(url, args.users, args.games, args.opponents.split(','), args.difficulty, think_time,
+            args.duration or float('inf'), args.replay or None, args.speed, args.record or None, args.seed)
+        print(stats.report(stats.elapsed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
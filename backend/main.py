@@ -1,14 +1,15 @@
 # main.py
 import argparse
 from connect4 import connect4
-from players import humanGUI, stupidAI, randomAI, humanConsole, minimaxAI, alphaBetaAI
-from montecarlo import monteCarloAI
+from players import stupidAI, randomAI, humanConsole, minimaxAI, alphaBetaAI
+from montecarlo import monteCarloAI, mctsAI
 
 parser = argparse.ArgumentParser(description='Run programming assignment 2')
 parser.add_argument('-w', default=6, type=int, help='Rows of game')
 parser.add_argument('-l', default=7, type=int, help='Columns of game')
-parser.add_argument('-p1', default='humanGUI', type=str, help='Player 1 agent. Use any of the following: [humanGUI, humanConsole, stupidAI, randomAI, monteCarloAI, minimaxAI, alphaBetaAI]')
-parser.add_argument('-p2', default='humanGUI', type=str, help='Player 2 agent. Use any of the following: [humanGUI, humanConsole, stupidAI, randomAI, monteCarloAI, minimaxAI, alphaBetaAI]')
+parser.add_argument('-n', default=4, type=int, help='Pieces in a line that win (connect-N)')
+parser.add_argument('-p1', default='humanGUI', type=str, help='Player 1 agent. Use any of the following: [humanGUI, humanConsole, stupidAI, randomAI, monteCarloAI, mctsAI, minimaxAI, alphaBetaAI]')
+parser.add_argument('-p2', default='humanGUI', type=str, help='Player 2 agent. Use any of the following: [humanGUI, humanConsole, stupidAI, randomAI, monteCarloAI, mctsAI, minimaxAI, alphaBetaAI]')
 parser.add_argument('-seed', default=0, type=int, help='Seed for random algorithms')
 parser.add_argument('-visualize', default='True', type=str, help='Use GUI')
 parser.add_argument('-verbose', default='True', type=str, help='Print boards to shell')
@@ -25,6 +26,7 @@ args = parser.parse_args()
 
 w = args.w
 l = args.l
+n = args.n
 
 seed = args.seed
 visualize = bool_dict[args.visualize]
@@ -54,26 +56,33 @@ print_time_logs = bool_dict[args.print_time_logs] # Ensure this is also converte
 
 
 agents = {
-	'humanGUI': humanGUI, 
 	'humanConsole': humanConsole, 
 	'stupidAI': stupidAI, 
 	'randomAI': randomAI, 
 	'monteCarloAI': monteCarloAI, 
+	'mctsAI': mctsAI, 
 	'minimaxAI': minimaxAI, 
 	'alphaBetaAI': alphaBetaAI
 	}
 
+def get_agent(name):
+	# humanGUI is loaded on demand so headless games never import pygame
+	if name == 'humanGUI':
+		from gui import humanGUI
+		return humanGUI
+	return agents.get(name)
+
 if __name__ == '__main__':
 
-	player1_agent_class = agents.get(args.p1)
-	player2_agent_class = agents.get(args.p2)
+	player1_agent_class = get_agent(args.p1)
+	player2_agent_class = get_agent(args.p2)
 
 	if player1_agent_class is None:
 		print(f"Error: Player 1 agent '{args.p1}' not found. Using humanGUI as default.")
-		player1_agent_class = humanGUI
+		player1_agent_class = get_agent('humanGUI')
 	if player2_agent_class is None:
 		print(f"Error: Player 2 agent '{args.p2}' not found. Using humanGUI as default.")
-		player2_agent_class = humanGUI
+		player2_agent_class = get_agent('humanGUI')
 
 	player1 = player1_agent_class(1, seed, cvd_mode)
 	player2 = player2_agent_class(2, seed, cvd_mode)
@@ -87,6 +96,7 @@ if __name__ == '__main__':
 		time_limit=time_limit, 
 		verbose=verbose, 
 		CVDMode=cvd_mode, 
-		print_time_logs=print_time_logs
+		print_time_logs=print_time_logs,
+		connect=n
 	)
 	c4.play()
\ No newline at end of file
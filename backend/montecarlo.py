@@ -1,8 +1,13 @@
 # montecarlo.py
 import numpy as np
-import random
+import math
+import time
+import tablebase
+from budgets import SIMULATION_COST
+from streams import RandomStream
 from players import connect4Player
 from connect4 import connect4
+from search import Search, Position
 from copy import deepcopy
 
 class monteCarloAI(connect4Player):
@@ -10,11 +15,32 @@ class monteCarloAI(connect4Player):
 	For each legal first_move, monteCarloAI will simulate many random games
 	starting from that legal move where each player plays random moves until the game is over.
 	monteCarloAI will keep track of which first_move lead to the most wins and play that move
+
+	value_mode picks how a move is scored:
+		'plain'  total wins minus losses of the games that started with it
+		'amaf'   all moves as first: every column the agent played anywhere in a
+		         random game shares its result, not only the first move
+		'rave'   the plain mean blended with the AMAF mean, leaning on AMAF while a
+		         move has few games of its own: beta = sqrt(rave_k / (3 n + rave_k))
 	'''
+	VALUE_MODES = ('plain', 'amaf', 'rave')
+
+	def __init__(self, position, seed=0, CVDMode=False):
+		super().__init__(position, seed, CVDMode)
+		self.value_mode = 'rave'
+		self.rave_k = 300 # games after which a move's own mean and its AMAF mean weigh the same
+		# Endgame tablebase: a random game that reaches a position it holds ends with the exact result
+		self.tablebase_path = tablebase.DEFAULT_PATH
+		self.endgame = None
 
 	def play(self, env: connect4, move_dict: dict) -> None:
 
-		random.seed(self.seed)
+		if self.value_mode not in self.VALUE_MODES:
+			raise ValueError(f"Unknown value_mode {self.value_mode!r}, use one of {self.VALUE_MODES}")
+		self.rng = self.move_stream(env)
+		self.nodes = 0
+		start_time = time.time()
+		self.endgame = self.load_endgame(env)
 
 		# Create a deepcopy of the environment for simulation
 		# The original env should not be modified by the AI's internal simulations.
@@ -34,19 +60,31 @@ class monteCarloAI(connect4Player):
 		# Init fitness trackers to track which first_move lead to the most wins
 		# Size 7 for 7 columns in Connect 4
 		vs = np.zeros(sim_env.shape[1])
+		# Games started with each column, and AMAF games / results of every column the agent played
+		ns = np.zeros(sim_env.shape[1], dtype=np.int32)
+		amaf_ns = np.zeros(sim_env.shape[1], dtype=np.int32)
+		amaf_vs = np.zeros(sim_env.shape[1])
+		played_before = len(sim_env.history[self.position-1])
 
 		counter = 0
+		trace = self.begin_trace(env)
 
 		# Number of simulations to try and run before reaching time limit
-		num_sims = 1001 # This is a target, actual number might be less due to time limits.
+		# This is a target, actual number might be less due to time limits. A budget replaces it exactly
+		num_sims = self.budget if self.budget is not None else 1001
 
 		save_increment = 50
 
 		# Simulate
 		while counter < num_sims: # Loop until target simulations or time limit (handled externally)
+			# The server caps the time per move when it is overloaded
+			if self.time_cap is not None and counter > 0 and time.time() - start_time > self.time_cap:
+				break
 
 			# Pick a random first_move from available legal moves
-			first_move = random.choice(indices)
+			first_move = self.rng.choice(indices)
+
+			sim_start = time.perf_counter() if trace is not None else 0
 
 			# Create a fresh environment for each simulation starting from the chosen first_move
 			current_sim_env = deepcopy(sim_env)
@@ -62,31 +100,70 @@ class monteCarloAI(connect4Player):
 				turnout = self.playRandomGame(current_sim_env, 3 - self.position) # Opponent plays next
 
 				# Track who won the random game
-				if turnout == self.position:
-					vs[first_move] += 1
-				elif turnout != 0: # Opponent won
-					vs[first_move] -= 1
-				
+				result = 1 if turnout == self.position else (0 if turnout == 0 else -1)
+				vs[first_move] += result
+				ns[first_move] += 1
+				if self.value_mode != 'plain':
+					# Every column the agent played in this game, once each
+					played = np.unique(current_sim_env.history[self.position-1][played_before:])
+					amaf_ns[played] += 1
+					amaf_vs[played] += result
+
 				counter += 1 # Increment counter only if a valid simulation was performed
+				self.nodes = counter
+				if trace is not None:
+					length = len(current_sim_env.history[0]) + len(current_sim_env.history[1]) - len(sim_env.history[0]) - len(sim_env.history[1])
+					trace.simulation(first_move, result, 1, length, 1, time.perf_counter() - sim_start)
 
 			# Every save_increment games, record the best move so far
 			# (in case the time limit gets reach before while loop exits)
 			if counter % save_increment == 0 and counter > 0: # Ensure counter is not 0 for modulo
 				# Best move is the first_move that accumulated the most random wins
-				# Handle cases where all scores are 0 (e.g., if no wins yet)
-				if np.max(vs) == np.min(vs) and np.max(vs) == 0:
-					move_dict['move'] = random.choice(indices) # Pick a random move if all scores are zero
-				else:
-					# To break ties consistently, select the first occurrence of the max value
-					best_moves = np.where(vs == np.max(vs))[0]
-					move_dict['move'] = random.choice(best_moves) # Pick randomly among best moves
+				move_dict['move'] = self.pick(indices, self.move_values(vs, ns, amaf_vs, amaf_ns, indices))
 		
 		# Final best move selection
-		if np.max(vs) == np.min(vs) and np.max(vs) == 0:
-			move_dict['move'] = random.choice(indices) # If all scores are still zero after all simulations
+		move_dict['move'] = self.pick(indices, self.move_values(vs, ns, amaf_vs, amaf_ns, indices))
+		if trace is not None:
+			trace.finish(move_dict['move'])
+
+	def move_stream(self, env):
+		'''
+		A fresh stream for every move, keyed by the ply, so a position is always played out the same way
+		'''
+		return RandomStream(self.seed, self.position, len(env.history[0]) + len(env.history[1]))
+
+	def load_endgame(self, env):
+		'''
+		The tablebase at tablebase_path if there is one for this board shape, else None
+		'''
+		endgame = tablebase.load(self.tablebase_path)
+		return endgame if endgame is not None and endgame.shape == tuple(env.shape) and endgame.connect == env.connect else None
+
+	def move_values(self, vs, ns, amaf_vs, amaf_ns, indices):
+		'''
+		Score of every column under value_mode (only legal columns count)
+		'''
+		if self.value_mode == 'plain':
+			values = vs
 		else:
-			best_moves = np.where(vs == np.max(vs))[0]
-			move_dict['move'] = random.choice(best_moves) # Pick randomly among best moves
+			amaf = amaf_vs / np.maximum(amaf_ns, 1)
+			if self.value_mode == 'amaf':
+				values = amaf
+			else:
+				beta = np.sqrt(self.rave_k / (3 * ns + self.rave_k)) if self.rave_k > 0 else np.zeros(len(ns))
+				values = (1 - beta) * vs / np.maximum(ns, 1) + beta * amaf
+		legal = np.full(len(values), -np.inf)
+		legal[indices] = values[indices]
+		return legal
+
+	def pick(self, indices, values):
+		'''
+		A random one of the best columns, or of every legal column while all scores are still zero
+		'''
+		if np.max(values[indices]) == np.min(values[indices]) and np.max(values[indices]) == 0:
+			return self.rng.choice(indices)
+		best_moves = np.where(values == np.max(values))[0]
+		return int(self.rng.choice(best_moves)) # Pick randomly among best moves
 
 
 	def playRandomGame(self, env: connect4, current_player: int):
@@ -97,9 +174,16 @@ class monteCarloAI(connect4Player):
 		'''
 		switch = {1:2,2:1}
 		player = current_player
+		empties = int((env.topPosition + 1).sum())
 
 		# Play until game is over
 		while True:
+			# Close enough to the end for the tablebase: it knows how perfect play ends
+			if self.endgame is not None and empties <= self.endgame.k:
+				value = self.endgame.probe(env.board, env.topPosition, player)
+				if value is not None:
+					return 0 if value == 0 else (player if value > 0 else switch[player])
+
 			# Calculate possible moves
 			possible = env.topPosition >= 0
 			indices = []
@@ -110,13 +194,14 @@ class monteCarloAI(connect4Player):
 				return 0
 
 			# Select random legal move
-			move = random.choice(indices)
+			move = self.rng.choice(indices)
 
 			# Simulate move (using env's method for consistency)
 			row = env.topPosition[move] # Get the row where the piece will land
 			env.board[row][move] = player
 			env.topPosition[move] -= 1
 			env.history[player-1].append(move) # Add to history for win check
+			empties -= 1
 
 			# Check if the game is over after this move
 			# Need to pass the row and column of the *last* move for efficient check
@@ -140,4 +225,247 @@ class monteCarloAI(connect4Player):
 		'''
 		env.board[env.topPosition[move]][move] = player
 		env.topPosition[move] -= 1
-		env.history[player-1].append(move) # Use player-1 for history index
\ No newline at end of file
+		env.history[player-1].append(move) # Use player-1 for history index
+
+class treeNode():
+	'''
+	A position in the mctsAI tree. value and proven are from the point of view of
+	the player who moved into it: proven is 1 (won), -1 (lost), 0 (drawn) or None
+	'''
+	__slots__ = ('to_move', 'moves', 'children', 'visits', 'value', 'proven')
+
+	def __init__(self, to_move):
+		self.to_move = to_move
+		self.moves = None
+		self.children = None
+		self.visits = 0
+		self.value = 0.0
+		self.proven = None
+
+
+class tacticalCounter():
+	'''
+	Stands in for the agent in the shallow searches, so their nodes are counted
+	apart from the playouts and can be capped by what is left of the budget
+	'''
+	def __init__(self, position):
+		self.position = position
+		self.nodes = 0
+		self.limit = float('inf')
+
+	def count_node(self):
+		if self.nodes >= self.limit:
+			raise TimeoutError("Compute budget exhausted")
+		self.nodes += 1
+
+
+class mctsAI(monteCarloAI):
+	'''
+	Monte Carlo tree search (UCT) with shallow alpha-beta checks at the leaves.
+
+	Random playouts are blind to short tactics. Whenever a leaf is reached for the
+	first time, a tactical_depth ply search (alphaBetaAI's search, with its win checks
+	and forced-move pruning) looks for a forced win or loss there. A leaf it settles
+	is marked proven and never played out, and proofs move up the tree: a node is
+	won once one of its moves wins, and lost or drawn once every move is settled.
+	Proven subtrees stop taking simulations, and a proven root ends the move early.
+
+	Search nodes are charged to the budget at SIMULATION_COST per simulation
+	'''
+	def __init__(self, position, seed=0, CVDMode=False):
+		super().__init__(position, seed, CVDMode)
+		self.exploration = 1.4 # UCT exploration constant
+		self.tactical_depth = 2
+		self.time_limit = 2.8
+		self.stats = {} # simulations, search nodes and proofs of the last move
+
+	def play(self, env: connect4, move_dict: dict) -> None:
+		self.rng = self.move_stream(env)
+		self.nodes = 0
+		start_time = time.time()
+		self.endgame = self.load_endgame(env)
+		time_limit = self.time_limit if self.time_cap is None else min(self.time_limit, self.time_cap)
+
+		pos = Position.from_env(env)
+		if not pos.moves():
+			move_dict['move'] = 0
+			return
+
+		counter = tacticalCounter(self.position)
+		search = Search(counter, 'alphabeta', tactics=True, tablebase=self.endgame)
+		search.use_tablebase(pos)
+		root = treeNode(self.position)
+		self.expand(root, pos) # so there is always a move to pick, even with no budget left for a simulation
+		self.proven_nodes = 0
+		trace = self.begin_trace(env)
+
+		num_sims = self.budget if self.budget is not None else 1001
+		sims = 0
+		while (sims + 1) * SIMULATION_COST + counter.nodes <= num_sims * SIMULATION_COST and root.proven is None:
+			if sims > 0 and time.time() - start_time > time_limit:
+				break
+			if self.budget is not None:
+				# Leave this simulation's playout enough budget
+				counter.limit = (num_sims - sims - 1) * SIMULATION_COST
+			self.simulate(root, pos, search, trace)
+			sims += 1
+			self.nodes = sims + math.ceil(counter.nodes / SIMULATION_COST)
+
+		move_dict['move'] = self.final_move(root)
+		self.stats = {'simulations': sims, 'search_nodes': counter.nodes, 'proven_nodes': self.proven_nodes,
+			'proven': None if root.proven is None else -root.proven, 'time': round(time.time() - start_time, 3)}
+		if trace is not None:
+			trace.finish(move_dict['move'])
+
+	def simulate(self, root, pos, search, trace=None):
+		'''
+		One iteration: walk down by UCT, check the new leaf for tactics, play it out
+		unless it is proven, and back the result up the path (and to trace, a searchtrace.MoveTrace)
+		'''
+		if trace is not None:
+			sim_start, search_nodes = time.perf_counter(), search.agent.nodes
+		path = [root]
+		made = []
+		node = root
+		try:
+			while True:
+				if node.children is None:
+					self.expand(node, pos)
+				i = self.select(node)
+				child, col = node.children[i], node.moves[i]
+				row = pos.make(col, node.to_move)
+				made.append(col)
+				path.append(child)
+				if child.proven is not None:
+					break
+				if child.visits == 0:
+					self.check_tactics(child, pos, row, col, search)
+					break
+				node = child
+
+			leaf = path[-1]
+			if leaf.proven is not None:
+				mover = 3 - leaf.to_move
+				winner = 0 if leaf.proven == 0 else (mover if leaf.proven > 0 else leaf.to_move)
+			else:
+				winner = self.rollout(pos, leaf.to_move)
+		finally:
+			for col in reversed(made):
+				pos.unmake(col)
+
+		for node in path:
+			node.visits += 1
+			if winner:
+				node.value += 1 if winner == 3 - node.to_move else -1
+		if trace is not None:
+			result = 0 if winner == 0 else (1 if winner == self.position else -1)
+			trace.simulation(made[0], result, len(made), 0, search.agent.nodes - search_nodes, time.perf_counter() - sim_start)
+		# Settle parents whose moves are now all known
+		for node in reversed(path[:-1]):
+			if not self.settle(node):
+				break
+
+	def expand(self, node, pos):
+		'''
+		Create the children of node, central columns first. Moves that win or fill the board are proven right away
+		'''
+		node.moves = [c for c in pos.tables.column_order if pos.top[c] >= 0]
+		node.children = []
+		for col in node.moves:
+			child = treeNode(3 - node.to_move)
+			row = pos.make(col, node.to_move)
+			if pos.wins_at(row, col, node.to_move):
+				child.proven = 1
+			elif all(top < 0 for top in pos.top):
+				child.proven = 0
+			pos.unmake(col)
+			node.children.append(child)
+
+	def select(self, node):
+		'''
+		Index of the child to descend into: a proven win, else the best UCT score among
+		the moves not proven lost (unvisited ones first)
+		'''
+		log_visits = math.log(node.visits + 1)
+		best, best_score = 0, float('-inf')
+		for i, child in enumerate(node.children):
+			if child.proven == 1:
+				return i
+			if child.proven == -1:
+				continue
+			if child.visits == 0:
+				return i
+			score = child.value / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+			if score > best_score:
+				best, best_score = i, score
+		return best
+
+	def check_tactics(self, child, pos, row, col, search):
+		'''
+		Shallow alpha-beta from a new leaf (the move (row, col) was just played).
+		A forced win or loss within tactical_depth plies proves the leaf
+		'''
+		try:
+			value = search.search(pos, self.tactical_depth, float('-inf'), float('inf'), child.to_move == self.position, row, col)
+		except TimeoutError:
+			return # out of budget, a playout will have to do
+		if abs(value) == search.win_score:
+			winner = self.position if value > 0 else 3 - self.position
+			child.proven = 1 if winner == 3 - child.to_move else -1
+			self.proven_nodes += 1
+
+	def settle(self, node):
+		'''
+		Prove node from its children if possible. Returns whether it is proven
+		'''
+		if node.proven is not None:
+			return True
+		if node.children is None:
+			return False
+		results = [child.proven for child in node.children]
+		if 1 in results:
+			node.proven = -1 # the player to move here has a winning move
+		elif None not in results:
+			node.proven = -max(results)
+		else:
+			return False
+		self.proven_nodes += 1
+		return True
+
+	def rollout(self, pos, player):
+		'''
+		Random game from pos with player to move, undone afterwards. Returns the winner, 0 for a tie
+		'''
+		played = []
+		empties = sum(top + 1 for top in pos.top)
+		try:
+			while True:
+				if self.endgame is not None and empties <= self.endgame.k:
+					value = self.endgame.probe(pos.board, pos.top, player)
+					if value is not None:
+						return 0 if value == 0 else (player if value > 0 else 3 - player)
+				moves = pos.moves()
+				if not moves:
+					return 0
+				col = self.rng.choice(moves)
+				row = pos.make(col, player)
+				played.append(col)
+				empties -= 1
+				if pos.wins_at(row, col, player):
+					return player
+				player = 3 - player
+		finally:
+			for col in reversed(played):
+				pos.unmake(col)
+
+	def final_move(self, root):
+		'''
+		A proven winning move, else the most visited move not proven lost (any move when all lose)
+		'''
+		for col, child in zip(root.moves, root.children):
+			if child.proven == 1:
+				return col
+		candidates = [(col, child) for col, child in zip(root.moves, root.children) if child.proven != -1]
+		if not candidates:
+			candidates = list(zip(root.moves, root.children))
+		return max(candidates, key=lambda item: item[1].visits)[0]
@@ -0,0 +1,252 @@
+# ntuple.py
+'''
+N-tuple evaluator: a position is scored by looking up lookup tables.
+
+An n-tuple is a fixed list of cells. Its cells, read as base-3 digits (0 empty,
+1 and 2 the players), give an index into the tuple's table of 3**n weights,
+and the score of a position is the sum over all tuples. Every window of four
+and a one-cell tuple on each center square reproduce evaluate_windows exactly
+(from_heuristic); larger tuples can hold patterns the windows can't see.
+
+Scores are kept up to date on make/unmake by TuplePosition: a move only
+changes the index of the tuples through its cell, so it costs a few table
+lookups, and evaluating a leaf is reading one number. Search uses that when it
+evaluates positions one at a time, and batch() when it scores a whole frontier.
+
+Weights file layout (little endian):
+
+    magic   5s   b'C4NT\\x01'
+    rows    u8
+    cols    u8
+    tuples  u16
+    per tuple: size u8, then size x u8 flat cell indices
+    per tuple: 3**size x f32 weights, from player 1's point of view
+
+Examples:
+    python ntuple.py -out history/ntuple.c4nt
+    python ntuple.py -info history/ntuple.c4nt
+'''
+import argparse
+import os
+import struct
+import numpy as np
+import search
+from search import Position
+
+MAGIC = b'C4NT\x01'
+HEADER = struct.Struct('<5sBBH')
+
+DEFAULT_PATH = os.environ.get('C4_NTUPLE_WEIGHTS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'ntuple.c4nt'))
+
+def swapped_indices(size):
+    '''
+    For every index of a tuple of size cells, the index with players 1 and 2 swapped
+    '''
+    digits = (np.arange(3 ** size)[:, None] // 3 ** np.arange(size)) % 3
+    digits = np.where(digits == 0, 0, 3 - digits)
+    return digits @ 3 ** np.arange(size)
+
+class TuplePosition(Position):
+    '''
+    Position that keeps every tuple's index and both players' scores up to date as moves are made
+    '''
+    def __init__(self, board, top, shape, evaluator):
+        super().__init__(board, top, shape, evaluator.connect)
+        self.evaluator = evaluator
+        self.indices = [0] * len(evaluator.tuples)
+        self.scores = [0.0, 0.0]
+        self.undo = [] # (cell, player, scores before) of every make
+        for t, cells in enumerate(evaluator.tuples):
+            self.indices[t] = sum(board[cell // shape[1]][cell % shape[1]] * 3 ** i for i, cell in enumerate(cells))
+            self.scores[0] += evaluator.tables[0][t][self.indices[t]]
+            self.scores[1] += evaluator.tables[1][t][self.indices[t]]
+
+    def make(self, col, player):
+        row = super().make(col, player)
+        cell = row * self.shape[1] + col
+        self.undo.append((cell, player, self.scores[0], self.scores[1]))
+        tables1, tables2 = self.evaluator.tables
+        indices = self.indices
+        score1, score2 = self.scores
+        for t, power in self.evaluator.cell_tuples[cell]:
+            old = indices[t]
+            new = old + player * power
+            score1 += tables1[t][new] - tables1[t][old]
+            score2 += tables2[t][new] - tables2[t][old]
+            indices[t] = new
+        self.scores[0], self.scores[1] = score1, score2
+        return row
+
+    def unmake(self, col):
+        super().unmake(col)
+        cell, player, self.scores[0], self.scores[1] = self.undo.pop()
+        for t, power in self.evaluator.cell_tuples[cell]:
+            self.indices[t] -= player * power
+
+class NTupleEvaluator():
+    '''
+    Callable like evaluate_windows (board, player, shape, connect), with a batch version for the
+    frontier and incremental scoring through position() / evaluate_position().
+    The weights are for connect four
+    '''
+    connect = search.DEFAULT_CONNECT
+
+    def __init__(self, shape, tuples, weights):
+        self.shape = tuple(shape)
+        self.tuples = [list(map(int, cells)) for cells in tuples]
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights] # player 1's point of view
+        for cells, w in zip(self.tuples, self.weights):
+            if len(w) != 3 ** len(cells):
+                raise ValueError(f"A tuple of {len(cells)} cells needs {3 ** len(cells)} weights, not {len(w)}")
+        # Tables for both points of view as lists, scalar lookups on lists are the cheapest
+        self.tables = ([w.tolist() for w in self.weights],
+            [w[swapped_indices(len(cells))].tolist() for cells, w in zip(self.tuples, self.weights)])
+        # (tuple, 3**digit) of every tuple through each cell
+        self.cell_tuples = [[] for _ in range(shape[0] * shape[1])]
+        for t, cells in enumerate(self.tuples):
+            for i, cell in enumerate(cells):
+                self.cell_tuples[cell].append((t, 3 ** i))
+        # Tuples grouped by size for batch(): (tuple numbers, cells, tables of player 1, of player 2)
+        self.groups = []
+        for size in sorted(set(len(cells) for cells in self.tuples)):
+            members = [t for t, cells in enumerate(self.tuples) if len(cells) == size]
+            self.groups.append((np.array(members), np.array([self.tuples[t] for t in members], dtype=np.intp),
+                np.stack([self.weights[t] for t in members]), np.stack([self.weights[t][swapped_indices(size)] for t in members])))
+
+    @classmethod
+    def from_heuristic(cls, shape=(6,7), extra_tuples=()):
+        '''
+        The tuples and weights that score exactly like evaluate_windows (with the weights
+        search.py is using), plus extra_tuples with zero weights
+        '''
+        tuples, weights = [], []
+        table = np.array(search.window_scores(search.weights), dtype=np.float32)
+        digits = (np.arange(81)[:, None] // 3 ** np.arange(4)) % 3
+        own, opponent = (digits == 1).sum(axis=1), (digits == 2).sum(axis=1)
+        for cells in search.window_indices(tuple(shape)):
+            tuples.append(cells.tolist())
+            weights.append(table[own * 5 + opponent])
+        center_col = shape[1] // 2
+        for r in range(shape[0]):
+            tuples.append([r * shape[1] + center_col])
+            weights.append(np.array([0, search.weights['center'], 0], dtype=np.float32))
+        for cells in extra_tuples:
+            tuples.append(list(cells))
+            weights.append(np.zeros(3 ** len(cells), dtype=np.float32))
+        return cls(shape, tuples, weights)
+
+    def __call__(self, board, player, shape, connect=search.DEFAULT_CONNECT):
+        tables = self.tables[player - 1]
+        cols = shape[1]
+        score = 0.0
+        for t, cells in enumerate(self.tuples):
+            index = 0
+            for i, cell in enumerate(cells):
+                index += board[cell // cols][cell % cols] * 3 ** i
+            score += tables[t][index]
+        return score
+
+    def batch(self, boards, player, shape, connect=search.DEFAULT_CONNECT):
+        '''
+        Scores of a stack of boards (n, rows*cols) in one go
+        '''
+        scores = np.zeros(len(boards))
+        for members, cells, tables1, tables2 in self.groups:
+            indices = boards[:, cells].astype(np.intp) @ 3 ** np.arange(cells.shape[1]) # (n, tuples)
+            tables = tables1 if player == 1 else tables2
+            scores += tables[np.arange(len(members)), indices].sum(axis=1)
+        return scores
+
+    def position(self, env):
+        '''
+        Search.best_move starts from this instead of Position.from_env
+        '''
+        return TuplePosition(env.board.tolist(), [int(t) for t in env.topPosition], tuple(env.shape), self)
+
+    def evaluate_position(self, pos, player):
+        if isinstance(pos, TuplePosition) and pos.evaluator is self:
+            return pos.scores[player - 1]
+        return self(pos.board, player, pos.shape)
+
+    def save(self, path):
+        '''
+        Write the weights file and return its size in bytes
+        '''
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.shape[0], self.shape[1], len(self.tuples)))
+            for cells in self.tuples:
+                f.write(struct.pack(f'<B{len(cells)}B', len(cells), *cells))
+            for w in self.weights:
+                f.write(w.astype('<f4').tobytes())
+        os.replace(path + '.tmp', path)
+        return os.path.getsize(path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC or len(data) < HEADER.size:
+            raise ValueError(f"{path} is not an n-tuple weights file")
+        magic, rows, cols, n_tuples = HEADER.unpack_from(data, 0)
+        offset = HEADER.size
+        tuples = []
+        for _ in range(n_tuples):
+            size = data[offset]
+            tuples.append(list(data[offset + 1:offset + 1 + size]))
+            offset += 1 + size
+        weights = []
+        for cells in tuples:
+            n = 3 ** len(cells)
+            weights.append(np.frombuffer(data, dtype='<f4', count=n, offset=offset))
+            offset += 4 * n
+        if offset != len(data) or any(cell >= rows * cols for cells in tuples for cell in cells):
+            raise ValueError(f"{path} is truncated or corrupt")
+        return cls((rows, cols), tuples, weights)
+
+_loaded = {}
+
+def load(path=DEFAULT_PATH):
+    '''
+    The evaluator in the weights file at path, read once per process. None if there is
+    no file, or it can't be read (the agents then use evaluate_windows)
+    '''
+    if not path:
+        return None
+    if path not in _loaded:
+        evaluator = None
+        try:
+            if os.path.exists(path):
+                evaluator = NTupleEvaluator.load(path)
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            print(f"Could not load n-tuple weights from {path}, using evaluate_windows: {e}")
+        _loaded[path] = evaluator
+    return _loaded[path]
+
+def rectangles(shape, height, width):
+    '''
+    Every height x width block of cells, as flat cell lists
+    '''
+    return [[(r + i) * shape[1] + c + j for i in range(height) for j in range(width)]
+        for r in range(shape[0] - height + 1) for c in range(shape[1] - width + 1)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write or inspect n-tuple evaluator weights')
+    parser.add_argument('-rows', default=6, type=int)
+    parser.add_argument('-cols', default=7, type=int)
+    parser.add_argument('-rectangles', default='', type=str, help='Also add every HxW block as a tuple (zero weights), eg 2x3')
+    parser.add_argument('-out', default=DEFAULT_PATH, type=str, help='Weights file to write')
+    parser.add_argument('-info', default='', type=str, help='Only describe this weights file')
+    args = parser.parse_args()
+
+    if args.info:
+        evaluator = NTupleEvaluator.load(args.info)
+        sizes = sorted(set(len(cells) for cells in evaluator.tuples))
+        print(f"{args.info}: {evaluator.shape[0]}x{evaluator.shape[1]}, {len(evaluator.tuples)} tuples of {sizes} cells, "
+            f"{sum(len(w) for w in evaluator.weights)} weights, {os.path.getsize(args.info)} bytes")
+    else:
+        shape = (args.rows, args.cols)
+        extra = rectangles(shape, *map(int, args.rectangles.split('x'))) if args.rectangles else []
+        evaluator = NTupleEvaluator.from_heuristic(shape, extra)
+        size = evaluator.save(args.out)
+        print(f"Wrote {len(evaluator.tuples)} tuples ({sum(len(w) for w in evaluator.weights)} weights, {size} bytes) to {args.out}")
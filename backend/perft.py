@@ -0,0 +1,151 @@
+# perft.py
+'''
+Perft-style verification of the win detection code.
+
+Every position reachable within N plies of a start position is enumerated and
+counted per depth, along with the number of nodes where the move just played won
+the game (wins are terminal and are not expanded further). The walk is repeated
+once per win-check implementation so the counts and nodes/sec of each one can be
+compared, and a cross-check walk reports the positions where they disagree.
+
+Example:
+    python perft.py -depth 7
+    python perft.py -w 7 -l 9 -n 5 -depth 5
+    python perft.py -depth 5 -positions "3 3342 334455" -crosscheck True
+'''
+import argparse
+import time
+from connect4 import connect4, parse_moves, board_from_moves
+from players import connect4Player
+import search
+
+REFERENCE = 'connect4.check_win'
+
+def make_checkers(board_shape, connect=search.DEFAULT_CONNECT):
+    '''
+    Wrap every win-check implementation in the tree behind the same signature:
+    check(board, row, col, player) -> True if the piece just dropped at (row, col)
+    completed connect in a row for player
+    '''
+    env = connect4(connect4Player(1), connect4Player(2), board_shape=board_shape, connect=connect)
+    return {
+        'connect4.check_win': lambda board, row, col, player: env.check_win(board, row, col, player),
+        'search.wins_at': lambda board, row, col, player: search.wins_at(board, row, col, player, board_shape, connect),
+        'search.has_won': lambda board, row, col, player: search.has_won(board, player, board_shape, connect),
+    }
+
+def perft(board, topPosition, player, depth, check_win, counts, ply=0):
+    '''
+    Count the nodes and terminal wins at each ply below the given position.
+    counts is a list of [nodes, wins] pairs, one per ply, updated in place
+    '''
+    for col in range(board.shape[1]):
+        row = topPosition[col]
+        if row < 0:
+            continue
+        board[row][col] = player
+        topPosition[col] -= 1
+
+        counts[ply][0] += 1
+        if check_win(board, row, col, player):
+            counts[ply][1] += 1
+        elif depth > 1:
+            perft(board, topPosition, 3 - player, depth - 1, check_win, counts, ply + 1)
+
+        board[row][col] = 0
+        topPosition[col] += 1
+
+def crosscheck(board, topPosition, player, depth, checkers, moves, mismatches, limit=10):
+    '''
+    Walk the same tree as perft, asking every implementation about every node.
+    The tree is expanded according to the reference implementation.
+    Disagreements are appended to mismatches as (move string, {name: result})
+    '''
+    for col in range(board.shape[1]):
+        if len(mismatches) >= limit:
+            return
+        row = topPosition[col]
+        if row < 0:
+            continue
+        board[row][col] = player
+        topPosition[col] -= 1
+        moves.append(col)
+
+        results = {name: bool(check(board, row, col, player)) for name, check in checkers.items()}
+        if len(set(results.values())) > 1:
+            mismatches.append((','.join(str(m) for m in moves), results))
+        if not results[REFERENCE] and depth > 1:
+            crosscheck(board, topPosition, 3 - player, depth - 1, checkers, moves, mismatches, limit)
+
+        moves.pop()
+        board[row][col] = 0
+        topPosition[col] += 1
+
+def run_position(moves, depth, board_shape, checkers, force_crosscheck=False):
+    '''
+    Run perft from one position with every implementation and print a report.
+    Returns True if all implementations agreed
+    '''
+    board, topPosition = board_from_moves(moves, board_shape)
+    player = 1 if len(moves) % 2 == 0 else 2
+
+    print(f"\nPosition '{','.join(str(m) for m in moves)}' ({board_shape[0]}x{board_shape[1]}, player {player} to move), depth {depth}")
+
+    # The walk assumes no one has won yet, otherwise the full board scans see the old win everywhere
+    if moves and checkers[REFERENCE](board, topPosition[moves[-1]] + 1, moves[-1], 3 - player):
+        print("  game is already over in this position, skipping")
+        return True
+
+    reference_counts = None
+    agree = True
+    for name, check in checkers.items():
+        counts = [[0, 0] for _ in range(depth)]
+        start = time.time()
+        perft(board, topPosition, player, depth, check, counts)
+        elapsed = time.time() - start
+        total = sum(c[0] for c in counts)
+
+        if reference_counts is None:
+            reference_counts = counts
+            print(f"{'depth':>5} {'nodes':>12} {'wins':>10}")
+            for d, (nodes, wins) in enumerate(counts):
+                print(f"{d+1:>5} {nodes:>12} {wins:>10}")
+
+        status = 'ok' if counts == reference_counts else 'MISMATCH'
+        if counts != reference_counts:
+            agree = False
+        print(f"  {name:<36} {total:>12} nodes in {elapsed:7.2f}s ({total / max(elapsed, 1e-9):>10.0f} nodes/s) {status}")
+
+    if not agree or force_crosscheck:
+        mismatches = []
+        crosscheck(board, topPosition, player, depth, checkers, list(moves), mismatches)
+        for line, results in mismatches:
+            disagreeing = ', '.join(f"{name}={result}" for name, result in results.items())
+            print(f"  disagreement after '{line}': {disagreeing}")
+        if force_crosscheck and not mismatches:
+            print("  cross-check: all implementations agree on every node")
+        agree = agree and not mismatches
+
+    return agree
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perft node counts and win-check cross validation')
+    parser.add_argument('-w', default=6, type=int, help='Rows of game')
+    parser.add_argument('-l', default=7, type=int, help='Columns of game')
+    parser.add_argument('-n', default=search.DEFAULT_CONNECT, type=int, help='Pieces in a line that win')
+    parser.add_argument('-depth', default=5, type=int, help='Number of plies to enumerate from each position')
+    parser.add_argument('-positions', default='', type=str, help='Start positions as move strings separated by spaces, eg "- 3342 33". Use - (or leave empty) for the empty board')
+    parser.add_argument('-crosscheck', default='False', type=str, help='Compare every implementation at every node even if the counts agree')
+    args = parser.parse_args()
+
+    bool_dict = {'True': True, 'False': False}
+    board_shape = (args.w, args.l)
+    checkers = make_checkers(board_shape, args.n)
+
+    positions = args.positions.split() if args.positions.strip() else ['-']
+    all_agree = True
+    for position in positions:
+        moves = [] if position == '-' else parse_moves(position)
+        all_agree &= run_position(moves, args.depth, board_shape, checkers, bool_dict[args.crosscheck])
+
+    print('\nAll implementations agree' if all_agree else '\nImplementations DISAGREE, see above')
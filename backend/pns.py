@@ -0,0 +1,175 @@
+# pns.py
+'''
+Depth-first proof-number search (df-pn) for forced wins and losses.
+
+The heuristic search can't tell a position that is won by force from one that
+merely looks good. Proof-number search looks for proofs instead: it expands
+the node that is cheapest to prove or disprove, with every position scored by
+proof and disproof numbers (how many more leaves must be solved to prove /
+disprove that the attacker wins). df-pn does this depth first with thresholds,
+keeping the numbers in a transposition table keyed by a Zobrist hash.
+
+The table is bounded: once it holds max_entries positions, the half that took
+the least work to solve is dropped. Searches stop at a node limit or a deadline
+(TimeoutError), leaving what they learned in the table for the next move.
+
+alphaBetaAI runs it ahead of its main search and plays a proven result at once.
+'''
+import time
+from search import Position, DEFAULT_CONNECT
+import shapes
+
+INF = 10**9
+WIN, LOSS = 'win', 'loss'
+
+class ProofNumberSearch():
+    def __init__(self, shape=(6,7), max_entries=200000, connect=DEFAULT_CONNECT):
+        self.shape = tuple(shape)
+        self.connect = connect
+        self.max_entries = max_entries
+        # One key per cell and player, and one for "player 2 attacks", from the shape's tables
+        tables = shapes.tables(self.shape, connect)
+        self.zobrist = tables.zobrist
+        self.attacker_key = tables.side_key
+        self.table = {} # key -> [phi, delta, work]
+        self.nodes = 0
+        self.max_nodes = INF
+        self.deadline = float('inf')
+
+    def __deepcopy__(self, memo):
+        # Agents are deep-copied with every env; the copies keep sharing one table
+        return self
+
+    def hash(self, pos, attacker):
+        key = self.attacker_key if attacker == 2 else 0
+        for r in range(pos.shape[0]):
+            for c in range(pos.shape[1]):
+                if pos.board[r][c]:
+                    key ^= self.zobrist[r][c][pos.board[r][c]]
+        return key
+
+    def solve(self, env, player, max_nodes=INF, deadline=float('inf')):
+        '''
+        Try to prove that player, to move in env, wins (WIN) or loses (LOSS) by force.
+        Returns (result or None, move to play or None). Draws are never proven
+        '''
+        if tuple(env.shape) != self.shape or env.connect != self.connect:
+            raise ValueError(f"Board shape {tuple(env.shape)} connect {env.connect} doesn't match the search's {self.shape} connect {self.connect}")
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        pos = Position.from_env(env)
+        try:
+            if self.prove(pos, player, player):
+                return WIN, self.proving_move(pos, player, player)
+            if self.prove(pos, player, 3 - player):
+                return LOSS, self.most_resistant_move(pos, player, 3 - player)
+        except TimeoutError:
+            pass
+        return None, None
+
+    def prove(self, pos, to_move, attacker):
+        '''
+        Run df-pn from the root until the attacker's win is proven (True) or disproven (False)
+        '''
+        key = self.hash(pos, attacker)
+        self.mid(pos, key, to_move, attacker, INF, INF)
+        phi, delta = self.table[key][:2]
+        proven = phi == 0 if to_move == attacker else delta == 0
+        return proven
+
+    def leaf(self, pos, key, row, col, to_move, attacker):
+        '''
+        (phi, delta) of the child reached by the move at (row, col), from the table or
+        from the position itself. phi is the proof number when the attacker is to
+        move and the disproof number otherwise, delta the other one
+        '''
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry[0], entry[1]
+        if pos.wins_at(row, col, 3 - to_move):
+            return INF, 0 # the side to move has lost
+        if all(top < 0 for top in pos.top):
+            # A draw disproves the attacker's win
+            return (INF, 0) if to_move == attacker else (0, INF)
+        return 1, 1
+
+    def children(self, pos, key, to_move, attacker):
+        '''
+        (phi, delta, move, child key) of every child
+        '''
+        result = []
+        for col in pos.moves():
+            row = pos.make(col, to_move)
+            child_key = key ^ self.zobrist[row][col][to_move]
+            phi, delta = self.leaf(pos, child_key, row, col, 3 - to_move, attacker)
+            pos.unmake(col)
+            result.append((phi, delta, col, child_key))
+        return result
+
+    def mid(self, pos, key, to_move, attacker, th_phi, th_delta):
+        '''
+        Multiple iterative deepening: expand below this node until its phi reaches
+        th_phi or its delta reaches th_delta, then store it in the table
+        '''
+        if self.nodes >= self.max_nodes or time.time() > self.deadline:
+            raise TimeoutError("Proof search out of budget")
+        self.nodes += 1
+        start = self.nodes
+
+        while True:
+            children = self.children(pos, key, to_move, attacker)
+            # phi is the least delta of a child, delta the sum of the children's phi
+            phi = min(c[1] for c in children)
+            delta = min(INF, sum(c[0] for c in children))
+            if phi >= th_phi or delta >= th_delta:
+                break
+
+            children.sort(key=lambda c: c[1])
+            best_phi, best_delta, move, child_key = children[0]
+            second_delta = children[1][1] if len(children) > 1 else INF
+            child_th_phi = min(INF, th_delta + best_phi - delta)
+            child_th_delta = min(th_phi, second_delta + 1)
+
+            pos.make(move, to_move)
+            try:
+                self.mid(pos, child_key, 3 - to_move, attacker, child_th_phi, child_th_delta)
+            finally:
+                pos.unmake(move)
+
+        self.store(key, phi, delta, self.nodes - start + 1)
+
+    def store(self, key, phi, delta, work):
+        if key not in self.table and len(self.table) >= self.max_entries:
+            # Keep the half of the table that was most expensive to compute
+            kept = sorted(self.table.items(), key=lambda item: item[1][2], reverse=True)[:self.max_entries // 2]
+            self.table = dict(kept)
+        self.table[key] = [phi, delta, work]
+
+    def proving_move(self, pos, to_move, attacker):
+        '''
+        A move that keeps the proven win: a child the defender can't escape (delta 0)
+        '''
+        key = self.hash(pos, attacker)
+        for phi, delta, move, _ in self.children(pos, key, to_move, attacker):
+            if delta == 0:
+                return move
+        return None
+
+    def most_resistant_move(self, pos, to_move, attacker):
+        '''
+        In a lost position every move loses; play one that at least blocks an
+        immediate win, and among those the one whose proof took the most work
+        '''
+        key = self.hash(pos, attacker)
+        best_move, best_rank = None, None
+        for col in pos.moves():
+            row = pos.make(col, attacker)
+            blocks = pos.wins_at(row, col, attacker)
+            pos.board[row][col] = to_move
+            entry = self.table.get(key ^ self.zobrist[row][col][to_move])
+            pos.unmake(col)
+            rank = (blocks, entry[2] if entry is not None else 0)
+            if best_rank is None or rank > best_rank:
+                best_move, best_rank = col, rank
+        return best_move
@@ -0,0 +1,508 @@
+# search.py
+'''
+Game-tree search shared by minimaxAI and alphaBetaAI.
+
+The search plays moves on a private copy of the board with make/unmake (no
+deepcopy per move, history untouched) and only looks at the four lines through
+the last piece to detect a win. Any board shape and line length (connect)
+works the same way, on tables built once per shape (shapes.py). The agents
+are configurations of one Search:
+
+    pruning   'none' (plain minimax), 'alphabeta' or 'pvs' (principal variation search)
+    lmr       late move reductions, with a full-depth re-search when a reduced move
+              beats the window
+    evaluate  evaluate(board, player, shape, connect) scores a leaf for player (evaluate_windows by default).
+              An evaluator with position(env) and evaluate_position(pos, player) is
+              incremental: the search plays on its position and reads scores from it
+    ordering  try winning, blocking and central moves first
+    tactics   before expanding a node, play an immediate win, search only the block
+              when the opponent threatens one, and skip moves that let the opponent
+              win on the cell right above
+    frontier  score all children of a node just above the horizon in one batch,
+              when the evaluator has a vectorized version (evaluate.batch), or
+              straight from the position when it is incremental
+    win_score score of a won position
+    tablebase an endgame Tablebase (tablebase.py): positions it holds are scored
+              exactly without searching below them
+
+Work is charged to the agent through agent.count_node(), so node budgets hold
+exactly, and every search takes a deadline; both raise TimeoutError to unwind.
+
+The weights of evaluate_windows are loaded at import from the weights file
+tune.py writes (C4_EVAL_WEIGHTS, history/eval_weights.json by default), if
+there is one, else DEFAULT_WEIGHTS.
+'''
+import json
+import os
+import time
+import numpy as np
+import shapes
+from shapes import DEFAULT_CONNECT, wins_at, has_won
+
+PRUNING = ('none', 'alphabeta', 'pvs')
+
+# Late move reductions: from the LMR_AFTER-th move of a node with at least
+# LMR_MIN_DEPTH plies left, search LMR_REDUCTION plies shallower first
+LMR_AFTER = 3
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1
+STATS = ('lmr_reductions', 'lmr_researches', 'pvs_probes', 'pvs_researches', 'cutoffs', 'tactical_cuts', 'frontier_batches', 'tablebase_hits')
+
+# Score of a window by what is in it, and of each own piece in the center column
+WEIGHT_NAMES = ('four', 'three', 'two', 'opp_three', 'opp_two', 'center')
+DEFAULT_WEIGHTS = {
+    'four': 100,     # four own pieces
+    'three': 5,      # three own pieces and an empty cell
+    'two': 2,        # two own pieces and two empty cells
+    'opp_three': -4, # three of the opponent's and an empty cell
+    'opp_two': -1,   # two of the opponent's and two empty cells, to encourage blocking that progression
+    'center': 3,
+}
+WEIGHTS_FORMAT = 'c4-eval-weights'
+WEIGHTS_PATH = os.environ.get('C4_EVAL_WEIGHTS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'eval_weights.json'))
+
+# The window classes the weights apply to, as (own pieces, opponent pieces) in a window of
+# four. With lines of another length the counts move with it: 'three' is one short of a line
+WINDOW_CLASSES = {'four': (4, 0), 'three': (3, 0), 'two': (2, 0), 'opp_three': (0, 3), 'opp_two': (0, 2)}
+
+def window_classes(connect=DEFAULT_CONNECT):
+    '''
+    WINDOW_CLASSES for windows of connect cells. Classes that would count no pieces are left out
+    '''
+    classes = {}
+    for name, (own, opponent) in WINDOW_CLASSES.items():
+        own, opponent = max(0, own and own + connect - 4), max(0, opponent and opponent + connect - 4)
+        if own or opponent:
+            classes[name] = (own, opponent)
+    return classes
+
+def window_scores(values, connect=DEFAULT_CONNECT):
+    '''
+    evaluate_window as a table for the weights values: scores[own pieces * (connect + 1) + opponent pieces]
+    '''
+    scores = [0] * (connect + 1) ** 2
+    for name, (own, opponent) in window_classes(connect).items():
+        scores[own * (connect + 1) + opponent] = values[name]
+    return scores
+
+weights = dict(DEFAULT_WEIGHTS) # in use, see use_weights
+weights_version = 0 # version of the weights file they came from, 0 for the defaults
+WINDOW_SCORE_LIST = window_scores(weights)
+WINDOW_SCORES = np.array(WINDOW_SCORE_LIST)
+score_tables = {DEFAULT_CONNECT: (WINDOW_SCORE_LIST, WINDOW_SCORES)} # connect -> window_scores as a list and an array
+
+def window_score_table(connect=DEFAULT_CONNECT):
+    '''
+    (list, array) of the window scores for lines of connect with the weights in use
+    '''
+    table = score_tables.get(connect)
+    if table is None:
+        values = window_scores(weights, connect)
+        table = score_tables[connect] = (values, np.array(values))
+    return table
+
+def use_weights(new_weights, version=0):
+    '''
+    Make every evaluation in this process use new_weights ({name: weight}, missing names keep the defaults)
+    '''
+    global WINDOW_SCORE_LIST, WINDOW_SCORES, weights_version
+    unknown = set(new_weights) - set(WEIGHT_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown evaluation weights {sorted(unknown)}, use {WEIGHT_NAMES}")
+    weights.clear()
+    weights.update(DEFAULT_WEIGHTS, **new_weights)
+    WINDOW_SCORE_LIST = window_scores(weights)
+    WINDOW_SCORES = np.array(WINDOW_SCORE_LIST)
+    score_tables.clear()
+    score_tables[DEFAULT_CONNECT] = (WINDOW_SCORE_LIST, WINDOW_SCORES)
+    weights_version = version
+
+def load_weights(path=WEIGHTS_PATH):
+    '''
+    Use the weights in a weights file written by tune.py. Returns the file's
+    contents, or None (keeping the current weights) when there is no file
+    '''
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('format') != WEIGHTS_FORMAT:
+        raise ValueError(f"{path} is not an evaluation weights file")
+    use_weights(data['weights'], data.get('version', 0))
+    return data
+
+def evaluate_window(window, player, connect=DEFAULT_CONNECT):
+    return window_score_table(connect)[0][window.count(player) * (connect + 1) + window.count(3 - player)]
+
+def evaluate_windows(board, player, shape, connect=DEFAULT_CONNECT):
+    '''
+    Heuristic score of a position for player: pieces in the center column plus
+    every window of connect cells, horizontal, vertical and diagonal
+    '''
+    scores = window_score_table(connect)[0]
+    base = connect + 1
+
+    # Prioritize center column
+    center_col = shape[1] // 2
+    score = sum(1 for r in range(shape[0]) if board[r][center_col] == player) * weights['center']
+
+    for line in shapes.tables(shape, connect).line_cells:
+        window = [board[r][c] for r, c in line]
+        score += scores[window.count(player) * base + window.count(3 - player)]
+    return score
+
+def window_indices(shape, connect=DEFAULT_CONNECT):
+    '''
+    Flat board indices of every window of connect cells, shape (windows, connect),
+    in the same order evaluate_windows walks them
+    '''
+    return shapes.tables(shape, connect).lines
+
+def evaluate_windows_batch(boards, player, shape, connect=DEFAULT_CONNECT):
+    '''
+    evaluate_windows for a stack of boards at once: boards has shape (n, rows*cols)
+    and the result is a vector of n scores
+    '''
+    cells = boards[:, window_indices(shape, connect)] # (n, windows, connect)
+    own = (cells == player).sum(axis=2)
+    opponent = (cells == 3 - player).sum(axis=2)
+    center = (boards[:, shape[1] // 2::shape[1]] == player).sum(axis=1) * weights['center']
+    return window_score_table(connect)[1][own * (connect + 1) + opponent].sum(axis=1) + center
+
+evaluate_windows.batch = evaluate_windows_batch
+
+def window_features(boards, player, shape, connect=DEFAULT_CONNECT):
+    '''
+    What each weight is multiplied by in evaluate_windows, for a stack of boards
+    (n, rows*cols): an (n, len(WEIGHT_NAMES)) matrix, so the scores are features @ weights
+    '''
+    base = connect + 1
+    cells = boards[:, window_indices(shape, connect)]
+    classes = (cells == player).sum(axis=2) * base + (cells == 3 - player).sum(axis=2)
+    counts = np.bincount((classes + base ** 2 * np.arange(len(boards))[:, None]).ravel(), minlength=base ** 2 * len(boards)).reshape(-1, base ** 2)
+    present = window_classes(connect)
+    features = [counts[:, present[name][0] * base + present[name][1]] if name in present else np.zeros(len(boards), dtype=counts.dtype)
+        for name in WEIGHT_NAMES[:-1]]
+    features.append((boards[:, shape[1] // 2::shape[1]] == player).sum(axis=1))
+    return np.stack(features, axis=1)
+
+try:
+    load_weights()
+except (OSError, ValueError, KeyError) as e:
+    print(f"Could not load evaluation weights, using the defaults: {e}")
+
+class Position():
+    '''
+    Board as nested lists plus the next free row of every column, and the
+    shape's tables (shapes.py) for lines of connect.
+    Indexing lists is much cheaper than indexing a numpy array one cell at a time
+    '''
+    def __init__(self, board, top, shape, connect=DEFAULT_CONNECT):
+        self.board = board
+        self.top = top
+        self.shape = shape
+        self.connect = connect
+        self.tables = shapes.tables(shape, connect)
+
+    @classmethod
+    def from_env(cls, env):
+        return cls(env.board.tolist(), [int(t) for t in env.topPosition], tuple(env.shape), env.connect)
+
+    def wins_at(self, row, col, player):
+        '''
+        Check if the piece of player at (row, col) completes a line
+        '''
+        return self.tables.wins_at(self.board, row, col, player)
+
+    def moves(self):
+        return [c for c in range(self.shape[1]) if self.top[c] >= 0]
+
+    def make(self, col, player):
+        row = self.top[col]
+        self.board[row][col] = player
+        self.top[col] = row - 1
+        return row
+
+    def unmake(self, col):
+        self.top[col] += 1
+        self.board[self.top[col]][col] = 0
+
+class Search():
+    '''
+    Depth-limited search from agent.position's point of view.
+    A Search works on its own copy of the board, so when a deadline or budget
+    aborts it half way there is nothing to undo
+    '''
+    def __init__(self, agent, pruning='alphabeta', evaluate=evaluate_windows, ordering=True, win_score=1000000, frontier=True, tactics=True, lmr=False, tablebase=None, trace=None):
+        if pruning not in PRUNING:
+            raise ValueError(f"Unknown pruning {pruning!r}, use one of {PRUNING}")
+        self.agent = agent
+        self.player = agent.position
+        self.pruning = pruning
+        self.evaluate = evaluate
+        self.ordering = ordering
+        self.tactics = tactics
+        self.lmr = lmr
+        self.stats = dict.fromkeys(STATS, 0) # what each feature did, over the life of this Search
+        self.evaluate_batch = getattr(evaluate, 'batch', None) if frontier else None
+        self.evaluate_position = getattr(evaluate, 'evaluate_position', None)
+        self.make_position = getattr(evaluate, 'position', Position.from_env)
+        self.win_score = win_score
+        self.tablebase = tablebase
+        self.endgame = None # tablebase, when it matches the board being searched
+        self.deadline = float('inf')
+        if trace is not None:
+            # A searchtrace.MoveTrace: records the nodes searched. Without one the methods stay as they are
+            trace.attach(self)
+
+    def order_root(self, pos, moves):
+        '''
+        Winning moves first, then blocks of the opponent's wins, then central columns
+        '''
+        center_col = pos.shape[1] // 2
+        move_scores = []
+        for move in moves:
+            score = (pos.shape[1] - abs(center_col - move)) * 3 # More central = higher score
+            row = pos.make(move, self.player)
+            if pos.wins_at(row, move, self.player):
+                score += 10000 # Large score for winning move
+            pos.unmake(move)
+            row = pos.make(move, 3 - self.player)
+            if pos.wins_at(row, move, 3 - self.player):
+                score += 5000 # Large score for blocking move
+            pos.unmake(move)
+            move_scores.append((score, move))
+        return [move for score, move in sorted(move_scores, key=lambda x: x[0], reverse=True)]
+
+    def ordered(self, pos):
+        '''
+        Legal moves for an inner node, central columns first when ordering is on
+        '''
+        if self.ordering:
+            top = pos.top
+            return [c for c in pos.tables.column_order if top[c] >= 0]
+        return pos.moves()
+
+    def threats(self, pos, moves, player):
+        '''
+        Bitmasks over columns, for player to move: wins (playing there wins now),
+        blocks (the opponent wins there next unless player goes first) and
+        poisoned (playing there lets the opponent win on the cell above)
+        '''
+        opponent = 3 - player
+        wins = blocks = poisoned = 0
+        # Only the board matters here, so skip any incremental evaluation a Position subclass keeps
+        make, unmake = Position.make, Position.unmake
+        for col in moves:
+            row = make(pos, col, player)
+            if pos.wins_at(row, col, player):
+                wins |= 1 << col
+            elif row > 0:
+                pos.board[row - 1][col] = opponent
+                if pos.wins_at(row - 1, col, opponent):
+                    poisoned |= 1 << col
+                pos.board[row - 1][col] = 0
+            pos.board[row][col] = opponent
+            if pos.wins_at(row, col, opponent):
+                blocks |= 1 << col
+            unmake(pos, col)
+        return wins, blocks, poisoned
+
+    def prune(self, pos, moves, player):
+        '''
+        Cut moves down to the ones worth searching. Returns (moves, value), where
+        value is the agent's score when the node is already decided, else None
+        '''
+        wins, blocks, poisoned = self.threats(pos, moves, player)
+        won = self.win_score if player == self.player else -self.win_score
+        if wins:
+            return [move for move in moves if wins >> move & 1][:1], won
+        if blocks:
+            forced = [move for move in moves if blocks >> move & 1]
+            # Two threats can't both be blocked
+            return forced[:1], (-won if len(forced) > 1 else None)
+        safe = [move for move in moves if not poisoned >> move & 1]
+        return safe or moves, None
+
+    def best_move(self, env, depth, deadline=float('inf')):
+        '''
+        Search every legal move of env to depth and return (best move, its score).
+        With pruning, scores of moves other than the best are only bounds
+        '''
+        self.deadline = deadline
+        pos = self.make_position(env)
+        self.use_tablebase(pos)
+        moves = self.order_root(pos, pos.moves()) if self.ordering else pos.moves()
+        if not moves:
+            return None, 0
+        if self.tactics:
+            moves, value = self.prune(pos, moves, self.player)
+            if value is not None:
+                return moves[0], value
+        value, move = self.children(pos, moves, depth, float('-inf'), float('inf'), True)
+        return move, value
+
+    def score_moves(self, env, depth, deadline=float('inf')):
+        '''
+        Search every legal move of env to depth with a full window, so each score is
+        exact, and return {column: score}
+        '''
+        self.deadline = deadline
+        pos = self.make_position(env)
+        self.use_tablebase(pos)
+        scores = {}
+        for move in pos.moves():
+            row = pos.make(move, self.player)
+            try:
+                scores[move] = self.search(pos, depth - 1, float('-inf'), float('inf'), False, row, move)
+            finally:
+                # Aborted or not, leave the position as it was
+                pos.unmake(move)
+        return scores
+
+    def use_tablebase(self, pos):
+        tablebase = self.tablebase
+        self.endgame = tablebase if tablebase is not None and tablebase.shape == pos.shape and tablebase.connect == pos.connect else None
+
+    def search(self, pos, depth, alpha, beta, maximizing, last_row, last_col):
+        '''
+        Value of pos after the move (last_row, last_col); maximizing is True when
+        it is the agent's turn
+        '''
+        if time.time() > self.deadline:
+            raise TimeoutError("Time limit exceeded during search")
+        self.agent.count_node()
+
+        # The player who made the last move is the only one who can have just won
+        last_player = 3 - self.player if maximizing else self.player
+        if pos.wins_at(last_row, last_col, last_player):
+            return self.win_score if last_player == self.player else -self.win_score
+
+        moves = self.ordered(pos)
+        if not moves:
+            return 0 # Tie
+
+        if self.endgame is not None:
+            to_move = self.player if maximizing else 3 - self.player
+            value = self.endgame.probe(pos.board, pos.top, to_move)
+            if value is not None:
+                # Exact: no need to look any deeper
+                self.stats['tablebase_hits'] += 1
+                if value == 0:
+                    return 0
+                return self.win_score if (value > 0) == (to_move == self.player) else -self.win_score
+
+        if depth == 0:
+            if self.evaluate_position is not None:
+                return self.evaluate_position(pos, self.player)
+            return self.evaluate(pos.board, self.player, pos.shape, pos.connect)
+
+        if self.tactics:
+            pruned, value = self.prune(pos, moves, self.player if maximizing else 3 - self.player)
+            if value is not None or len(pruned) < len(moves):
+                self.stats['tactical_cuts'] += 1
+            if value is not None:
+                return value
+            moves = pruned
+
+        return self.children(pos, moves, depth, alpha, beta, maximizing)[0]
+
+    def children(self, pos, moves, depth, alpha, beta, maximizing):
+        '''
+        Search the moves of one node and return (value, best move)
+        '''
+        if depth == 1 and self.evaluate_batch is not None:
+            return self.frontier(pos, moves, maximizing)
+
+        player = self.player if maximizing else 3 - self.player
+        best_value = float('-inf') if maximizing else float('inf')
+        best_move = None
+        reduce = self.lmr and depth >= LMR_MIN_DEPTH and self.pruning != 'none'
+        for i, move in enumerate(moves):
+            row = pos.make(move, player)
+            value = None
+            if reduce and i >= LMR_AFTER:
+                # Late moves are rarely best: look at them less deeply, and only
+                # verify at full depth the ones that turn out better than expected
+                self.stats['lmr_reductions'] += 1
+                value = self.probe(pos, depth - 1 - LMR_REDUCTION, alpha, beta, maximizing, row, move)
+                if (value > alpha) if maximizing else (value < beta):
+                    self.stats['lmr_researches'] += 1
+                    value = None
+            if value is None and self.pruning == 'pvs' and i > 0:
+                # Expect the first move to stay best: prove it with a null window,
+                # and search again with the real window only when that fails
+                self.stats['pvs_probes'] += 1
+                value = self.probe(pos, depth - 1, alpha, beta, maximizing, row, move)
+                if alpha < value < beta:
+                    self.stats['pvs_researches'] += 1
+                    if maximizing:
+                        value = self.search(pos, depth - 1, value, beta, False, row, move)
+                    else:
+                        value = self.search(pos, depth - 1, alpha, value, True, row, move)
+            elif value is None:
+                value = self.search(pos, depth - 1, alpha, beta, not maximizing, row, move)
+            pos.unmake(move)
+
+            if (value > best_value) if maximizing else (value < best_value):
+                best_value = value
+                best_move = move
+            if self.pruning != 'none':
+                if maximizing:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    self.stats['cutoffs'] += 1
+                    break
+        return best_value, best_move
+
+    def probe(self, pos, depth, alpha, beta, maximizing, row, move):
+        '''
+        Null-window search of the child (row, move) of a node: only tells whether
+        it beats alpha (maximizing) or beta (minimizing)
+        '''
+        if maximizing:
+            return self.search(pos, depth, alpha, alpha + 1, False, row, move)
+        return self.search(pos, depth, beta - 1, beta, True, row, move)
+
+    def frontier(self, pos, moves, maximizing):
+        '''
+        children() for a node whose children are all leaves: every child is still
+        counted and checked for a win or a full board, but the others are evaluated
+        together in one evaluate_batch call. Returns the exact value, no bounds
+        '''
+        if time.time() > self.deadline:
+            raise TimeoutError("Time limit exceeded during search")
+        self.stats['frontier_batches'] += 1
+        player = self.player if maximizing else 3 - self.player
+        cols = pos.shape[1]
+        last_cell = sum(top + 1 for top in pos.top) == 1 # any move fills the board
+        values = [None] * len(moves)
+        leaves = [] # (index in moves, flat index of the new piece)
+        for i, move in enumerate(moves):
+            self.agent.count_node()
+            row = pos.make(move, player)
+            if pos.wins_at(row, move, player):
+                values[i] = self.win_score if player == self.player else -self.win_score
+            elif last_cell:
+                values[i] = 0 # Tie
+            elif self.evaluate_position is not None:
+                values[i] = self.evaluate_position(pos, self.player) # incremental, cheaper than a batch
+            else:
+                leaves.append((i, row * cols + move))
+            pos.unmake(move)
+
+        if leaves:
+            boards = np.repeat(np.array(pos.board, dtype=np.int8).reshape(1, -1), len(leaves), axis=0)
+            boards[np.arange(len(leaves)), [cell for _, cell in leaves]] = player
+            for (i, _), score in zip(leaves, self.evaluate_batch(boards, self.player, pos.shape, pos.connect).tolist()):
+                values[i] = score
+
+        best_value = float('-inf') if maximizing else float('inf')
+        best_move = None
+        for move, value in zip(moves, values):
+            if (value > best_value) if maximizing else (value < best_value):
+                best_value = value
+                best_move = move
+        return best_value, best_move
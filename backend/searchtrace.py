@@ -0,0 +1,409 @@
+# searchtrace.py
+'''
+Bounded tracing of what the agents searched, for offline profiling.
+
+Off by default. Set C4_TRACE to a file path (or give an agent a TraceWriter as
+agent.trace) and every move of alphaBetaAI, minimaxAI, monteCarloAI and mctsAI
+appends a trace of that move to the file:
+
+    searches     one record per iteration of iterative deepening (a root) and one
+                 per node below it: move, remaining depth, alpha / beta window,
+                 value, nodes and cutoffs in its subtree, and time spent in it.
+                 Nodes in the first C4_TRACE_PLIES plies are always kept, deeper
+                 ones with probability C4_TRACE_SAMPLE (a dropped node drops its
+                 whole subtree, its work still counts in its parent). Children
+                 scored together by Search.frontier are part of their parent
+    simulations  per column, the exact number of simulations, their mean result
+                 and time, plus a C4_TRACE_SAMPLE sample of single simulations
+                 (result, depth in the tree, playout length)
+
+A move keeps at most C4_TRACE_MAX_RECORDS node and simulation records (the
+rest are only counted) besides its roots and columns, and once the file reaches C4_TRACE_MAX_BYTES no more moves are traced.
+
+When tracing is off Search is left exactly as it is: MoveTrace.attach swaps
+the methods of one Search instance for recording wrappers, so nothing is
+checked per node unless a trace is attached. The simulation loops check for a
+trace once per simulation.
+
+File layout (little endian):
+
+    magic     5s   b'C4TR\\x01'
+    per traced move:
+        marker    2s   b'TM'
+        position  u8   player the agent plays
+        ply       u16  moves played before this one
+        move      i8   column chosen
+        nodes     u32  work of the move in the agent's units
+        records   u32
+        dropped   u32  nodes / simulations not recorded
+        seconds   f32
+        timestamp f64
+        agent     u8 length + utf-8 class name
+        records x RECORD
+
+    RECORD  kind u8 (0 root, 1 node, 2 simulation, 3 column), id u32,
+            parent u32 (0xFFFFFFFF for none), ply u8, move i8, depth i8,
+            alpha f32, beta f32, value f32 (NaN when the search was cut short),
+            nodes u32, cutoffs u32, seconds f32
+
+For roots depth is the iteration depth and move the best move; for columns
+nodes is the number of simulations and value their mean result; for single
+simulations depth is the depth of the tree walk (1 for monteCarloAI), ply the
+length of the random game (monteCarloAI only) and nodes the search nodes of
+mctsAI's tactical checks.
+
+Examples:
+    C4_TRACE=/tmp/moves.c4tr python main.py -p1 alphaBetaAI -p2 mctsAI -visualize False
+    python searchtrace.py /tmp/moves.c4tr
+    python searchtrace.py /tmp/moves.c4tr -move 3 -tree 3
+'''
+import argparse
+import math
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from streams import RandomStream
+
+MAGIC = b'C4TR\x01'
+MARKER = b'TM'
+MOVE_HEAD = struct.Struct('<2sBHbIIIfd')
+RECORD = struct.Struct('<BIIBbbfffIIf')
+NO_PARENT = 0xFFFFFFFF
+ROOT, NODE, SIMULATION, COLUMN = range(4)
+KIND_NAMES = ('root', 'node', 'simulation', 'column')
+
+class TraceWriter():
+    '''
+    The trace file, shared by every agent of the process. Moves are traced
+    separately (begin) and appended whole when they finish
+    '''
+    def __init__(self, path, sample=0.1, full_plies=2, max_records=20000, max_bytes=64 * 2**20, seed=0):
+        self.path = path
+        self.sample = sample
+        self.full_plies = full_plies
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.seed = seed
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'ab+') as f:
+            f.seek(0)
+            head = f.read(len(MAGIC))
+            if not head:
+                f.write(MAGIC)
+            elif head != MAGIC:
+                raise ValueError(f"{path} is not a search trace")
+        self.size = os.path.getsize(path)
+
+    # Copies of a game (getEnv) copy its agents, they keep writing to the same file.
+    # Another process opens the file again
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (TraceWriter, (self.path, self.sample, self.full_plies, self.max_records, self.max_bytes, self.seed))
+
+    def full(self):
+        return self.size >= self.max_bytes
+
+    def begin(self, agent, env):
+        '''
+        A MoveTrace for the agent's move in env, or None once the file is full
+        '''
+        return None if self.full() else MoveTrace(self, agent, env)
+
+    def write(self, trace, move):
+        agent = type(trace.agent).__name__.encode('utf-8')[:255]
+        data = bytearray(MOVE_HEAD.pack(MARKER, trace.agent.position, min(trace.ply, 0xFFFF), move, min(int(trace.agent.nodes), 0xFFFFFFFF),
+            len(trace.records), trace.dropped, time.perf_counter() - trace.start, time.time()))
+        data += struct.pack('<B', len(agent)) + agent
+        for record in trace.records:
+            data += RECORD.pack(*record)
+        with self.lock:
+            if self.full():
+                return
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.size += len(data)
+
+class MoveTrace():
+    '''
+    Records of one move of one agent
+    '''
+    def __init__(self, writer, agent, env):
+        self.writer = writer
+        self.agent = agent
+        self.ply = len(env.history[0]) + len(env.history[1])
+        self.records = []
+        self.stack = [] # index of the record of every node being searched, None for the ones not recorded
+        self.kept = 0 # node and simulation records, the ones max_records caps
+        self.dropped = 0
+        self.columns = {} # column -> [simulations, total result, seconds]
+        self.rng = RandomStream(writer.seed, agent.position, self.ply)
+        self.start = time.perf_counter()
+
+    def keep(self, ply):
+        '''
+        Whether to record a node (or simulation) at ply, counting the ones that aren't
+        '''
+        if (ply > self.writer.full_plies and self.rng.uniform() >= self.writer.sample) or self.kept >= self.writer.max_records:
+            self.dropped += 1
+            return False
+        self.kept += 1
+        return True
+
+    def attach(self, search):
+        '''
+        Record everything search does from now on, by wrapping its methods on the instance
+        '''
+        inner_search, inner_best_move, inner_score_moves = search.search, search.best_move, search.score_moves
+
+        def traced_search(pos, depth, alpha, beta, maximizing, last_row, last_col):
+            return self.node(search, inner_search, pos, depth, alpha, beta, maximizing, last_row, last_col)
+
+        def traced_best_move(env, depth, deadline=float('inf')):
+            return self.root(search, depth, lambda: inner_best_move(env, depth, deadline))
+
+        def traced_score_moves(env, depth, deadline=float('inf')):
+            return self.root(search, depth, lambda: inner_score_moves(env, depth, deadline))
+
+        search.search = traced_search
+        search.best_move = traced_best_move
+        search.score_moves = traced_score_moves
+
+    def root(self, search, depth, run):
+        index = len(self.records)
+        self.records.append(None)
+        self.stack.append(index)
+        nodes, cutoffs, start = search.agent.nodes, search.stats['cutoffs'], time.perf_counter()
+        move, value = -1, math.nan
+        try:
+            result = run()
+            if isinstance(result, dict): # score_moves
+                if result:
+                    move = max(result, key=result.get)
+                    value = result[move]
+            else:
+                move, value = result
+                move = -1 if move is None else move
+            return result
+        finally:
+            self.stack.pop()
+            self.records[index] = (ROOT, index, NO_PARENT, 0, move, depth, -math.inf, math.inf, value,
+                search.agent.nodes - nodes, search.stats['cutoffs'] - cutoffs, time.perf_counter() - start)
+
+    def node(self, search, inner, pos, depth, alpha, beta, maximizing, last_row, last_col):
+        stack = self.stack
+        parent = stack[-1] if stack else NO_PARENT
+        if parent is None or not self.keep(len(stack)):
+            stack.append(None)
+            try:
+                return inner(pos, depth, alpha, beta, maximizing, last_row, last_col)
+            finally:
+                stack.pop()
+
+        index = len(self.records)
+        self.records.append(None)
+        ply = len(stack)
+        stack.append(index)
+        nodes, cutoffs, start = search.agent.nodes, search.stats['cutoffs'], time.perf_counter()
+        value = math.nan
+        try:
+            value = inner(pos, depth, alpha, beta, maximizing, last_row, last_col)
+            return value
+        finally:
+            stack.pop()
+            self.records[index] = (NODE, index, parent, min(ply, 255), last_col, max(-128, min(depth, 127)), alpha, beta, value,
+                search.agent.nodes - nodes, search.stats['cutoffs'] - cutoffs, time.perf_counter() - start)
+
+    def simulation(self, move, result, depth, length, nodes, seconds):
+        '''
+        One simulation that started with move and ended with result (1 won, 0 drawn, -1 lost)
+        '''
+        column = self.columns.setdefault(move, [0, 0, 0.0])
+        column[0] += 1
+        column[1] += result
+        column[2] += seconds
+        if self.keep(self.writer.full_plies + 1):
+            index = len(self.records)
+            self.records.append((SIMULATION, index, NO_PARENT, min(length, 255), move, min(depth, 127), math.nan, math.nan, result, nodes, 0, seconds))
+
+    def finish(self, move):
+        '''
+        Write the move (the column played) to the trace file
+        '''
+        for col, (sims, total, seconds) in sorted(self.columns.items()):
+            index = len(self.records)
+            self.records.append((COLUMN, index, NO_PARENT, 0, col, 0, math.nan, math.nan, total / sims, sims, 0, seconds))
+        self.writer.write(self, -1 if move is None else int(move))
+
+_shared = None
+
+def shared():
+    '''
+    The process's TraceWriter when C4_TRACE is set, else None (tracing off)
+    '''
+    global _shared
+    path = os.environ.get('C4_TRACE')
+    if not path:
+        return None
+    if _shared is None or _shared.path != path:
+        _shared = TraceWriter(path, sample=float(os.environ.get('C4_TRACE_SAMPLE', 0.1)),
+            full_plies=int(os.environ.get('C4_TRACE_PLIES', 2)),
+            max_records=int(os.environ.get('C4_TRACE_MAX_RECORDS', 20000)),
+            max_bytes=int(os.environ.get('C4_TRACE_MAX_BYTES', 64 * 2**20)),
+            seed=int(os.environ.get('C4_TRACE_SEED', 0)))
+    return _shared
+
+class TracedMove():
+    def __init__(self, position, ply, move, nodes, dropped, seconds, timestamp, agent, records):
+        self.position = position
+        self.ply = ply
+        self.move = move
+        self.nodes = nodes
+        self.dropped = dropped
+        self.seconds = seconds
+        self.timestamp = timestamp
+        self.agent = agent
+        self.records = records # (kind, id, parent, ply, move, depth, alpha, beta, value, nodes, cutoffs, seconds)
+
+def read(path):
+    '''
+    Every TracedMove in a trace file, in order
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a search trace")
+    offset = len(MAGIC)
+    moves = []
+    while offset + MOVE_HEAD.size <= len(data):
+        marker, position, ply, move, nodes, n_records, dropped, seconds, timestamp = MOVE_HEAD.unpack_from(data, offset)
+        if marker != MARKER:
+            raise ValueError(f"Corrupt trace at byte {offset}")
+        offset += MOVE_HEAD.size
+        name_length = data[offset]
+        agent = data[offset + 1:offset + 1 + name_length].decode('utf-8')
+        offset += 1 + name_length
+        records = [RECORD.unpack_from(data, offset + i * RECORD.size) for i in range(n_records)]
+        offset += n_records * RECORD.size
+        moves.append(TracedMove(position, ply, move, nodes, dropped, seconds, timestamp, agent, records))
+    return moves
+
+def summarize(traced):
+    '''
+    Where the nodes and time of one traced move went: {'plies': {ply: totals},
+    'roots': [(depth, best move, value, nodes, seconds, {move: (value, nodes, seconds, searches)})],
+    'columns': {column: (simulations, mean, seconds)}, 'sim_depths': {depth: simulations}}.
+    Ply totals are inclusive (each node with everything below it) and self (minus its recorded children).
+    A root move searched more than once (null-window probe, then a re-search) adds up the
+    nodes and time of every search and keeps the value of the last
+    '''
+    records = traced.records
+    child_nodes = defaultdict(int)
+    child_seconds = defaultdict(float)
+    children = defaultdict(list)
+    for record in records:
+        kind, index, parent = record[:3]
+        if parent != NO_PARENT:
+            child_nodes[parent] += record[9]
+            child_seconds[parent] += record[11]
+            children[parent].append(record)
+
+    plies = {}
+    roots = []
+    columns = {}
+    sim_depths = defaultdict(int)
+    for record in records:
+        kind, index, parent, ply, move, depth, alpha, beta, value, nodes, cutoffs, seconds = record
+        if kind in (ROOT, NODE):
+            totals = plies.setdefault(ply, dict(recorded=0, nodes=0, seconds=0.0, self_nodes=0, self_seconds=0.0,
+                cutoffs=0, fail_high=0, fail_low=0, aborted=0))
+            totals['recorded'] += 1
+            totals['nodes'] += nodes
+            totals['seconds'] += seconds
+            totals['self_nodes'] += nodes - child_nodes[index]
+            totals['self_seconds'] += seconds - child_seconds[index]
+            totals['cutoffs'] += cutoffs
+            if math.isnan(value):
+                totals['aborted'] += 1
+            elif value >= beta:
+                totals['fail_high'] += 1
+            elif value <= alpha:
+                totals['fail_low'] += 1
+        if kind == ROOT:
+            moves = {}
+            for child in children[index]:
+                _, searched, spent, searches = moves.get(child[4], (None, 0, 0.0, 0))
+                moves[child[4]] = (child[8], searched + child[9], spent + child[11], searches + 1)
+            roots.append((depth, move, value, nodes, seconds, moves))
+        elif kind == COLUMN:
+            columns[move] = (nodes, value, seconds)
+        elif kind == SIMULATION:
+            sim_depths[depth] += 1
+    return {'plies': plies, 'roots': roots, 'columns': columns, 'sim_depths': dict(sim_depths)}
+
+def format_value(value):
+    if math.isnan(value):
+        return '-'
+    return f"{value:.3g}" if abs(value) < 1e4 else f"{value:.0f}"
+
+def print_summary(index, traced):
+    print(f"\nmove {index}: {traced.agent} (player {traced.position}) at ply {traced.ply} played {traced.move}, "
+        f"{traced.nodes} nodes in {traced.seconds:.3f}s, {len(traced.records)} records, {traced.dropped} dropped")
+    summary = summarize(traced)
+    if summary['plies']:
+        print(f"  {'ply':>4}{'recorded':>10}{'nodes':>11}{'self':>9}{'seconds':>10}{'self s':>9}{'cutoffs':>9}{'high':>7}{'low':>7}{'cut':>6}")
+        for ply, t in sorted(summary['plies'].items()):
+            print(f"  {ply:>4}{t['recorded']:>10}{t['nodes']:>11}{t['self_nodes']:>9}{t['seconds']:>10.4f}{t['self_seconds']:>9.4f}"
+                f"{t['cutoffs']:>9}{t['fail_high']:>7}{t['fail_low']:>7}{t['aborted']:>6}")
+    for depth, move, value, nodes, seconds, moves in summary['roots']:
+        print(f"  iteration depth {depth}: best {move} ({format_value(value)}), {nodes} nodes in {seconds:.4f}s")
+        for col, (child_value, child_nodes, child_seconds, searches) in sorted(moves.items(), key=lambda item: -item[1][1]):
+            share = child_nodes / nodes if nodes else 0
+            again = f", {searches} searches" if searches > 1 else ""
+            print(f"    move {col}: {format_value(child_value):>9} {child_nodes:>9} nodes ({share:6.1%}) {child_seconds:.4f}s{again}")
+    if summary['columns']:
+        print(f"  {'column':>7}{'simulations':>13}{'mean':>8}{'seconds':>10}")
+        for col, (sims, mean, seconds) in sorted(summary['columns'].items()):
+            print(f"  {col:>7}{sims:>13}{mean:>8.3f}{seconds:>10.4f}")
+    if summary['sim_depths']:
+        print("  sampled simulations by tree depth: " + ', '.join(f"{d}: {n}" for d, n in sorted(summary['sim_depths'].items())))
+
+def print_tree(traced, max_ply):
+    '''
+    The recorded nodes down to max_ply, indented by ply
+    '''
+    children = defaultdict(list)
+    for record in traced.records:
+        children[record[2]].append(record)
+
+    def show(record):
+        kind, index, parent, ply, move, depth, alpha, beta, value, nodes, cutoffs, seconds = record
+        if kind not in (ROOT, NODE) or ply > max_ply:
+            return
+        window = f"[{format_value(alpha)}, {format_value(beta)}]"
+        label = f"iteration {depth}, best {move}" if kind == ROOT else f"move {move} depth {depth}"
+        print(f"  {'  ' * ply}{label}: {format_value(value)} {window} {nodes} nodes {cutoffs} cutoffs {seconds * 1000:.2f}ms")
+        for child in children[index]:
+            show(child)
+
+    for record in children[NO_PARENT]:
+        show(record)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a search trace: where nodes and time went by ply and by move')
+    parser.add_argument('trace', type=str, help='Trace file written with C4_TRACE')
+    parser.add_argument('-move', default=-1, type=int, help='Only this traced move (0 is the first)')
+    parser.add_argument('-tree', default=0, type=int, help='Also print the recorded tree down to this ply')
+    args = parser.parse_args()
+
+    moves = read(args.trace)
+    print(f"{args.trace}: {len(moves)} traced moves, {os.path.getsize(args.trace)} bytes")
+    for index, traced in enumerate(moves):
+        if args.move in (-1, index):
+            print_summary(index, traced)
+            if args.tree:
+                print_tree(traced, args.tree)
@@ -0,0 +1,188 @@
+# shapes.py
+'''
+Tables that only depend on the board shape and on how many pieces in a line
+win, built once per (rows, cols, connect) and shared by everything that plays
+on that board.
+
+    lines         every line of connect cells (flat indices), horizontal, vertical
+                  and both diagonals, in the order evaluate_windows scores them
+    rays          for every cell and direction, the cells up to connect - 1 steps
+                  away on both sides: a win check walks out from the last piece
+                  and stops at the first cell that isn't the player's. Directions
+                  too short to ever hold a line through the cell are left out
+    column_order  columns from the center out, the order moves are searched in
+    zobrist       a random 64-bit key per cell and player, and side_key for the
+                  side to move, the same in every process (seeded from the shape)
+    cell_bits     the bit of every cell in the bitboard layout: rows + 1 bits a
+                  column, bottom cell lowest (tablebase keys)
+
+tables() keeps them in memory. With C4_SHAPE_CACHE set to a directory they are
+also written there the first time a shape is built and read back by later
+processes, instead of being rebuilt.
+'''
+import os
+import numpy as np
+
+DEFAULT_CONNECT = 4
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get('C4_SHAPE_CACHE')
+
+# Row and column steps of the four line directions
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1))
+
+class ShapeTables():
+    def __init__(self, rows, cols, connect, lines, rays, zobrist, side_key):
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.shape = (rows, cols)
+        self.lines = lines # (n, connect) intp
+        self.line_cells = [tuple(divmod(int(cell), cols) for cell in line) for line in lines]
+        # rays as nested tuples of (row, col): rays[row][col] = ((back, forward), ...) per direction
+        self.rays_array = rays
+        self.rays = [[self.cell_rays(rays[r, c]) for c in range(cols)] for r in range(rows)]
+        self.cell_lines = [[] for _ in range(rows * cols)]
+        for i, line in enumerate(lines):
+            for cell in line:
+                self.cell_lines[cell].append(i)
+        center_col = cols // 2
+        self.column_order = sorted(range(cols), key=lambda c: abs(c - center_col))
+        self.zobrist_array = zobrist
+        self.zobrist = [[[0, int(zobrist[r, c, 0]), int(zobrist[r, c, 1])] for c in range(cols)] for r in range(rows)]
+        self.side_key = int(side_key)
+        self.cell_bits = [[1 << (c * (rows + 1) + rows - 1 - r) for c in range(cols)] for r in range(rows)]
+
+    def cell_rays(self, directions):
+        '''
+        ((back cells, forward cells), ...) of one cell from its rows of the rays array,
+        without the directions where no line fits
+        '''
+        result = []
+        for direction in directions:
+            if (direction >= 0).sum() + 1 >= self.connect:
+                result.append(tuple(tuple(divmod(int(cell), self.cols) for cell in side if cell >= 0) for side in direction))
+        return tuple(result)
+
+    # The tables never change, so copies of a game (getEnv) share them and
+    # other processes look them up again instead of receiving them
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (tables, (self.shape, self.connect))
+
+    @classmethod
+    def build(cls, rows, cols, connect):
+        if rows < 1 or cols < 1:
+            raise ValueError(f"Board shape {(rows, cols)} needs at least one row and column")
+        if not 2 <= connect <= max(rows, cols):
+            raise ValueError(f"Can't connect {connect} on a {rows}x{cols} board")
+        n = connect
+        lines = []
+        lines += [[r*cols + c+i for i in range(n)] for r in range(rows) for c in range(cols - n + 1)]
+        lines += [[(r+i)*cols + c for i in range(n)] for c in range(cols) for r in range(rows - n + 1)]
+        lines += [[(r+i)*cols + c+i for i in range(n)] for r in range(rows - n + 1) for c in range(cols - n + 1)]
+        lines += [[(r-i)*cols + c+i for i in range(n)] for r in range(n - 1, rows) for c in range(cols - n + 1)]
+        lines = np.array(lines, dtype=np.intp).reshape(-1, n)
+
+        # (rows, cols, direction, back / forward, step), -1 past the edge
+        rays = np.full((rows, cols, len(DIRECTIONS), 2, n - 1), -1, dtype=np.intp)
+        for r in range(rows):
+            for c in range(cols):
+                for d, (dr, dc) in enumerate(DIRECTIONS):
+                    for side, sign in enumerate((-1, 1)):
+                        for step in range(1, n):
+                            rr, cc = r + sign * step * dr, c + sign * step * dc
+                            if not (0 <= rr < rows and 0 <= cc < cols):
+                                break
+                            rays[r, c, d, side, step - 1] = rr * cols + cc
+
+        rng = np.random.default_rng(np.random.SeedSequence([rows, cols, connect]))
+        keys = rng.integers(0, 2**64, size=rows * cols * 2 + 1, dtype=np.uint64)
+        return cls(rows, cols, connect, lines, rays, keys[:-1].reshape(rows, cols, 2), keys[-1])
+
+    def wins_at(self, board, row, col, player):
+        '''
+        Check if the piece of player at (row, col) is part of connect in a row
+        '''
+        connect = self.connect
+        for back, forward in self.rays[row][col]:
+            count = 1
+            for r, c in back:
+                if board[r][c] != player:
+                    break
+                count += 1
+            for r, c in forward:
+                if board[r][c] != player:
+                    break
+                count += 1
+            if count >= connect:
+                return True
+        return False
+
+    def has_won(self, board, player):
+        '''
+        Check if player has connect in a row anywhere on the board
+        '''
+        for line in self.line_cells:
+            if all(board[r][c] == player for r, c in line):
+                return True
+        return False
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=CACHE_VERSION, shape=np.array([self.rows, self.cols, self.connect]), lines=self.lines,
+                rays=self.rays_array, zobrist=self.zobrist_array, side_key=np.uint64(self.side_key))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, rows, cols, connect):
+        '''
+        The tables cached at path, or None if the file is missing or doesn't hold this shape
+        '''
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != CACHE_VERSION or data['shape'].tolist() != [rows, cols, connect]:
+                    return None
+                return cls(rows, cols, connect, data['lines'], data['rays'], data['zobrist'], data['side_key'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+def cache_path(rows, cols, connect, directory=None):
+    return os.path.join(directory or CACHE_DIR, f'{rows}x{cols}-{connect}.npz')
+
+_tables = {}
+
+def tables(shape, connect=DEFAULT_CONNECT):
+    '''
+    The ShapeTables for a board of shape (rows, cols) and lines of connect, built once per process
+    '''
+    key = (shape[0], shape[1], connect)
+    found = _tables.get(key)
+    if found is None:
+        rows, cols = int(shape[0]), int(shape[1])
+        path = cache_path(rows, cols, connect) if CACHE_DIR else None
+        found = ShapeTables.load(path, rows, cols, connect) if path and os.path.exists(path) else None
+        if found is None:
+            found = ShapeTables.build(rows, cols, connect)
+            if path:
+                try:
+                    found.save(path)
+                except OSError as e:
+                    print(f"Could not cache the {rows}x{cols} connect {connect} tables: {e}")
+        _tables[key] = found
+    return found
+
+def wins_at(board, row, col, player, shape, connect=DEFAULT_CONNECT):
+    '''
+    Check if the piece of player at (row, col) is part of connect in a row
+    '''
+    return tables(shape, connect).wins_at(board, row, col, player)
+
+def has_won(board, player, shape, connect=DEFAULT_CONNECT):
+    '''
+    Check if player has connect in a row anywhere on the board
+    '''
+    return tables(shape, connect).has_won(board, player)
@@ -0,0 +1,53 @@
+# streams.py
+'''
+Independent random number streams for agents, games and workers.
+
+Nothing draws from the global random module: every agent and every game owns a
+RandomStream seeded from (seed, key...), so games that run interleaved or in
+other processes draw exactly the numbers they would alone, and a stream can be
+split into independent children (one per worker) with spawn().
+
+Draws come from a NumPy Generator in blocks: choice() takes the next uniform of
+a block drawn in one call, which is what random playouts need, one cheap pick
+at a time from a short list of columns.
+
+Keys in use: 0 the game itself (connect4.randMove), 1 and 2 the agent in that
+position, (position, ply) one move of an agent that starts every move afresh.
+'''
+import numpy as np
+
+class RandomStream():
+    def __init__(self, seed=0, *key, block=1024):
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed, spawn_key=tuple(int(k) for k in key))
+        self.generator = np.random.default_rng(self.seed_sequence)
+        self.block = block
+        self.buffer = []
+
+    def uniform(self):
+        '''
+        Next float in [0, 1)
+        '''
+        if not self.buffer:
+            self.buffer = self.generator.random(self.block).tolist()
+        return self.buffer.pop()
+
+    def choice(self, options):
+        '''
+        A uniformly random element of a non-empty sequence
+        '''
+        return options[int(self.uniform() * len(options))]
+
+    def integers(self, high, size):
+        '''
+        size uniform integers in [0, high) in one draw
+        '''
+        return self.generator.integers(high, size=size)
+
+    def spawn(self, n):
+        '''
+        n streams independent of this one and of each other, eg one per worker
+        '''
+        return [RandomStream(child, block=self.block) for child in self.seed_sequence.spawn(n)]
@@ -0,0 +1,315 @@
+# tablebase.py
+'''
+Endgame tablebase: exact results of positions with at most K empty cells.
+
+The generator solves positions to the end of the game (win, loss or draw for
+the side to move, and how soon) and writes them to one file that the agents
+map into memory and probe at any node. A hit is exact, so the search stops
+there instead of looking further (see Search.search and monteCarloAI).
+
+Every reachable position with K empty cells is far too many to enumerate for
+any useful K on 6x7, so the table holds the complete endgames below a set of
+seed positions: the position with K empty cells of every game in the game
+logs, plus the ones reached by -random seeded random games. Each seed's whole
+subtree is solved, so once a game gets there every line the search can try is
+in the table.
+
+File layout (little endian):
+
+    magic    5s   b'C4TB\\x02'
+    rows     u8
+    cols     u8
+    connect  u8   pieces in a line that win (version 1 files have no such field, they are connect four)
+    k        u8   most empty cells of a stored position
+    bits     u8   the table has 2**bits slots
+    entries  u64  positions stored
+    slots    2**bits x u64, open addressing with linear probing
+
+A slot is 0 when empty, else key | (value & 0xFF) << 56. The key encodes the
+position exactly (no collisions): per column, one bit per filled cell plus one
+per cell of the side to move, added together (the shape's cell_bits, rows + 1
+bits a column, so it fits in 56 bits up to 6x7 and 7x6). value is the score for
+the side to move: 0 a draw, +n a win and -n a loss, where n - 1 is the number
+of empty cells left when the game ends, so bigger is sooner.
+
+Examples:
+    python tablebase.py -k 10 -random 500 -out history/endgame.c4tb
+    python tablebase.py -k 8 -logs history/games.c4log -random 0
+    python tablebase.py -info history/endgame.c4tb
+'''
+import argparse
+import mmap
+import os
+import struct
+import time
+import numpy as np
+import gamelog
+import shapes
+from search import Position, DEFAULT_CONNECT
+from streams import RandomStream
+
+MAGIC = b'C4TB\x02'
+HEADER = struct.Struct('<5sBBBBBQ')
+# Version 1 had no connect field
+MAGIC_V1 = b'C4TB\x01'
+HEADER_V1 = struct.Struct('<5sBBBBQ')
+SLOT = struct.Struct('<Q')
+KEY_BITS = 56
+KEY_MASK = (1 << KEY_BITS) - 1
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MAX_LOAD = 0.5
+
+DEFAULT_PATH = os.environ.get('C4_TABLEBASE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history', 'endgame.c4tb'))
+
+def position_key(board, top, to_move, cell_bits):
+    '''
+    Exact key of a position with to_move to play, from a board (lists or numpy), its
+    column tops and the shape's cell_bits (shapes.py)
+    '''
+    rows = len(cell_bits)
+    key = 0
+    for c in range(len(top)):
+        for r in range(rows - 1, int(top[c]), -1):
+            bit = cell_bits[r][c]
+            key += bit + bit if board[r][c] == to_move else bit
+    return key
+
+def slot_of(key, bits):
+    return ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+
+class Tablebase():
+    '''
+    A tablebase file mapped into memory. Only the pages that probes touch are read
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self.map[:len(MAGIC)]
+        if magic == MAGIC:
+            _, rows, cols, self.connect, self.k, self.bits, self.entries = HEADER.unpack_from(self.map, 0)
+            self.offset = HEADER.size
+        elif magic == MAGIC_V1:
+            _, rows, cols, self.k, self.bits, self.entries = HEADER_V1.unpack_from(self.map, 0)
+            self.connect = DEFAULT_CONNECT
+            self.offset = HEADER_V1.size
+        else:
+            self.close()
+            raise ValueError(f"{path} is not a tablebase")
+        self.shape = (rows, cols)
+        self.cell_bits = shapes.tables(self.shape, self.connect).cell_bits
+        self.slot_mask = (1 << self.bits) - 1
+        self.probes = 0
+        self.hits = 0
+
+    def __deepcopy__(self, memo):
+        # Agents holding the table are deep-copied with every env; they all keep this mapping
+        return self
+
+    def __reduce__(self):
+        return (load, (self.path,))
+
+    def probe(self, board, top, to_move):
+        '''
+        Exact score of the position for to_move (see the module docstring),
+        or None when it isn't in the table
+        '''
+        if sum(int(t) + 1 for t in top) > self.k:
+            return None
+        self.probes += 1
+        key = position_key(board, top, to_move, self.cell_bits)
+        slot = slot_of(key, self.bits)
+        while True:
+            entry = SLOT.unpack_from(self.map, self.offset + slot * SLOT.size)[0]
+            if entry == 0:
+                return None
+            if entry & KEY_MASK == key:
+                self.hits += 1
+                value = entry >> KEY_BITS
+                return value - 256 if value > 127 else value
+            slot = (slot + 1) & self.slot_mask
+
+    def best_move(self, pos, to_move):
+        '''
+        (score, move) of the best move in pos (a search.Position) by the table,
+        or None unless the table knows every move's outcome
+        '''
+        empties = sum(t + 1 for t in pos.top)
+        best = None
+        for col in pos.moves():
+            row = pos.make(col, to_move)
+            if pos.wins_at(row, col, to_move):
+                value = empties
+            elif empties == 1:
+                value = 0
+            else:
+                value = self.probe(pos.board, pos.top, 3 - to_move)
+                value = None if value is None else -value
+            pos.unmake(col)
+            if value is None:
+                return None
+            if best is None or value > best[0]:
+                best = (value, col)
+        return best
+
+    def warm(self):
+        '''
+        Read every page of the file now rather than on the first probes that touch it.
+        Returns the number of bytes paged in
+        '''
+        if hasattr(mmap, 'MADV_WILLNEED'):
+            self.map.madvise(mmap.MADV_WILLNEED)
+        for offset in range(0, len(self.map), mmap.PAGESIZE):
+            self.map[offset]
+        return len(self.map)
+
+    def size(self):
+        return len(self.map)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+_open_tables = {}
+
+def load(path=DEFAULT_PATH):
+    '''
+    The tablebase at path, opened once per process and shared by every agent.
+    None when path is None or there is no file there
+    '''
+    if not path:
+        return None
+    if path not in _open_tables:
+        _open_tables[path] = Tablebase(path) if os.path.exists(path) else None
+    return _open_tables[path]
+
+class Generator():
+    '''
+    Solves every position below the seeds down to the end of the game
+    '''
+    def __init__(self, k, shape=(6,7), connect=DEFAULT_CONNECT):
+        if (shape[0] + 1) * shape[1] > KEY_BITS:
+            raise ValueError(f"Board shape {shape} is too big for tablebase keys")
+        if k >= 128:
+            raise ValueError("k must be below 128")
+        self.k = k
+        self.shape = tuple(shape)
+        self.connect = connect
+        self.cell_bits = shapes.tables(self.shape, connect).cell_bits
+        self.table = {} # key -> score for the side to move
+
+    def add_seed(self, pos, to_move):
+        '''
+        Solve a seed position (a search.Position with at most k empty cells, game not over)
+        '''
+        empties = sum(t + 1 for t in pos.top)
+        if 0 < empties <= self.k:
+            self.solve(pos, to_move, empties)
+
+    def solve(self, pos, to_move, empties):
+        key = position_key(pos.board, pos.top, to_move, self.cell_bits)
+        value = self.table.get(key)
+        if value is not None:
+            return value
+        best = -128
+        for col in pos.moves():
+            row = pos.make(col, to_move)
+            if pos.wins_at(row, col, to_move):
+                value = empties
+            elif empties == 1:
+                value = 0
+            else:
+                value = -self.solve(pos, 3 - to_move, empties - 1)
+            pos.unmake(col)
+            best = max(best, value)
+        self.table[key] = best
+        return best
+
+    def seed_from_moves(self, moves, first_player=1):
+        '''
+        Seed with the position a move sequence reaches once k cells are left, if the game lasts that long
+        '''
+        pos = Position([[0] * self.shape[1] for _ in range(self.shape[0])], [self.shape[0] - 1] * self.shape[1], self.shape, self.connect)
+        player = first_player
+        empties = self.shape[0] * self.shape[1]
+        for col in moves:
+            if empties == self.k:
+                break
+            if not 0 <= col < self.shape[1] or pos.top[col] < 0:
+                return False
+            row = pos.make(col, player)
+            if pos.wins_at(row, col, player):
+                return False
+            empties -= 1
+            player = 3 - player
+        if empties != self.k:
+            return False
+        self.add_seed(pos, player)
+        return True
+
+    def random_moves(self, rng):
+        '''
+        A uniformly random game, as far as it goes without a win
+        '''
+        top = [self.shape[0] - 1] * self.shape[1]
+        moves = []
+        for _ in range(self.shape[0] * self.shape[1]):
+            col = rng.choice([c for c in range(self.shape[1]) if top[c] >= 0])
+            top[col] -= 1
+            moves.append(col)
+        return moves
+
+    def write(self, path):
+        '''
+        Write the table to path and return the file size in bytes
+        '''
+        bits = max(1, int(np.ceil(np.log2(max(1, len(self.table)) / MAX_LOAD))))
+        slots = np.zeros(1 << bits, dtype='<u8')
+        mask = (1 << bits) - 1
+        for key, value in self.table.items():
+            slot = slot_of(key, bits)
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = key | (value & 0xFF) << KEY_BITS
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.shape[0], self.shape[1], self.connect, self.k, bits, len(self.table)))
+            f.write(slots.tobytes())
+        # Swap the file in whole, processes that already mapped the old one keep reading it
+        os.replace(tmp, path)
+        return os.path.getsize(path)
+
+def describe(table):
+    return (f"{table.path}: {table.shape[0]}x{table.shape[1]} connect {table.connect}, k={table.k}, {table.entries} positions, "
+        f"{table.size()} bytes ({table.size() / max(1, table.entries):.1f} bytes/position, load {table.entries / (1 << table.bits):.2f})")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate or inspect an endgame tablebase')
+    parser.add_argument('-k', default=10, type=int, help='Most empty cells of a stored position')
+    parser.add_argument('-random', default=500, type=int, help='Random games to seed the table from')
+    parser.add_argument('-logs', nargs='*', default=[], help='Game logs to seed the table from')
+    parser.add_argument('-seed', default=0, type=int, help='Seed of the random games')
+    parser.add_argument('-rows', default=6, type=int)
+    parser.add_argument('-cols', default=7, type=int)
+    parser.add_argument('-connect', default=DEFAULT_CONNECT, type=int, help='Pieces in a line that win')
+    parser.add_argument('-out', default=DEFAULT_PATH, type=str, help='Tablebase file to write')
+    parser.add_argument('-info', default='', type=str, help='Only describe this tablebase file')
+    args = parser.parse_args()
+
+    if args.info:
+        print(describe(Tablebase(args.info)))
+    else:
+        start = time.time()
+        generator = Generator(args.k, (args.rows, args.cols), args.connect)
+        seeds = 0
+        for path in args.logs:
+            for record in gamelog.iter_games(path):
+                if tuple(record.board_shape) == generator.shape and record.connect == generator.connect:
+                    seeds += generator.seed_from_moves(record.moves)
+        rng = RandomStream(args.seed)
+        for _ in range(args.random):
+            seeds += generator.seed_from_moves(generator.random_moves(rng))
+        generator.write(args.out)
+        print(f"{seeds} seeds, solved in {time.time() - start:.1f}s")
+        print(describe(Tablebase(args.out)))
@@ -0,0 +1,8 @@
+# conftest.py
+'''
+The backend modules import each other by plain name (run from backend/), so put it on the path
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+# test_gamelog.py
+import math
+import os
+import pytest
+import gamelog
+from gamelog import GameRecord
+
+def make_record(moves, game=0, result=1):
+    return GameRecord(game, (6, 7), moves, result, ('alphaBetaAI', 'mctsAI'), 42, [0.5] * len(moves), 1700000000.0)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    records = [make_record([3, 3, 4, 4, 5, 5, 6]), make_record([0, 1, 2, 3, 4, 5, 6, 0], result=gamelog.RESULT_UNKNOWN)]
+    for record in records:
+        gamelog.append_game(path, record)
+    read = list(gamelog.iter_games(path))
+    assert len(read) == len(records)
+    for got, expected in zip(read, records):
+        assert got._replace(think_times=None) == expected._replace(think_times=None)
+        assert got.think_times == expected.think_times
+
+def test_nan_think_times_survive(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    gamelog.append_game(path, make_record([3, 2, 3])._replace(think_times=[]))
+    record = next(gamelog.iter_games(path))
+    assert len(record.think_times) == 3 and all(math.isnan(t) for t in record.think_times)
+
+def test_index_is_by_position_not_game_field(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    # connect4 records every game as game 0 unless told otherwise
+    moves = [[3, 3, 4], [2, 2, 1, 1], [6, 5, 4, 3, 2]]
+    for m in moves:
+        gamelog.append_game(path, make_record(m, game=0))
+    assert [gamelog.read_game(path, n).moves for n in range(3)] == moves
+    os.remove(path + '.idx')
+    assert [gamelog.read_game(path, n).moves for n in range(3)] == moves
+
+def test_append_after_truncated_record(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    gamelog.append_game(path, make_record([3, 3, 4]))
+    size = os.path.getsize(path)
+    gamelog.append_game(path, make_record([1, 2, 3, 4]))
+    # Crash half way through writing the second record and its index entry
+    with open(path, 'r+b') as f:
+        f.truncate(size + 7)
+    with open(path + '.idx', 'r+b') as f:
+        f.truncate(gamelog.INDEX_ENTRY.size + 5)
+    assert [r.moves for r in gamelog.iter_games(path)] == [[3, 3, 4]]
+
+    gamelog.append_game(path, make_record([5, 5, 5]))
+    assert [r.moves for r in gamelog.iter_games(path)] == [[3, 3, 4], [5, 5, 5]]
+    assert gamelog.read_game(path, 1).moves == [5, 5, 5]
+
+def test_append_indexes_records_whose_entry_was_lost(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    gamelog.append_game(path, make_record([3]))
+    gamelog.append_game(path, make_record([4]))
+    # The log write went through but the index entry didn't
+    with open(path + '.idx', 'r+b') as f:
+        f.truncate(gamelog.INDEX_ENTRY.size)
+    gamelog.append_game(path, make_record([5]))
+    assert [gamelog.read_game(path, n).moves for n in range(3)] == [[3], [4], [5]]
+
+def test_connect_round_trip(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    gamelog.append_game(path, make_record([3, 3, 4])._replace(board_shape=(7, 9), connect=5))
+    record = next(gamelog.iter_games(path))
+    assert (record.board_shape, record.connect) == ((7, 9), 5)
+
+def test_records_without_connect_are_connect_four(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    # A record as written before the connect field existed
+    data = gamelog.encode_record(make_record([3, 4]))[:-1]
+    data = gamelog.RECORD_HEAD.pack(gamelog.MARKER, len(data) - gamelog.RECORD_HEAD.size) + data[gamelog.RECORD_HEAD.size:]
+    with open(path, 'wb') as f:
+        f.write(gamelog.MAGIC + data)
+    record = next(gamelog.iter_games(path))
+    assert (record.moves, record.connect) == ([3, 4], 4)
+
+def test_rejects_boards_too_wide(tmp_path):
+    with pytest.raises(ValueError, match='at most 16 columns'):
+        gamelog.append_game(str(tmp_path / 'games.c4log'), make_record([3])._replace(board_shape=(6, 17)))
+
+def test_append_after_another_writer(tmp_path):
+    path = str(tmp_path / 'games.c4log')
+    gamelog.append_game(path, make_record([1]))
+    gamelog.append_game(path, make_record([2]))
+    # Another process appends in between: this one must notice and not reuse its cached tail
+    other = gamelog.encode_record(make_record([3]))
+    with open(path, 'ab') as f:
+        f.write(other)
+    gamelog.append_game(path, make_record([4]))
+    assert [gamelog.read_game(path, n).moves for n in range(4)] == [[1], [2], [3], [4]]
@@ -0,0 +1,61 @@
+# test_gamestore.py
+import sqlite3
+from gamestore import GameStore
+
+class SlowCommit():
+    '''
+    A connection that reports what load() returns while its transaction is still open
+    '''
+    def __init__(self, path, store, game_id):
+        self.conn = sqlite3.connect(path)
+        self.store = store
+        self.game_id = game_id
+        self.seen = []
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        self.seen.append(self.store.load(self.game_id))
+        return self.conn.__exit__(*exc)
+
+    def executemany(self, *args):
+        return self.conn.executemany(*args)
+
+def quiet_store(path):
+    '''
+    A store whose writer thread has already stopped, so flushes only happen when a test calls them
+    '''
+    store = GameStore(path)
+    store.stopped = True
+    store.wake.set()
+    store.writer.join()
+    return store
+
+def test_load_during_commit(tmp_path):
+    path = str(tmp_path / 'games.db')
+    store = quiet_store(path)
+    store.save('g', '3', 'alphaBetaAI', 'hard', 1.0, 2.0)
+    store.flush()
+    store.save('g', '3,4', 'alphaBetaAI', 'hard', 1.0, 3.0)
+    conn = SlowCommit(path, store, 'g')
+    store.flush(conn)
+    conn.conn.close()
+    assert conn.seen[0]['moves'] == '3,4'
+    assert store.load('g')['moves'] == '3,4'
+    assert store.inflight == {}
+    store.close()
+
+def test_failed_flush_keeps_rows(tmp_path):
+    path = str(tmp_path / 'games.db')
+    store = quiet_store(path)
+    store.save('g', '3', 'alphaBetaAI', 'hard', 1.0, 2.0)
+    conn = sqlite3.connect(':memory:') # no games table, so the commit fails
+    try:
+        store.flush(conn)
+    except sqlite3.Error:
+        pass
+    assert store.load('g')['moves'] == '3'
+    assert store.inflight == {}
+    store.close()
+    assert GameStore(path).load('g')['moves'] == '3'
@@ -0,0 +1,17 @@
+# test_pns.py
+from connect4 import connect4
+from players import connect4Player, alphaBetaAI
+
+def test_copies_share_the_table():
+    agent = alphaBetaAI(2, seed=1)
+    agent.budget = 2000
+    agent.proof_empty = 42 # prove from the opening
+    env = connect4(connect4Player(1), agent)
+    env.play_move(3)
+    agent.play(env, {})
+    assert agent.prover is not None and agent.prover.table
+
+    copy = env.getEnv()
+    assert copy.player2 is not agent
+    assert copy.player2.prover is agent.prover
+    assert copy.player2.prover.table is agent.prover.table
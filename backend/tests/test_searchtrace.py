@@ -0,0 +1,80 @@
+# test_searchtrace.py
+import math
+import searchtrace
+from connect4 import connect4
+from players import connect4Player, alphaBetaAI
+from montecarlo import monteCarloAI, mctsAI
+
+def play_traced(agent_class, path, budget, moves=(3,), **writer_options):
+    '''
+    The agent's move after moves (an odd number, so it plays second), traced to path
+    '''
+    agent = agent_class(2, seed=1)
+    agent.budget = budget
+    agent.trace = searchtrace.TraceWriter(path, **writer_options)
+    env = connect4(connect4Player(1), agent)
+    for col in moves:
+        env.play_move(col)
+    move_dict = {}
+    agent.play(env, move_dict)
+    return agent, move_dict['move']
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'moves.c4tr')
+    writer = searchtrace.TraceWriter(path, seed=3)
+    agent = connect4Player(1)
+    env = connect4(agent, connect4Player(2))
+    trace = writer.begin(agent, env)
+    trace.records.append((searchtrace.NODE, 0, searchtrace.NO_PARENT, 1, 4, 3, -2.5, 7.0, 1.5, 99, 4, 0.25))
+    trace.simulation(2, 1, 1, 20, 1, 0.125)
+    trace.simulation(2, -1, 1, 18, 1, 0.125)
+    agent.nodes = 1234
+    trace.finish(4)
+
+    [traced] = searchtrace.read(path)
+    assert (traced.agent, traced.position, traced.ply, traced.move, traced.nodes) == ('connect4Player', 1, 0, 4, 1234)
+    node = traced.records[0]
+    assert node == (searchtrace.NODE, 0, searchtrace.NO_PARENT, 1, 4, 3, -2.5, 7.0, 1.5, 99, 4, 0.25)
+    column = [r for r in traced.records if r[0] == searchtrace.COLUMN]
+    assert len(column) == 1 and column[0][4] == 2 and column[0][9] == 2 and column[0][8] == 0
+    # Appending reopens the same file
+    searchtrace.TraceWriter(path).begin(agent, env).finish(1)
+    assert [t.move for t in searchtrace.read(path)] == [4, 1]
+
+def test_root_moves_add_up_every_search(tmp_path):
+    path = str(tmp_path / 'moves.c4tr')
+    # A middle game position where PVS searches some root moves twice
+    agent, _ = play_traced(alphaBetaAI, path, 6000, moves=(3, 3, 2, 4, 3), full_plies=64, sample=1.0)
+    [traced] = searchtrace.read(path)
+    assert traced.dropped == 0
+    summary = searchtrace.summarize(traced)
+    assert summary['roots']
+    for depth, move, value, nodes, seconds, moves in summary['roots'][1:]:
+        # Every node below the root is in one of its moves' searches, PVS probes and re-searches
+        # included (depth 1 children are all scored together by Search.frontier)
+        assert sum(child[1] for child in moves.values()) == nodes
+    assert any(child[3] > 1 for root in summary['roots'] for child in root[5].values())
+
+def test_caps(tmp_path):
+    path = str(tmp_path / 'moves.c4tr')
+    play_traced(alphaBetaAI, path, 3000, max_records=50)
+    [traced] = searchtrace.read(path)
+    nodes = [r for r in traced.records if r[0] == searchtrace.NODE]
+    assert len(nodes) == 50 and traced.dropped > 0
+
+    writer = searchtrace.TraceWriter(path, max_bytes=1)
+    assert writer.full() and writer.begin(connect4Player(1), connect4(connect4Player(1), connect4Player(2))) is None
+
+def test_simulations(tmp_path):
+    for agent_class in (monteCarloAI, mctsAI):
+        path = str(tmp_path / f'{agent_class.__name__}.c4tr')
+        agent, _ = play_traced(agent_class, path, 100)
+        [traced] = searchtrace.read(path)
+        columns = searchtrace.summarize(traced)['columns']
+        simulations = agent.stats['simulations'] if agent_class is mctsAI else 100
+        assert sum(sims for sims, mean, seconds in columns.values()) == simulations
+        assert all(-1 <= mean <= 1 and not math.isnan(mean) for sims, mean, seconds in columns.values())
+
+def test_off_by_default():
+    assert searchtrace.shared() is None
+    assert alphaBetaAI(1).trace is None
@@ -0,0 +1,91 @@
+# test_tablebase.py
+import struct
+import pytest
+import tablebase
+from search import Position
+from streams import RandomStream
+from connect4 import connect4
+from montecarlo import monteCarloAI, mctsAI
+
+def empty_position(shape, connect=4):
+    return Position([[0] * shape[1] for _ in range(shape[0])], [shape[0] - 1] * shape[1], shape, connect)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'endgame.c4tb')
+    generator = tablebase.Generator(8)
+    rng = RandomStream(5)
+    seeds = sum(generator.seed_from_moves(generator.random_moves(rng)) for _ in range(20))
+    assert seeds > 0
+    generator.write(path)
+
+    table = tablebase.Tablebase(path)
+    try:
+        assert (table.shape, table.connect, table.k, table.entries) == ((6, 7), 4, 8, len(generator.table))
+        # Every solved position reads back with its score, and its key only matches itself
+        for key, value in generator.table.items():
+            slot = tablebase.slot_of(key, table.bits)
+            while True:
+                entry = tablebase.SLOT.unpack_from(table.map, table.offset + slot * tablebase.SLOT.size)[0]
+                assert entry != 0
+                if entry & tablebase.KEY_MASK == key:
+                    stored = entry >> tablebase.KEY_BITS
+                    assert (stored - 256 if stored > 127 else stored) == value
+                    break
+                slot = (slot + 1) & table.slot_mask
+    finally:
+        table.close()
+
+def test_probe_matches_solver(tmp_path):
+    path = str(tmp_path / 'small.c4tb')
+    shape = (4, 4)
+    generator = tablebase.Generator(16, shape, 3)
+    generator.add_seed(empty_position(shape, 3), 1)
+    generator.write(path)
+    table = tablebase.Tablebase(path)
+    try:
+        pos = empty_position(shape, 3)
+        assert table.probe(pos.board, pos.top, 1) == generator.table[tablebase.position_key(pos.board, pos.top, 1, generator.cell_bits)]
+        assert table.best_move(pos, 1) is not None
+    finally:
+        table.close()
+
+def test_version_1_files_are_connect_four(tmp_path):
+    path = str(tmp_path / 'old.c4tb')
+    with open(path, 'wb') as f:
+        f.write(tablebase.HEADER_V1.pack(tablebase.MAGIC_V1, 6, 7, 10, 1, 0))
+        f.write(b'\0' * 2 * tablebase.SLOT.size)
+    table = tablebase.Tablebase(path)
+    try:
+        assert (table.connect, table.k, table.offset) == (4, 10, tablebase.HEADER_V1.size)
+        pos = empty_position((6, 7))
+        assert table.probe(pos.board, pos.top, 1) is None
+    finally:
+        table.close()
+
+def test_rejects_other_files(tmp_path):
+    path = str(tmp_path / 'other.c4tb')
+    with open(path, 'wb') as f:
+        f.write(b'not a tablebase' + struct.pack('<Q', 0))
+    with pytest.raises(ValueError):
+        tablebase.Tablebase(path)
+
+def test_agents_play_on_with_a_tablebase(tmp_path):
+    # Agents keep the open table, and every turn deep-copies them with the env
+    path = str(tmp_path / 'small.c4tb')
+    shape = (4, 4)
+    generator = tablebase.Generator(16, shape, 3)
+    generator.add_seed(empty_position(shape, 3), 1)
+    generator.write(path)
+    player1, player2 = monteCarloAI(1, seed=1), mctsAI(2, seed=1)
+    for agent in (player1, player2):
+        agent.tablebase_path = path
+        agent.budget = 2000
+    env = connect4(player1, player2, board_shape=shape, connect=3)
+    try:
+        for _ in range(4):
+            env.playTurn()
+        assert len(env.history[0]) == len(env.history[1]) == 2
+        assert player1.endgame is player2.endgame is tablebase.load(path)
+        assert env.getEnv().player1.endgame is player1.endgame
+    finally:
+        tablebase._open_tables.pop(path).close()
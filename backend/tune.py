@@ -0,0 +1,201 @@
+# tune.py
+'''
+Tune the evaluation weights (search.WEIGHT_NAMES) on labeled positions.
+
+Positions come from stored games (game logs or old text history directories)
+and/or from self-play games run in a process pool, each worker with its own
+random stream (the first -random_plies moves of every game are random so the
+games don't all repeat). Every position of a finished game is labeled with the
+result, 1 win, 0.5 draw, 0 loss, once from each player's point of view.
+
+The fit is Texel's method: the evaluation is read as a win probability,
+sigmoid(scale * score), and the weights are chosen to minimize the mean squared
+error to the labels. scale is fitted first with the current weights and then
+held, so the new weights stay in the same units. The evaluation is linear in
+the weights (search.window_features), so the whole data set is scored with one
+matrix product per step.
+
+The result goes to a versioned weights file (each write bumps the version)
+that search.py loads at import.
+
+Examples:
+    python tune.py -selfplay 200 -workers 4 -nodes 1000
+    python tune.py -inputs history/games.c4log -selfplay 0
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import search
+from analyze import iter_sources
+from connect4 import connect4
+from gamelog import RESULT_UNKNOWN
+from players import alphaBetaAI
+from streams import RandomStream
+
+def game_positions(moves, result, board_shape=(6,7)):
+    '''
+    Boards (n, rows*cols) of every position of a game before its last move, player 1 first,
+    and player 1's label for the result
+    '''
+    rows, cols = board_shape
+    board = np.zeros(rows * cols, dtype=np.int8)
+    top = [rows - 1] * cols
+    boards = []
+    for ply, col in enumerate(moves[:-1]):
+        board[top[col] * cols + col] = 1 + ply % 2
+        top[col] -= 1
+        boards.append(board.copy())
+    label = {0: 0.5, 1: 1.0, 2: 0.0}[result]
+    return boards, label
+
+def selfplay_games(job):
+    '''
+    Pool worker: play n_games of alphaBetaAI against itself with a node budget per move.
+    Returns [(moves, result)]
+    '''
+    seed_sequence, n_games, nodes, random_plies, board_shape = job
+    rng = RandomStream(seed_sequence)
+    games = []
+    for _ in range(n_games):
+        players = [alphaBetaAI(1), alphaBetaAI(2)]
+        for player in players:
+            player.budget = nodes
+            player.tablebase_path = None
+        env = connect4(players[0], players[1], board_shape=board_shape)
+        moves, result = [], 0
+        for ply in range(board_shape[0] * board_shape[1]):
+            mover = env.turnPlayer
+            if ply < random_plies:
+                col = rng.choice(env.get_valid_moves())
+            else:
+                move_dict = {'move': env.get_valid_moves()[0]}
+                mover.play(env, move_dict)
+                col = int(move_dict['move'])
+            env.play_move(col)
+            moves.append(col)
+            if env.gameOver(col, mover.position):
+                result = mover.position if env.is_winner else 0
+                break
+        games.append((moves, result))
+    return games
+
+def selfplay(n_games, workers, nodes, random_plies, seed, board_shape=(6,7)):
+    '''
+    n_games self-play games split over workers, each with a stream spawned from seed
+    '''
+    workers = max(1, min(workers, n_games))
+    streams = RandomStream(seed).seed_sequence.spawn(workers)
+    jobs = [(streams[i], n_games // workers + (i < n_games % workers), nodes, random_plies, board_shape) for i in range(workers)]
+    if workers == 1:
+        return selfplay_games(jobs[0])
+    with multiprocessing.Pool(workers) as pool:
+        return [game for games in pool.map(selfplay_games, jobs) for game in games]
+
+def samples(games, board_shape=(6,7)):
+    '''
+    (features, labels) of every position of the games, from both players' points of view
+    '''
+    boards, labels = [], []
+    for moves, result in games:
+        if result == RESULT_UNKNOWN or len(moves) < 2:
+            continue
+        game_boards, label = game_positions(moves, result, board_shape)
+        boards += game_boards
+        labels += [label] * len(game_boards)
+    boards = np.array(boards).reshape(-1, board_shape[0] * board_shape[1])
+    labels = np.array(labels)
+    features = np.concatenate([search.window_features(boards, 1, board_shape), search.window_features(boards, 2, board_shape)])
+    return features.astype(np.float64), np.concatenate([labels, 1 - labels])
+
+def texel_loss(features, labels, weights, scale):
+    return float(np.mean((labels - 1 / (1 + np.exp(-scale * (features @ weights)))) ** 2))
+
+def fit_scale(features, labels, weights):
+    '''
+    The scale that best turns the current evaluation into win probabilities (log-spaced search, then refined)
+    '''
+    candidates = np.logspace(-4, 0, 41)
+    best = min(candidates, key=lambda s: texel_loss(features, labels, weights, s))
+    for s in np.linspace(best / 1.3, best * 1.3, 21):
+        if texel_loss(features, labels, weights, s) < texel_loss(features, labels, weights, best):
+            best = s
+    return float(best)
+
+def fit(features, labels, weights, scale, iterations=2000, learning_rate=0.05):
+    '''
+    Minimize the Texel loss over the weights with full-batch Adam. Weights whose
+    feature never occurs in the data keep their value
+    '''
+    weights = weights.astype(np.float64).copy()
+    active = features.std(axis=0) > 0
+    m = np.zeros_like(weights)
+    v = np.zeros_like(weights)
+    for step in range(1, iterations + 1):
+        p = 1 / (1 + np.exp(-scale * (features @ weights)))
+        gradient = features.T @ (-2 * (labels - p) * p * (1 - p) * scale) / len(labels)
+        gradient[~active] = 0
+        m = 0.9 * m + 0.1 * gradient
+        v = 0.999 * v + 0.001 * gradient ** 2
+        weights -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-12)
+    return weights
+
+def write_weights(path, weights, info):
+    '''
+    Write a weights file one version above the one already at path. Returns the version
+    '''
+    version = 1
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                version = json.load(f).get('version', 0) + 1
+        except ValueError:
+            pass
+    data = dict(format=search.WEIGHTS_FORMAT, version=version, created=time.time(), weights=weights, **info)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return version
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the evaluation weights to game results')
+    parser.add_argument('-inputs', nargs='*', default=[], help='Game logs and/or old text history directories to learn from')
+    parser.add_argument('-selfplay', default=100, type=int, help='Self-play games to generate')
+    parser.add_argument('-workers', default=os.cpu_count() or 1, type=int, help='Self-play worker processes')
+    parser.add_argument('-nodes', default=1000, type=int, help='Search nodes per self-play move')
+    parser.add_argument('-random_plies', default=4, type=int, help='Random opening moves of every self-play game')
+    parser.add_argument('-seed', default=0, type=int)
+    parser.add_argument('-iterations', default=2000, type=int, help='Optimizer steps')
+    parser.add_argument('-rows', default=6, type=int)
+    parser.add_argument('-cols', default=7, type=int)
+    parser.add_argument('-out', default=search.WEIGHTS_PATH, type=str, help='Weights file to write')
+    args = parser.parse_args()
+
+    board_shape = (args.rows, args.cols)
+    start = time.time()
+    games = [(list(record.moves), record.result) for record in iter_sources(args.inputs, board_shape)
+        if tuple(record.board_shape) == board_shape and record.connect == search.DEFAULT_CONNECT]
+    stored = len(games)
+    if args.selfplay:
+        games += selfplay(args.selfplay, args.workers, args.nodes, args.random_plies, args.seed, board_shape)
+    features, labels = samples(games, board_shape)
+    print(f"{len(labels)} positions from {stored} stored and {len(games) - stored} self-play games in {time.time() - start:.1f}s")
+    if not len(labels):
+        raise SystemExit("No positions to fit")
+
+    current = np.array([search.weights[name] for name in search.WEIGHT_NAMES], dtype=np.float64)
+    scale = fit_scale(features, labels, current)
+    before = texel_loss(features, labels, current, scale)
+    tuned = fit(features, labels, current, scale, args.iterations)
+    after = texel_loss(features, labels, tuned, scale)
+    print(f"scale {scale:.5f}, loss {before:.5f} -> {after:.5f}")
+    for name, old, new in zip(search.WEIGHT_NAMES, current, tuned):
+        print(f"  {name:<10}{old:>9.2f}{new:>9.2f}")
+
+    tuned_weights = {name: round(float(w), 2) for name, w in zip(search.WEIGHT_NAMES, tuned)}
+    version = write_weights(args.out, tuned_weights, {'scale': scale, 'loss': after, 'loss_before': before,
+        'positions': int(len(labels)), 'games': len(games), 'inputs': args.inputs, 'selfplay': args.selfplay, 'seed': args.seed})
+    print(f"Wrote version {version} to {args.out}")
@@ -0,0 +1,96 @@
+# warmup.py
+'''
+Background warm-up of a freshly started server.
+
+A new process has cold caches: the tablebase pages aren't in memory yet, the
+analysis workers haven't been forked, and every opening move is searched from
+scratch by the first players to get there. Warmup runs a list of steps on a
+daemon thread right after startup so that work is done before real traffic
+arrives, and keeps count of how far it got for the /ready endpoint (load
+balancers hold traffic back until it answers 200).
+
+A step is (name, units, function); the function is called with an advance()
+callback and calls it once per unit of work done. A step that raises is
+recorded in errors and the warm-up goes on with the next one: a server that
+couldn't warm something is slower, not broken.
+'''
+import threading
+import time
+import traceback
+
+class Warmup():
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.total = sum(units for _, units, _ in self.steps)
+        self.done = 0
+        self.state = 'cold' # cold, warming, ready, or disabled
+        self.step = None
+        self.started = None
+        self.finished = None
+        self.errors = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        '''
+        Run the steps on a background thread
+        '''
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.state = 'warming'
+            self.started = time.time()
+            self.thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self.thread.start()
+
+    def skip(self):
+        '''
+        Warm-up turned off: the server is ready straight away
+        '''
+        with self.lock:
+            self.state = 'disabled'
+
+    def advance(self, units=1):
+        with self.lock:
+            self.done += units
+
+    def run(self):
+        for name, units, function in self.steps:
+            with self.lock:
+                self.step = name
+                expected = self.done + units
+            try:
+                function(self.advance)
+            except Exception as e:
+                traceback.print_exc()
+                with self.lock:
+                    self.errors.append({'step': name, 'error': str(e)})
+            with self.lock:
+                # Steps that failed or did less than announced still count as done
+                self.done = max(self.done, expected)
+        with self.lock:
+            self.state = 'ready'
+            self.step = None
+            self.finished = time.time()
+
+    def ready(self):
+        return self.state in ('ready', 'disabled')
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.ready()
+
+    def status(self):
+        with self.lock:
+            end = self.finished if self.finished is not None else time.time()
+            return {
+                'ready': self.state in ('ready', 'disabled'),
+                'state': self.state,
+                'step': self.step,
+                'done': self.done,
+                'total': self.total,
+                'progress': round(self.done / self.total, 3) if self.total else 1.0,
+                'elapsed': round(end - self.started, 2) if self.started is not None else 0.0,
+                'errors': list(self.errors),
+            }
@@ -1,8 +1,12 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 
 const ROWS = 6;
 const COLS = 7;
 
+// Return a copy of the board with one piece added (moves arrive as deltas, not full boards)
+const dropPiece = (board, row, col, player) =>
+  board.map((cells, r) => (r === row ? cells.map((cell, c) => (c === col ? player : cell)) : cells));
+
 export default function Connect4Board() {
   const [board, setBoard] = useState(Array(ROWS).fill(null).map(() => Array(COLS).fill(0)));
   const [playerTurn, setPlayerTurn] = useState(true);
@@ -16,6 +20,53 @@ export default function Connect4Board() {
   const [selectedOpponent, setSelectedOpponent] = useState("alphaBetaAI");
   const [currentOpponent, setCurrentOpponent] = useState("alphaBetaAI");
   const [isHumanVsHuman, setIsHumanVsHuman] = useState(false);
+  const [pushConnected, setPushConnected] = useState(false); // is the /events stream open?
+  const [awaitingPush, setAwaitingPush] = useState(false); // AI reply will arrive on /events
+  const aiNameRef = useRef('AI');
+  // Moves applied so far, by the server's count (ply). The /move response and the pushed AI reply
+  // can arrive in either order, so whichever is older than what is already shown must not undo it
+  const plyRef = useRef(0);
+
+  useEffect(() => {
+    aiNameRef.current = opponents[currentOpponent]?.split(' ')[0] || 'AI';
+  }, [opponents, currentOpponent]);
+
+  // Server push channel: AI replies arrive here instead of through a separate /ai-move request
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return;
+    const events = new EventSource('http://localhost:5001/events');
+    events.onopen = () => setPushConnected(true);
+    events.onerror = () => {
+      // EventSource reconnects by itself; until then fall back to polling /ai-move
+      setPushConnected(false);
+      setAwaitingPush(false);
+    };
+    events.addEventListener('move', (e) => {
+      const data = JSON.parse(e.data);
+      if (data.source !== 'ai') return; // our own moves are applied from the /move response
+      if (data.ply <= plyRef.current) return; // already applied from the /ai-move response
+      plyRef.current = data.ply;
+      setAwaitingPush(false);
+      setBoard(prev => dropPiece(prev, data.row, data.column, data.player));
+      if (data.game_over) {
+        setGameOver(true);
+        setWinner(data.winner);
+        setWinningLine(data.winning_line);
+        if (data.winner === 2) setMessage(`${aiNameRef.current} Wins! 🤖`);
+        else setMessage("It's a Tie! 🤝");
+      } else {
+        setCurrentPlayer(data.current_player);
+        setPlayerTurn(true);
+        setMessage("It's your turn!");
+      }
+    });
+    events.addEventListener('error', (e) => {
+      if (!e.data) return; // connection errors are handled by onerror
+      // The pushed AI turn failed, let the /ai-move fallback retry it
+      setAwaitingPush(false);
+    });
+    return () => events.close();
+  }, []);
 
   // Load available opponents when component mounts
   useEffect(() => {
@@ -81,6 +132,8 @@ export default function Connect4Board() {
       setWinner(null);
       setWinningLine(null);
       setGameStarted(false);
+      setAwaitingPush(false);
+      plyRef.current = 0;
       setIsHumanVsHuman(data.is_human_vs_human || false);
       
       if (data.is_human_vs_human) {
@@ -98,6 +151,8 @@ export default function Connect4Board() {
       setWinner(null);
       setWinningLine(null);
       setGameStarted(false);
+      setAwaitingPush(false);
+      plyRef.current = 0;
       setMessage("Game reset! (Backend may need manual restart)");
     }
   };
@@ -133,10 +188,11 @@ export default function Connect4Board() {
 
     try {
       console.log("Sending move to backend:", col);
+      const aiReply = pushConnected && !isHumanVsHuman;
       const res = await fetch('http://localhost:5001/move', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ column: col })
+        body: JSON.stringify({ column: col, ai_reply: aiReply, compact: true })
       });
 
       console.log("Response status:", res.status);
@@ -158,8 +214,15 @@ export default function Connect4Board() {
         return;
       }
 
-      setBoard(data.board);
+      const mover = data.game_over ? data.current_player : data.move_made_by;
+      // A fast AI reply can be pushed before this response gets here: add our piece,
+      // but leave the turn state the reply already moved on
+      const stale = data.ply < plyRef.current;
+      plyRef.current = Math.max(plyRef.current, data.ply);
+      setBoard(prev => (!stale && data.board) || dropPiece(prev, data.row, data.column, mover));
+      if (stale) return;
       setCurrentPlayer(data.current_player);
+      if (data.ai_reply === 'pending') setAwaitingPush(true);
 
       if (data.game_over) {
         setGameOver(true);
@@ -198,8 +261,9 @@ export default function Connect4Board() {
   };
 
   useEffect(() => {
-    // Only fetch AI move if it's AI's turn and game is not over and NOT human vs human
-    if (!playerTurn && !gameOver && !isHumanVsHuman) {
+    // Only fetch AI move if it's AI's turn and game is not over and NOT human vs human,
+    // and the reply isn't already coming over the push channel
+    if (!playerTurn && !gameOver && !isHumanVsHuman && !awaitingPush) {
       const getAIMove = async () => {
         try {
           const res = await fetch('http://localhost:5001/ai-move');
@@ -215,6 +279,8 @@ export default function Connect4Board() {
             return;
           }
           
+          if (data.ply <= plyRef.current) return; // the pushed reply got here first
+          plyRef.current = data.ply;
           setBoard(data.board);
           setCurrentPlayer(data.current_player);
 
@@ -237,7 +303,7 @@ export default function Connect4Board() {
       const aiThinkingTimer = setTimeout(getAIMove, 500);
       return () => clearTimeout(aiThinkingTimer);
     }
-  }, [playerTurn, gameOver, isHumanVsHuman]);
+  }, [playerTurn, gameOver, isHumanVsHuman, awaitingPush]);
 
   // Function to check if a cell is part of the winning line
   const isWinningCell = (row, col) => {